@@ -0,0 +1,172 @@
+"""
+Cache dei barcode EAN13 renderizzati (SVG per la griglia HTML, PNG per Excel)
+
+Due livelli, indirizzati per contenuto: chiave = hash di (formato, EAN a 12
+cifre, opzioni di rendering).
+- LRU in processo (settings.BARCODE_CACHE_SIZE voci, default 5000)
+- file su disco condivisi fra processi e riavvii (settings.BARCODE_CACHE_DIR,
+  default runtime/barcode_cache fuori dal codice, non toccata dal deploy), per i formati registrati
+  con persist=True (il PNG; l'SVG nativo costa meno di una lettura da disco)
+Gli stessi EAN compaiono a ogni refresh della griglia e in ogni export: dopo
+il primo rendering (o il pre-riscaldamento con manage.py prewarm_barcodes)
+il barcode è solo letto.
+Il pre-riscaldamento renderizza i barcode mancanti in un pool di processi
+(settings.BARCODE_RENDER_WORKERS); nelle richieste web il rendering resta nel
+processo: con spawn (Windows) ogni worker reimporterebbe run_server.py e
+ricreerebbe l'applicazione WSGI a ogni export.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Sotto questa soglia di barcode da renderizzare l'avvio del pool costa più del rendering
+BARCODE_PARALLEL_MIN = 200
+
+
+def barcode_cache_dir():
+    root = getattr(settings, 'BARCODE_CACHE_DIR', None) or os.path.join(settings.BASE_DIR, 'runtime', 'barcode_cache')
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def barcode_key(fmt, ean_12, options):
+    """Chiave di contenuto: stessi formato, EAN e opzioni = stesso file."""
+    payload = json.dumps([fmt, ean_12, options], sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _disk_path(key, fmt):
+    return os.path.join(barcode_cache_dir(), key[:2], f'{key}.{fmt}')
+
+
+def _read_disk(path):
+    try:
+        with open(path, 'rb') as fp:
+            return fp.read()
+    except OSError:
+        return None
+
+
+def _write_disk(path, data):
+    """Scrittura atomica (file temporaneo + replace): lettori concorrenti non vedono file parziali."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# Renderer registrati per formato: fmt -> (funzione(ean_12, options) -> bytes, persist)
+_renderers = {}
+
+
+def register_renderer(fmt, render, persist=True):
+    """
+    Registra il renderer di un formato; persist=False lo tiene solo nella LRU
+
+    Per il rendering parallelo di get_barcodes il renderer deve essere una
+    funzione di modulo (serializzabile verso i processi worker).
+    """
+    _renderers[fmt] = (render, persist)
+
+
+@lru_cache(maxsize=getattr(settings, 'BARCODE_CACHE_SIZE', 5000))
+def _cached(fmt, ean_12, options_json):
+    options = json.loads(options_json)
+    render, persist = _renderers[fmt]
+    if not persist:
+        return render(ean_12, options)
+    key = barcode_key(fmt, ean_12, options)
+    path = _disk_path(key, fmt)
+    data = _read_disk(path)
+    if data is None:
+        # Le eccezioni del renderer non vengono messe in cache
+        data = render(ean_12, options)
+        _write_disk(path, data)
+    return data
+
+
+def get_barcode(fmt, ean_12, options):
+    """
+    Barcode `fmt` ('svg' o 'png') per l'EAN a 12 cifre, dalla cache o renderizzato
+
+    Returns:
+        bytes: contenuto del file
+    """
+    return _cached(fmt, str(ean_12), json.dumps(options, sort_keys=True))
+
+
+def render_workers():
+    """Processi per il rendering parallelo (settings.BARCODE_RENDER_WORKERS, default min(4, CPU))."""
+    workers = getattr(settings, 'BARCODE_RENDER_WORKERS', None)
+    if workers is None:
+        workers = min(4, os.cpu_count() or 1)
+    return max(1, workers)
+
+
+def get_barcodes(fmt, ean_12s, options, workers=1):
+    """
+    Barcode `fmt` per più EAN, letti dalla cache dove presenti
+
+    I barcode mancanti (formati persistenti) sono renderizzati nel processo
+    corrente; con workers > 1 (solo fuori dalle richieste web, vedi
+    prewarm_barcodes) in un pool di processi se sono almeno
+    BARCODE_PARALLEL_MIN. In entrambi i casi finiscono su disco.
+
+    Returns:
+        dict: ean_12 -> bytes, o None se il barcode non è renderizzabile
+    """
+    render, persist = _renderers[fmt]
+    options_json = json.dumps(options, sort_keys=True)
+    result = {}
+    missing = []
+    for ean_12 in dict.fromkeys(str(e) for e in ean_12s):
+        if persist and not os.path.exists(_disk_path(barcode_key(fmt, ean_12, options), fmt)):
+            missing.append(ean_12)
+            continue
+        try:
+            result[ean_12] = _cached(fmt, ean_12, options_json)
+        except Exception:
+            result[ean_12] = None
+
+    workers = min(workers, len(missing))
+    if workers > 1 and len(missing) >= BARCODE_PARALLEL_MIN:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {ean_12: pool.submit(render, ean_12, options) for ean_12 in missing}
+            for ean_12, future in futures.items():
+                try:
+                    data = future.result()
+                except Exception as e:
+                    logger.warning("Barcode %s %s non generato: %s", fmt, ean_12, e)
+                    result[ean_12] = None
+                    continue
+                _write_disk(_disk_path(barcode_key(fmt, ean_12, options), fmt), data)
+                result[ean_12] = data
+    else:
+        for ean_12 in missing:
+            try:
+                result[ean_12] = _cached(fmt, ean_12, options_json)
+            except Exception as e:
+                logger.warning("Barcode %s %s non generato: %s", fmt, ean_12, e)
+                result[ean_12] = None
+    return result
+
+
+def clear_barcode_cache(disk=False):
+    """Svuota la LRU del processo e, con disk=True, i file su disco."""
+    _cached.cache_clear()
+    if disk:
+        shutil.rmtree(barcode_cache_dir(), ignore_errors=True)
@@ -1,12 +1,36 @@
 """
 Utility per generazione barcode EAN13
 Supporta output SVG (inline HTML) e PNG (per Excel export)
+L'SVG è prodotto dall'encoder nativo di ean13, il PNG da python-barcode;
+i rendering passano dalla cache di barcode_cache (LRU in processo, più disco per il PNG)
 """
-import barcode
-from barcode.writer import SVGWriter, ImageWriter
 from io import BytesIO
 import base64
 
+from .barcode_cache import get_barcode, get_barcodes, register_renderer, render_workers
+from .ean13 import ean13_checksum, ean13_png, ean13_svg
+
+
+# Opzioni di rendering (fanno parte della chiave di cache)
+SVG_OPTIONS = {
+    'module_width': 0.2,
+    'module_height': 10.0,
+    'quiet_zone': 2.0,
+    'font_size': 8,
+    'text_distance': 5.0,  # era 2.0, aumentato per staccare i numeri
+}
+
+PNG_OPTIONS = {
+    'module_width': 0.4,      # più largo
+    'module_height': 15.0,    # più alto
+    'quiet_zone': 2.0,
+    'write_text': False,      # NIENTE NUMERI
+}
+
+
+register_renderer('svg', lambda ean_12, options: ean13_svg(ean_12, **options).encode('ascii'), persist=False)
+register_renderer('png', ean13_png)
+
 
 def generate_ean13_svg(ean_code, add_checksum=True):
     """
@@ -25,22 +49,7 @@ def generate_ean13_svg(ean_code, add_checksum=True):
     try:
         # Prendi i primi 12 caratteri
         ean_12 = str(ean_code)[:12]
-        
-        # Genera il barcode EAN13
-        ean = barcode.get('ean13', ean_12, writer=SVGWriter())
-        
-        # Genera SVG in memoria
-        buffer = BytesIO()
-        ean.write(buffer, options={
-            'module_width': 0.2,
-            'module_height': 10.0,
-            'quiet_zone': 2.0,
-            'font_size': 8,
-            'text_distance': 5.0,  # era 2.0, aumentato per staccare i numeri
-        })
-        
-        svg_content = buffer.getvalue().decode('utf-8')
-        return svg_content
+        return get_barcode('svg', ean_12, SVG_OPTIONS).decode('utf-8')
     except Exception as e:
         print(f"Errore generazione barcode per {ean_code}: {e}")
         return None
@@ -55,23 +64,51 @@ def generate_ean13_png(ean_code, add_checksum=True):
     
     try:
         ean_12 = str(ean_code)[:12]
-        ean = barcode.get('ean13', ean_12, writer=ImageWriter())
-        
-        buffer = BytesIO()
-        ean.write(buffer, options={
-            'module_width': 0.4,      # più largo
-            'module_height': 15.0,    # più alto
-            'quiet_zone': 2.0,
-            'write_text': False,      # NIENTE NUMERI
-        })
-        
-        buffer.seek(0)
-        return buffer
+        return BytesIO(get_barcode('png', ean_12, PNG_OPTIONS))
     except Exception as e:
         print(f"Errore generazione barcode PNG per {ean_code}: {e}")
         return None
 
 
+def generate_ean13_pngs(ean_codes, workers=1):
+    """
+    PNG (come generate_ean13_png) per molti EAN, dalla cache dove presenti
+
+    Args:
+        ean_codes: Iterabile di EAN normalizzati (12 cifre)
+        workers: processi per i mancanti (1 = nel processo corrente, come nelle richieste web)
+
+    Returns:
+        dict: EAN a 12 cifre -> bytes del PNG (solo quelli generati)
+    """
+    ean_12s = [str(e)[:12] for e in ean_codes if e and len(str(e)) >= 12]
+    pngs = get_barcodes('png', ean_12s, PNG_OPTIONS, workers=workers)
+    return {ean_12: data for ean_12, data in pngs.items() if data is not None}
+
+
+def prewarm_barcodes(eans, formats=('png',), workers=None):
+    """
+    Renderizza in anticipo (cache su disco) i barcode di un intero assortimento
+    
+    Args:
+        eans: Iterabile di coppie (ean, tipoean) come in v_MasterAssortimenti
+        formats: Formati da preparare
+        workers: Processi per il rendering dei PNG (default settings.BARCODE_RENDER_WORKERS)
+    
+    Returns:
+        int: Numero di barcode distinti preparati
+    """
+    ean_12s = list(dict.fromkeys(
+        e for e in (normalize_ean_for_barcode(ean, tipo_ean) for ean, tipo_ean in eans) if e
+    ))
+    ready = set()
+    if 'png' in formats:
+        ready.update(generate_ean13_pngs(ean_12s, workers=workers or render_workers()))
+    if 'svg' in formats:
+        ready.update(e for e in ean_12s if generate_ean13_svg(e) is not None)
+    return len(ready)
+
+
 def generate_ean13_base64(ean_code):
     """
     Genera barcode EAN13 come base64 (per data URI)
@@ -105,14 +142,7 @@ def validate_ean13(ean_code):
     
     try:
         ean_str = str(ean_code)
-        
-        # Calcola checksum
-        odd_sum = sum(int(ean_str[i]) for i in range(0, 12, 2))
-        even_sum = sum(int(ean_str[i]) for i in range(1, 12, 2))
-        
-        checksum = (10 - ((odd_sum + even_sum * 3) % 10)) % 10
-        
-        return int(ean_str[12]) == checksum
+        return int(ean_str[12]) == ean13_checksum(ean_str[:12])
     except:
         return False
 
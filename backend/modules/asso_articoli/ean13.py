@@ -0,0 +1,146 @@
+"""
+Encoder EAN13 nativo per i barcode SVG della griglia asso_articoli
+
+Il pattern a 95 moduli è calcolato con le tabelle di codifica (set L/G/R e
+parità dalla prima cifra) e scritto come un unico <path>, un sottopercorso
+per barra: niente oggetti python-barcode né XML da serializzare per riga,
+e un SVG molto più piccolo da incorporare nell'HTML.
+Geometria e testo ricalcano l'SVGWriter di python-barcode con le stesse
+opzioni (dimensioni in mm).
+Il PNG per gli export resta di python-barcode (ImageWriter, PIL); il modulo non
+dipende da Django, così ean13_png può girare nei processi worker di
+barcode_cache.get_barcodes.
+"""
+from io import BytesIO
+
+import barcode
+from barcode.writer import ImageWriter
+
+# Codifica delle cifre: set L (dispari), G (pari), R (lato destro)
+_L = ('0001101', '0011001', '0010011', '0111101', '0100011',
+      '0110001', '0101111', '0111011', '0110111', '0001011')
+_G = ('0100111', '0110011', '0011011', '0100001', '0011101',
+      '0111001', '0000101', '0010001', '0001001', '0010111')
+_R = ('1110010', '1100110', '1101100', '1000010', '1011100',
+      '1001110', '1010000', '1000100', '1001000', '1110100')
+
+# Parità delle 6 cifre di sinistra in base alla prima cifra (implicita)
+_PARITY = ('LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+           'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL')
+
+_GUARD = '101'
+_CENTER = '01010'
+
+MODULES = 95
+
+# 1 punto tipografico in mm (font_size delle opzioni è in pt)
+_PT_MM = 0.352777778
+
+
+def ean13_checksum(ean_12):
+    """
+    Cifra di controllo EAN13 per le prime 12 cifre
+
+    Posizioni dispari (1a, 3a, ...) con peso 1, pari con peso 3.
+    Solleva ValueError se ean_12 non è di 12 cifre.
+    """
+    ean_12 = str(ean_12)
+    if len(ean_12) != 12 or not ean_12.isdigit():
+        raise ValueError(f"EAN a 12 cifre non valido: {ean_12!r}")
+    odd_sum = sum(int(c) for c in ean_12[0::2])
+    even_sum = sum(int(c) for c in ean_12[1::2])
+    return (10 - ((odd_sum + even_sum * 3) % 10)) % 10
+
+
+def ean13_full(ean_12):
+    """EAN a 13 cifre: le 12 date più la cifra di controllo."""
+    return f"{ean_12}{ean13_checksum(ean_12)}"
+
+
+def ean13_modules(ean_12):
+    """
+    Pattern a 95 moduli ('1' = barra, '0' = spazio) dell'EAN13
+
+    Args:
+        ean_12: prime 12 cifre (la cifra di controllo viene calcolata)
+    """
+    code = ean13_full(ean_12)
+    parity = _PARITY[int(code[0])]
+    left = ''.join((_L if p == 'L' else _G)[int(d)] for p, d in zip(parity, code[1:7]))
+    right = ''.join(_R[int(d)] for d in code[7:])
+    return _GUARD + left + _CENTER + right + _GUARD
+
+
+def _bars(modules):
+    """(primo modulo, larghezza in moduli) di ogni barra."""
+    bars = []
+    start = None
+    for i, m in enumerate(modules + '0'):
+        if m == '1' and start is None:
+            start = i
+        elif m == '0' and start is not None:
+            bars.append((start, i - start))
+            start = None
+    return bars
+
+
+def _num(value):
+    """Numero compatto per gli attributi SVG (max 3 decimali, senza zeri finali)."""
+    return f"{value:.3f}".rstrip('0').rstrip('.')
+
+
+def ean13_svg(ean_12, module_width=0.2, module_height=10.0, quiet_zone=2.0,
+              font_size=8, text_distance=5.0, write_text=True, **_):
+    """
+    SVG inline dell'EAN13 (senza prologo XML, pronto per l'HTML)
+
+    Args:
+        ean_12: prime 12 cifre (la cifra di controllo viene calcolata)
+        module_width, module_height, quiet_zone, text_distance: in mm
+        font_size: in pt
+        write_text: scrive le 13 cifre sotto le barre
+
+    Returns:
+        str: elemento <svg> con le barre in un solo <path>
+    """
+    code = ean13_full(ean_12)
+    top = 1.0
+    width = quiet_zone * 2 + MODULES * module_width
+    height = top * 2 + module_height
+    if write_text:
+        height += text_distance + font_size * _PT_MM / 2
+
+    path = ''.join(
+        f"M{_num(quiet_zone + start * module_width)} {_num(top)}"
+        f"h{_num(size * module_width)}v{_num(module_height)}h-{_num(size * module_width)}z"
+        for start, size in _bars(ean13_modules(ean_12))
+    )
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{_num(width)}mm" height="{_num(height)}mm" '
+        f'viewBox="0 0 {_num(width)} {_num(height)}">',
+        '<rect width="100%" height="100%" fill="white"/>',
+        f'<path d="{path}" fill="black"/>',
+    ]
+    if write_text:
+        parts.append(
+            f'<text x="{_num(width / 2)}" y="{_num(top + module_height + text_distance)}" '
+            f'font-size="{_num(font_size * _PT_MM)}" text-anchor="middle" fill="black">{code}</text>'
+        )
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+def ean13_png(ean_12, options):
+    """
+    PNG dell'EAN13 con python-barcode
+
+    Args:
+        ean_12: prime 12 cifre
+        options: opzioni di ImageWriter (module_width, module_height, ...)
+
+    Returns:
+        bytes: contenuto del PNG
+    """
+    buffer = BytesIO()
+    barcode.get('ean13', ean_12, writer=ImageWriter()).write(buffer, options=dict(options))
+    return buffer.getvalue()
@@ -1,44 +1,77 @@
 """
 Utility per export Excel con barcode embedded
 Genera file Excel con formattazione e immagini barcode
+
+I fogli sono scritti in streaming (modules.util.xlsx_stream): ogni funzione
+ritorna un file temporaneo già posizionato all'inizio, da inviare con
+xlsx_response.
+I PNG dei barcode sono preparati tutti prima di scrivere il foglio (cache +
+rendering parallelo dei mancanti) e ogni EAN è salvato una volta sola nel file.
 """
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from openpyxl.drawing.image import Image as XLImage
-from openpyxl.utils import get_column_letter
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
 from datetime import datetime
-from io import BytesIO
-from .barcode_utils import generate_ean13_png, normalize_ean_for_barcode
+from modules.util.xlsx_stream import XlsxStreamWriter
+from .barcode_utils import generate_ean13_pngs, normalize_ean_for_barcode
+
+
+def _border_thin():
+    return Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+
+
+def _table_styles():
+    """Stili condivisi da export articoli e report reparti (uno per workbook)."""
+    return [
+        NamedStyle(
+            name='asso_header',
+            font=Font(bold=True, color="FFFFFF", size=11),
+            fill=PatternFill(start_color="366092", end_color="366092", fill_type="solid"),
+            alignment=Alignment(horizontal="center", vertical="center"),
+            border=_border_thin(),
+        ),
+        NamedStyle(name='asso_cell', border=_border_thin()),
+        NamedStyle(name='asso_qty', border=_border_thin(), number_format='#,##0.00'),
+        NamedStyle(name='asso_euro', border=_border_thin(), number_format='€#,##0.00'),
+        NamedStyle(name='asso_perc', border=_border_thin(), number_format='0.00"%"'),
+        NamedStyle(
+            name='asso_fornitore',
+            font=Font(bold=True, size=12, color="1F4E79"),
+            fill=PatternFill(start_color="D6EAF8", end_color="D6EAF8", fill_type="solid"),
+            alignment=Alignment(horizontal="left", vertical="center"),
+        ),
+    ]
+
+
+def _barcode_pngs(articoli_data):
+    """
+    PNG dei barcode degli articoli, generati in blocco
+
+    Returns:
+        funzione articolo -> bytes del PNG, o None se non generabile
+    """
+    def ean_of(articolo):
+        return normalize_ean_for_barcode(articolo.get('ean', ''), articolo.get('tipoean'))
+
+    pngs = generate_ean13_pngs(ean_of(a) for a in articoli_data)
+    return lambda articolo: pngs.get(ean_of(articolo))
 
 
 def export_articoli_excel(articoli_data, filename='assortimenti', include_barcode=True):
     """
     Esporta lista articoli in Excel con formattazione
-    
+
     Args:
         articoli_data: Lista di dict con dati articoli
         filename: Nome file (senza estensione)
         include_barcode: Se True, include colonna con barcode
-    
+
     Returns:
-        BytesIO: Buffer con file Excel
+        file: File temporaneo con il file Excel
     """
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Assortimenti"
-    
-    # Stili
-    header_font = Font(bold=True, color="FFFFFF", size=11)
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    border_thin = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
     # Headers
     headers = [
         'Codice Articolo',
@@ -53,10 +86,10 @@ def export_articoli_excel(articoli_data, filename='assortimenti', include_barcod
         'Stato',
         'EAN',
     ]
-    
+    barcode_col = len(headers) + 1 if include_barcode else None
     if include_barcode:
         headers.append('Barcode')
-    
+
     headers.extend([
         'Giacenza PDV',
         'Giacenza Deposito',
@@ -64,246 +97,118 @@ def export_articoli_excel(articoli_data, filename='assortimenti', include_barcod
         'IVA %',
         'Fornitore',
     ])
-    
-    # Scrivi headers
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border_thin
-    
-    # Altezza header
-    ws.row_dimensions[1].height = 25
-    
-    # Dati
-    row_num = 2
-    barcode_col = None
-    
+
+    # Larghezze: 15 per tutte, descrizione più larga, barcode 20
+    widths = [15] * len(headers)
+    widths[1] = 40
+    if barcode_col:
+        widths[barcode_col - 1] = 20
+
+    xlsx = XlsxStreamWriter("Assortimenti", widths=widths, styles=_table_styles(), freeze='A2')
+    xlsx.append(headers, styles='asso_header', height=25)
+
+    # Stili per colonna, calcolati una volta
+    row_styles = ['asso_cell'] * 11
+    if include_barcode:
+        row_styles.append(None)
+    row_styles.extend(['asso_qty', 'asso_qty', 'asso_euro', 'asso_perc', 'asso_cell'])
+
+    barcode_png = _barcode_pngs(articoli_data) if include_barcode else None
+
     for articolo in articoli_data:
-        col_num = 1
-        
-        # Dati base
-        ws.cell(row=row_num, column=col_num, value=articolo.get('codart', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('descrart', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('sett', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('rep', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('srep', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('fam', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('ccom', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('linea_prodotto', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('codartfo', '')).border = border_thin
-        col_num += 1
-
-        ws.cell(row=row_num, column=col_num, value=articolo.get('stato', '')).border = border_thin
-        col_num += 1
-        
-        # EAN
-        ean_value = articolo.get('ean', '')
-        ws.cell(row=row_num, column=col_num, value=ean_value).border = border_thin
-        col_num += 1
-        
-        # Barcode
+        values = [
+            articolo.get('codart', ''),
+            articolo.get('descrart', ''),
+            articolo.get('sett', ''),
+            articolo.get('rep', ''),
+            articolo.get('srep', ''),
+            articolo.get('fam', ''),
+            articolo.get('ccom', ''),
+            articolo.get('linea_prodotto', ''),
+            articolo.get('codartfo', ''),
+            articolo.get('stato', ''),
+            articolo.get('ean', ''),
+        ]
+        png = None
         if include_barcode:
-            barcode_col = col_num
-            ean_value = articolo.get('ean', '')  # prendi EAN qui
-            # Genera barcode PNG
-            tipo_ean = articolo.get('tipoean')
-            ean_normalized = normalize_ean_for_barcode(ean_value, tipo_ean)
-            
-        if ean_normalized:
-            barcode_buffer = generate_ean13_png(ean_normalized)
-            
-            if barcode_buffer:
-                img = XLImage(barcode_buffer)
-                img.width = 150
-                img.height = 70
-                
-                cell_address = f"{get_column_letter(col_num)}{row_num}"
-                ws.add_image(img, cell_address)
-                
-                ws.row_dimensions[row_num].height = 55
-        
-            col_num += 1
-        
-        # Giacenze
-        giacenza_pdv = articolo.get('giacenza_pdv', 0)
-        cell = ws.cell(row=row_num, column=col_num, value=giacenza_pdv)
-        cell.number_format = '#,##0.00'
-        cell.border = border_thin
-        col_num += 1
-        
-        giacenza_dep = articolo.get('giacenza_deposito', 0)
-        cell = ws.cell(row=row_num, column=col_num, value=giacenza_dep)
-        cell.number_format = '#,##0.00'
-        cell.border = border_thin
-        col_num += 1
-        
-        # Prezzo acquisto
-        pracq = articolo.get('pracq', 0)
-        cell = ws.cell(row=row_num, column=col_num, value=pracq)
-        cell.number_format = '€#,##0.00'
-        cell.border = border_thin
-        col_num += 1
-        
-        # IVA
-        iva = articolo.get('iva', 0)
-        cell = ws.cell(row=row_num, column=col_num, value=iva)
-        cell.number_format = '0.00"%"'
-        cell.border = border_thin
-        col_num += 1
-        
-        # Fornitore
-        ws.cell(row=row_num, column=col_num, value=articolo.get('descforn', '')).border = border_thin
-        
-        row_num += 1
-    
-    # Auto-width per colonne (tranne barcode)
-    for col_num in range(1, len(headers) + 1):
-        if include_barcode and col_num == barcode_col:
-            ws.column_dimensions[get_column_letter(col_num)].width = 20
-        else:
-            ws.column_dimensions[get_column_letter(col_num)].width = 15
-    
-    # Colonna descrizione più larga
-    ws.column_dimensions['B'].width = 40
-    
-    # Freeze panes (header)
-    ws.freeze_panes = 'A2'
-    
-    # Salva in buffer
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    return buffer
+            values.append(None)
+            png = barcode_png(articolo)
+        values.extend([
+            articolo.get('giacenza_pdv', 0),
+            articolo.get('giacenza_deposito', 0),
+            articolo.get('pracq', 0),
+            articolo.get('iva', 0),
+            articolo.get('descforn', ''),
+        ])
+
+        xlsx.append(values, styles=row_styles, height=55 if png else None)
+        if png:
+            xlsx.add_image_data(png, barcode_col, 150, 70)
+
+    return xlsx.save()
 
 
 def export_report_inventario(articoli_data, ccom=None, linea_prodotto=None):
     """
     Export specifico per report inventario (simile a r_StampaInv)
-    
+
     Args:
         articoli_data: Lista articoli
         ccom: Filtro CCOM applicato
         linea_prodotto: Filtro linea prodotto
-    
+
     Returns:
-        BytesIO: Buffer Excel
+        file: File temporaneo con il file Excel
     """
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Inventario"
-    
+    styles = [
+        NamedStyle(name='inv_title', font=Font(bold=True, size=14), alignment=Alignment(horizontal='center')),
+        NamedStyle(name='inv_bold', font=Font(bold=True)),
+        NamedStyle(
+            name='inv_header',
+            font=Font(bold=True),
+            fill=PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid"),
+        ),
+    ]
+    xlsx = XlsxStreamWriter("Inventario", widths=[12, 35, 15, 18, 12, 12], styles=styles)
+
     # Header report
-    ws['A1'] = 'REPORT INVENTARIO ASSORTIMENTI'
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A1'].alignment = Alignment(horizontal='center')
-    ws.merge_cells('A1:F1')
-    
+    xlsx.append_merged('REPORT INVENTARIO ASSORTIMENTI', style='inv_title')
+
     # Info filtri
-    row = 2
     if ccom:
-        ws[f'A{row}'] = f'CCOM: {ccom}'
-        ws[f'A{row}'].font = Font(bold=True)
-        row += 1
-    
+        xlsx.append([f'CCOM: {ccom}'], styles='inv_bold')
     if linea_prodotto:
-        ws[f'A{row}'] = f'Linea Prodotto: {linea_prodotto}'
-        ws[f'A{row}'].font = Font(bold=True)
-        row += 1
-    
-    ws[f'A{row}'] = f'Data: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
-    row += 2
-    
+        xlsx.append([f'Linea Prodotto: {linea_prodotto}'], styles='inv_bold')
+
+    xlsx.append([f'Data: {datetime.now().strftime("%d/%m/%Y %H:%M")}'])
+    xlsx.append([])
+
     # Headers tabella
-    headers_row = row
-    headers = ['Cod.Art', 'Descrizione', 'EAN', 'Barcode', 'Giac.PDV', 'Giac.Dep']
-    
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=headers_row, column=col_num, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-    
+    xlsx.append(['Cod.Art', 'Descrizione', 'EAN', 'Barcode', 'Giac.PDV', 'Giac.Dep'], styles='inv_header')
+
     # Dati
-    data_row = headers_row + 1
+    barcode_png = _barcode_pngs(articoli_data)
     for articolo in articoli_data:
-        ws.cell(row=data_row, column=1, value=articolo.get('codart', ''))
-        ws.cell(row=data_row, column=2, value=articolo.get('descrart', ''))
-        ws.cell(row=data_row, column=3, value=articolo.get('ean', ''))
-        
-        # Barcode
-        ean = articolo.get('ean', '')
-        tipo_ean = articolo.get('tipoean')
-        ean_normalized = normalize_ean_for_barcode(ean, tipo_ean)
-        
-        if ean_normalized:
-            barcode_buffer = generate_ean13_png(ean_normalized)
-            if barcode_buffer:
-                img = XLImage(barcode_buffer)
-                img.width = 100
-                img.height = 50
-                ws.add_image(img, f'D{data_row}')
-                ws.row_dimensions[data_row].height = 40
-        
-        ws.cell(row=data_row, column=5, value=articolo.get('giacenza_pdv', 0))
-        ws.cell(row=data_row, column=6, value=articolo.get('giacenza_deposito', 0))
-        
-        data_row += 1
-    
-    # Auto-width
-    ws.column_dimensions['A'].width = 12
-    ws.column_dimensions['B'].width = 35
-    ws.column_dimensions['C'].width = 15
-    ws.column_dimensions['D'].width = 18
-    ws.column_dimensions['E'].width = 12
-    ws.column_dimensions['F'].width = 12
-    
-    # Salva
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    return buffer
+        png = barcode_png(articolo)
+        xlsx.append([
+            articolo.get('codart', ''),
+            articolo.get('descrart', ''),
+            articolo.get('ean', ''),
+            None,
+            articolo.get('giacenza_pdv', 0),
+            articolo.get('giacenza_deposito', 0),
+        ], height=40 if png else None)
+        if png:
+            xlsx.add_image_data(png, 4, 100, 50)
+
+    return xlsx.save()
+
+
 def export_report_reparti(articoli_data, tipo_reparto=''):
     """
     Export specifico per report reparti
     Ordinato per fornitore con riga intestazione ad ogni cambio
     """
-    wb = Workbook()
-    ws = wb.active
-    ws.title = tipo_reparto or "Reparto"
-    
-    # Stili
-    header_font = Font(bold=True, color="FFFFFF", size=11)
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    fornitore_font = Font(bold=True, size=12, color="1F4E79")
-    fornitore_fill = PatternFill(start_color="D6EAF8", end_color="D6EAF8", fill_type="solid")
-    
-    border_thin = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
     # Headers (senza Giacenza Deposito, con Note)
     headers = [
         'Codice Articolo',
@@ -317,114 +222,48 @@ def export_report_reparti(articoli_data, tipo_reparto=''):
         'Giacenza PDV',
         'Note',
     ]
-    
-    # Scrivi headers
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border_thin
-    
-    ws.row_dimensions[1].height = 25
-    
+    barcode_col = 8
+
+    xlsx = XlsxStreamWriter(
+        tipo_reparto or "Reparto",
+        widths=[15, 40, 10, 25, 12, 8, 15, 22, 12, 25],  # Note più larga per scrivere
+        styles=_table_styles(),
+        freeze='A2',
+    )
+    xlsx.append(headers, styles='asso_header', height=25)
+
+    row_styles = ['asso_cell'] * 7 + [None, 'asso_qty', 'asso_cell']
+
     # Ordina per fornitore
     articoli_data_sorted = sorted(articoli_data, key=lambda x: (x.get('descforn') or '', x.get('fam') or '', x.get('codart') or ''))
-    
-    # Dati
-    row_num = 2
-    barcode_col = 8
+
+    barcode_png = _barcode_pngs(articoli_data_sorted)
+
     current_fornitore = None
-    
     for articolo in articoli_data_sorted:
         fornitore = articolo.get('descforn') or 'Senza Fornitore'
-        
+
         # Riga intestazione fornitore al cambio
         if fornitore != current_fornitore:
             current_fornitore = fornitore
-            
-            # Riga fornitore
-            ws.merge_cells(start_row=row_num, start_column=1, end_row=row_num, end_column=len(headers))
-            cell = ws.cell(row=row_num, column=1, value=f"▶ FORNITORE: {fornitore}")
-            cell.font = fornitore_font
-            cell.fill = fornitore_fill
-            cell.alignment = Alignment(horizontal="left", vertical="center")
-            ws.row_dimensions[row_num].height = 22
-            row_num += 1
-        
-        col_num = 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('codart', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('descrart', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('fam', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('descrfam', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('codartfo', '')).border = border_thin
-        col_num += 1
-        
-        ws.cell(row=row_num, column=col_num, value=articolo.get('stato', '')).border = border_thin
-        col_num += 1
-        
-        # EAN
+            xlsx.append_merged(f"▶ FORNITORE: {fornitore}", style='asso_fornitore', height=22)
+
         ean_value = articolo.get('ean', '')
-        ws.cell(row=row_num, column=col_num, value=ean_value).border = border_thin
-        col_num += 1
-        
-        # Barcode
-        tipo_ean = articolo.get('tipoean')
-        ean_normalized = normalize_ean_for_barcode(ean_value, tipo_ean)
-        
-        if ean_normalized:
-            barcode_buffer = generate_ean13_png(ean_normalized)
-            
-            if barcode_buffer:
-                img = XLImage(barcode_buffer)
-                img.width = 150
-                img.height = 70
-                
-                cell_address = f"{get_column_letter(col_num)}{row_num}"
-                ws.add_image(img, cell_address)
-                
-                ws.row_dimensions[row_num].height = 55
-        
-        col_num += 1
-        
-        # Giacenza PDV
-        giacenza_pdv = articolo.get('giacenza_pdv', 0)
-        cell = ws.cell(row=row_num, column=col_num, value=giacenza_pdv)
-        cell.number_format = '#,##0.00'
-        cell.border = border_thin
-        col_num += 1
-        
-        # Note (vuoto con bordo per compilazione manuale)
-        cell = ws.cell(row=row_num, column=col_num, value='')
-        cell.border = border_thin
-        
-        row_num += 1
-    
-    # Larghezza colonne
-    ws.column_dimensions['A'].width = 15
-    ws.column_dimensions['B'].width = 40
-    ws.column_dimensions['C'].width = 10
-    ws.column_dimensions['D'].width = 25
-    ws.column_dimensions['E'].width = 12
-    ws.column_dimensions['F'].width = 8
-    ws.column_dimensions['G'].width = 15
-    ws.column_dimensions['H'].width = 22
-    ws.column_dimensions['I'].width = 12
-    ws.column_dimensions['J'].width = 25  # Note più larga per scrivere
-    
-    ws.freeze_panes = 'A2'
-    
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    return buffer
\ No newline at end of file
+        png = barcode_png(articolo)
+        xlsx.append([
+            articolo.get('codart', ''),
+            articolo.get('descrart', ''),
+            articolo.get('fam', ''),
+            articolo.get('descrfam', ''),
+            articolo.get('codartfo', ''),
+            articolo.get('stato', ''),
+            ean_value,
+            None,
+            articolo.get('giacenza_pdv', 0),
+            # Note (vuoto con bordo per compilazione manuale)
+            '',
+        ], styles=row_styles, height=55 if png else None)
+        if png:
+            xlsx.add_image_data(png, barcode_col, 150, 70)
+
+    return xlsx.save()
@@ -0,0 +1,106 @@
+"""
+Liste filtro della maschera asso_articoli (CCOM, reparti, sottoreparti,
+famiglie e linee per CCOM) calcolate una volta e condivise nel processo.
+
+Invece di una SELECT DISTINCT su v_MasterAssortimenti per ogni tendina a ogni
+caricamento della pagina, una sola query DISTINCT sulle colonne di filtro
+alimenta tutte le liste. Le liste sono ricalcolate:
+- quando sono più vecchie di settings.ASSO_FACETS_MAX_AGE secondi (default 900)
+- su invalidazione esplicita (invalidate_asso_facets, endpoint api/facets/refresh/)
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .models import MasterAssortimenti
+
+FACET_FIELDS = (
+    'ccom', 'descrccom',
+    'rep', 'descrrep',
+    'srep', 'descrsrep',
+    'fam', 'descrfam',
+    'linea_prodotto', 'descr_linea',
+    'fornprinc',
+)
+
+
+def _sorted_pairs(pairs, code, descr):
+    """Coppie (codice, descrizione) distinte come dict, ordinate per codice (NULL per primi, come SQL)."""
+    return [
+        {code: c, descr: d}
+        for c, d in sorted(pairs, key=lambda p: (p[0] is not None, p[0] or '', p[1] is not None, p[1] or ''))
+    ]
+
+
+class AssoFacets:
+    """Liste distinte per le tendine, nel formato delle vecchie query values().distinct()."""
+
+    def __init__(self, rows):
+        self.built_at = time.monotonic()
+        ccom, rep, srep, fam = set(), set(), set(), set()
+        linee = {}
+        for row in rows:
+            ccom.add((row['ccom'], row['descrccom']))
+            rep.add((row['rep'], row['descrrep']))
+            srep.add((row['srep'], row['descrsrep']))
+            fam.add((row['fam'], row['descrfam']))
+            # Linee solo del fornitore principale, senza linee vuote
+            if row['fornprinc'] == 1 and row['linea_prodotto']:
+                linee.setdefault(row['ccom'], set()).add((row['linea_prodotto'], row['descr_linea']))
+
+        self.ccom_list = _sorted_pairs(ccom, 'ccom', 'descrccom')
+        self.rep_list = _sorted_pairs(rep, 'rep', 'descrrep')
+        self.srep_list = _sorted_pairs(srep, 'srep', 'descrsrep')
+        self.fam_list = _sorted_pairs(fam, 'fam', 'descrfam')
+        self.linee_per_ccom = {
+            c: _sorted_pairs(pairs, 'linea_prodotto', 'descr_linea') for c, pairs in linee.items()
+        }
+
+    def linee(self, ccom):
+        """Linee (fornitore principale) del CCOM, come api_linee_per_ccom."""
+        return self.linee_per_ccom.get(ccom, [])
+
+    def search_ccom(self, search='', limit=50):
+        """CCOM il cui codice o descrizione contiene `search` (senza distinzione maiuscole)."""
+        if not search:
+            return self.ccom_list[:limit]
+        search = search.lower()
+        return [
+            c for c in self.ccom_list
+            if search in (c['ccom'] or '').lower() or search in (c['descrccom'] or '').lower()
+        ][:limit]
+
+
+def load_asso_facets():
+    """Una sola query DISTINCT su v_MasterAssortimenti per tutte le liste."""
+    rows = MasterAssortimenti.objects.using('goldreport').order_by().values(*FACET_FIELDS).distinct()
+    return AssoFacets(rows.iterator())
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def _is_stale(facets):
+    max_age = getattr(settings, 'ASSO_FACETS_MAX_AGE', 900)
+    return bool(max_age) and time.monotonic() - facets.built_at > max_age
+
+
+def get_asso_facets():
+    """Liste filtro del processo, ricalcolate se mancanti o scadute."""
+    global _current
+    facets = _current
+    if facets is not None and not _is_stale(facets):
+        return facets
+    with _lock:
+        if _current is None or _is_stale(_current):
+            _current = load_asso_facets()
+        return _current
+
+
+def invalidate_asso_facets():
+    """Scarta le liste del processo: la prossima richiesta le ricalcola."""
+    global _current
+    with _lock:
+        _current = None
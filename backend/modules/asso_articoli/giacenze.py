@@ -0,0 +1,63 @@
+"""
+Arricchimento giacenze per gli articoli di v_MasterAssortimenti.
+
+Invece di una query su v_AllArticolo per ogni articolo, le giacenze
+dell'EAN principale (EANPRINC = 1) sono lette con una sola query IN per
+blocco di articoli e unite in memoria.
+"""
+from django.db.models import QuerySet
+
+from .models import AllArticolo
+
+# Codici per query IN: SQL Server accetta al massimo 2100 parametri per statement
+GIACENZE_CHUNK_SIZE = 1000
+
+
+def giacenze_per_codart(codarts):
+    """
+    Giacenze dell'EAN principale per i codici articolo dati
+
+    Returns:
+        dict: codart -> {'giacenza_pdv', 'giacenza_deposito'}; a parità di
+        codart vale la prima riga, come .first() sulla singola query
+    """
+    codarts = list(dict.fromkeys(c for c in codarts if c))
+    result = {}
+    for i in range(0, len(codarts), GIACENZE_CHUNK_SIZE):
+        rows = AllArticolo.objects.using('goldreport').filter(
+            codart__in=codarts[i:i + GIACENZE_CHUNK_SIZE],
+            eanprinc=1
+        ).order_by('codart').values('codart', 'giacenza_pdv', 'giacenza_deposito')
+        for row in rows:
+            result.setdefault(row['codart'], row)
+    return result
+
+
+def iter_with_giacenze(articoli, chunk_size=GIACENZE_CHUNK_SIZE):
+    """
+    Coppie (articolo, giacenze) per ogni articolo, con una query giacenze per blocco
+
+    Args:
+        articoli: QuerySet o iterabile di MasterAssortimenti
+        chunk_size: articoli per blocco
+
+    giacenze è il dict di giacenze_per_codart o None se l'articolo non ha
+    una riga EANPRINC = 1 in v_AllArticolo.
+    """
+    if isinstance(articoli, QuerySet):
+        articoli = articoli.iterator(chunk_size=chunk_size)
+
+    batch = []
+    for art in articoli:
+        batch.append(art)
+        if len(batch) >= chunk_size:
+            yield from _merge(batch)
+            batch = []
+    if batch:
+        yield from _merge(batch)
+
+
+def _merge(batch):
+    giacenze = giacenze_per_codart(art.codart for art in batch)
+    for art in batch:
+        yield art, giacenze.get(art.codart)
@@ -0,0 +1,50 @@
+"""
+Management command di pre-riscaldamento della cache barcode.
+
+Renderizza i barcode PNG (export Excel) di tutti gli EAN di
+v_MasterAssortimenti, o di un solo CCOM, e li salva nella cache su disco
+(vedi asso_articoli.barcode_cache), renderizzando i mancanti in parallelo
+(settings.BARCODE_RENDER_WORKERS). Gli SVG della griglia sono prodotti
+dall'encoder nativo e non vanno su disco. Pensato per essere schedulato dopo
+gli aggiornamenti dell'assortimento.
+
+Uso:
+    python manage.py prewarm_barcodes
+    python manage.py prewarm_barcodes --ccom 123
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from modules.asso_articoli.barcode_utils import prewarm_barcodes
+from modules.asso_articoli.models import MasterAssortimenti
+
+
+class Command(BaseCommand):
+    help = 'Prepara nella cache su disco i barcode EAN13 degli articoli in assortimento'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ccom',
+            type=str,
+            default='',
+            help='Solo gli articoli di questo CCOM',
+        )
+        parser.add_argument(
+            '--formats',
+            type=str,
+            default='png',
+            help='Formati separati da virgola (png)',
+        )
+
+    def handle(self, *args, **options):
+        formats = tuple(f.strip() for f in options['formats'].split(',') if f.strip())
+        if not formats or any(f != 'png' for f in formats):
+            raise CommandError('--formats ammette solo png (gli SVG non sono salvati su disco)')
+
+        qs = MasterAssortimenti.objects.using('goldreport').exclude(ean__isnull=True).exclude(ean='')
+        if options['ccom']:
+            qs = qs.filter(ccom=options['ccom'])
+        eans = qs.values_list('ean', 'tipoean').distinct()
+
+        count = prewarm_barcodes(eans.iterator(), formats=formats)
+        self.stdout.write(self.style.SUCCESS(f'Barcode pronti in cache: {count} EAN ({", ".join(formats)})'))
@@ -22,4 +22,5 @@ urlpatterns = [
     # API
     path('api/ccom/', views.api_ccom_list, name='api_ccom'),
     path('api/linee/', views.api_linee_per_ccom, name='api_linee'),  # NUOVA API per linee filtrate per CCOM
+    path('api/facets/refresh/', views.api_facets_refresh, name='api_facets_refresh'),
 ]
@@ -4,38 +4,38 @@ Views per app AssoArticoli
 from django.shortcuts import render
 from django.http import HttpResponse, JsonResponse
 from django.db.models import Q, Count
-from django.views.decorators.csrf import csrf_exempt
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from datetime import datetime
 import json
 
-from .models import MasterAssortimenti, AllArticolo
+from .models import MasterAssortimenti
 from .barcode_utils import generate_ean13_svg, normalize_ean_for_barcode
 from .excel_utils import export_articoli_excel, export_report_inventario
+from .facets import get_asso_facets, invalidate_asso_facets
+from .giacenze import iter_with_giacenze
+from modules.util.xlsx_stream import xlsx_response
+
+
+def _filtro_ean_famiglie(articoli_query):
+    """
+    Scarta gli articoli delle famiglie 8940, 8943, 8970 senza EAN valido
+    (logica Access: Len([ean]) > 3 per alcune FAM)
+    """
+    for art in articoli_query.iterator():
+        if art.fam in ['8940', '8943', '8970']:
+            if not art.ean or len(str(art.ean)) <= 3:
+                continue
+        yield art
 
 
 def index(request):
     """
     Maschera principale - Visualizzazione e filtro articoli per CCOM, Reparto, Sottoreparto, Famiglia, Linea
     """
-    # Ottieni lista CCOM distinti per dropdown
-    ccom_list = MasterAssortimenti.objects.using('goldreport').values(
-        'ccom', 'descrccom'
-    ).distinct().order_by('ccom')
-    
-    # Ottieni lista Reparti distinti
-    rep_list = MasterAssortimenti.objects.using('goldreport').values(
-        'rep', 'descrrep'
-    ).distinct().order_by('rep')
-    
-    # Ottieni lista Sottoreparti distinti
-    srep_list = MasterAssortimenti.objects.using('goldreport').values(
-        'srep', 'descrsrep'
-    ).distinct().order_by('srep')
-    
-    # Ottieni lista Famiglie distinte
-    fam_list = MasterAssortimenti.objects.using('goldreport').values(
-        'fam', 'descrfam'
-    ).distinct().order_by('fam')
+    # Liste per le tendine (CCOM, Reparti, Sottoreparti, Famiglie) dalla cache del processo
+    facets = get_asso_facets()
     
     # Filtri dalla request
     selected_ccom = request.GET.get('ccom', '')
@@ -50,14 +50,7 @@ def index(request):
     # Lista linee per il CCOM selezionato (solo se L1 attivo e CCOM selezionato)
     linea_list = []
     if selected_ccom and linea_1_filter:
-        linea_list = MasterAssortimenti.objects.using('goldreport').filter(
-            ccom=selected_ccom,
-            fornprinc=1
-        ).values(
-            'linea_prodotto', 'descr_linea'
-        ).exclude(
-            Q(linea_prodotto__isnull=True) | Q(linea_prodotto='')
-        ).distinct().order_by('linea_prodotto')
+        linea_list = facets.linee(selected_ccom)
     
     # Query base
     articoli_query = MasterAssortimenti.objects.using('goldreport').select_related()
@@ -109,16 +102,11 @@ def index(request):
         articoli_data = []
     else:
         articoli_data = []
-        for art in articoli:
-            # Filtra per EANPRINC = 1 (EAN principale)
-            giacenze = AllArticolo.objects.using('goldreport').filter(
-                codart=art.codart,
-                eanprinc=1
-            ).first()
-            
+        # Giacenze EAN principale (EANPRINC = 1) con una query per blocco di articoli
+        for art, giacenze in iter_with_giacenze(articoli):
             if giacenze:
-                giacenza_pdv = giacenze.giacenza_pdv or 0
-                giacenza_dep = giacenze.giacenza_deposito or 0
+                giacenza_pdv = giacenze['giacenza_pdv'] or 0
+                giacenza_dep = giacenze['giacenza_deposito'] or 0
             else:
                 giacenza_pdv = 0
                 giacenza_dep = 0
@@ -157,10 +145,10 @@ def index(request):
             })
         
     context = {
-        'ccom_list': ccom_list,
-        'rep_list': rep_list,
-        'srep_list': srep_list,
-        'fam_list': fam_list,
+        'ccom_list': facets.ccom_list,
+        'rep_list': facets.rep_list,
+        'srep_list': facets.srep_list,
+        'fam_list': facets.fam_list,
         'linea_list': linea_list,
         'articoli': articoli_data,
         'selected_ccom': selected_ccom,
@@ -188,16 +176,8 @@ def api_linee_per_ccom(request):
     if not ccom:
         return JsonResponse({'results': []})
     
-    linee_query = MasterAssortimenti.objects.using('goldreport').filter(
-        ccom=ccom,
-        fornprinc=1  # Solo fornitore principale
-    ).values(
-        'linea_prodotto', 'descr_linea'
-    ).exclude(
-        Q(linea_prodotto__isnull=True) | Q(linea_prodotto='')
-    ).distinct().order_by('linea_prodotto')
-    
-    linee_list = list(linee_query)
+    # Solo fornitore principale, dalla cache delle liste filtro
+    linee_list = get_asso_facets().linee(ccom)
     
     return JsonResponse({'results': linee_list})
 
@@ -251,16 +231,11 @@ def export_excel_view(request):
     
     # Prepara dati per export
     articoli_data = []
-    for art in articoli_query[:500]:  # Limite per performance
-        # Filtra per EANPRINC = 1 (EAN principale)
-        giacenze = AllArticolo.objects.using('goldreport').filter(
-            codart=art.codart,
-            eanprinc=1
-        ).first()
-        
+    # Giacenze EAN principale (EANPRINC = 1) con una query per blocco di articoli
+    for art, giacenze in iter_with_giacenze(articoli_query):
         if giacenze:
-            giacenza_pdv = giacenze.giacenza_pdv or 0
-            giacenza_dep = giacenze.giacenza_deposito or 0
+            giacenza_pdv = giacenze['giacenza_pdv'] or 0
+            giacenza_dep = giacenze['giacenza_deposito'] or 0
         else:
             giacenza_pdv = 0
             giacenza_dep = 0
@@ -290,15 +265,8 @@ def export_excel_view(request):
     excel_buffer = export_articoli_excel(articoli_data, filename='assortimenti', include_barcode=True)
     
     # Response
-    response = HttpResponse(
-        excel_buffer.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    
     filename = f'assortimenti_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
+    return xlsx_response(excel_buffer, filename)
 
 def report_bar(request):
     """
@@ -317,45 +285,27 @@ def report_bar(request):
     
     # Prepara dati
     articoli_data = []
-    for art in articoli_query:
-        # Filtro per lunghezza EAN (logica Access: Len([ean]) > 3 per alcune FAM)
-        if art.fam in ['8940', '8943', '8970']:
-            if not art.ean or len(str(art.ean)) <= 3:
-                continue
-        
-        giacenze = AllArticolo.objects.using('goldreport').filter(
-            codart=art.codart,
-            eanprinc=1
-        ).first()
+    for art, giacenze in iter_with_giacenze(_filtro_ean_famiglie(articoli_query)):
+        giacenza_pdv = giacenze['giacenza_pdv'] if giacenze else 0
         
-        giacenza_pdv = giacenze.giacenza_pdv if giacenze else 0
-        giacenza_dep = giacenze.giacenza_deposito if giacenze else 0
-        
-    articoli_data.append({
-        'codart': art.codart,
-        'descrart': art.descrart,
-        'fam': art.fam,
-        'descrfam': art.descrfam,
-        'codartfo': art.codartfo,
-        'stato': art.stato,
-        'ean': art.ean,
-        'tipoean': art.tipoean,
-        'giacenza_pdv': float(giacenza_pdv) if giacenza_pdv else 0,
-        'descforn': art.descforn,  # AGGIUNGI QUESTO
-    })
+        articoli_data.append({
+            'codart': art.codart,
+            'descrart': art.descrart,
+            'fam': art.fam,
+            'descrfam': art.descrfam,
+            'codartfo': art.codartfo,
+            'stato': art.stato,
+            'ean': art.ean,
+            'tipoean': art.tipoean,
+            'giacenza_pdv': float(giacenza_pdv) if giacenza_pdv else 0,
+            'descforn': art.descforn,  # AGGIUNGI QUESTO
+        })
     
     # Export Excel
     excel_buffer = export_report_reparti(articoli_data, tipo_reparto='BAR')
     
-    response = HttpResponse(
-        excel_buffer.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    
     filename = f'bar_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
+    return xlsx_response(excel_buffer, filename)
 def report_inventario(request):
     """
     Report inventario (equivalente a r_StampaInv)
@@ -372,16 +322,11 @@ def report_inventario(request):
     
     # Filtra solo articoli con giacenze > 0
     articoli_data = []
-    for art in articoli_query[:300]:
-        # Filtra per EANPRINC = 1 (EAN principale)
-        giacenze = AllArticolo.objects.using('goldreport').filter(
-            codart=art.codart,
-            eanprinc=1
-        ).first()
-        
+    # Giacenze EAN principale (EANPRINC = 1) con una query per blocco di articoli
+    for art, giacenze in iter_with_giacenze(articoli_query):
         if giacenze:
-            giacenza_pdv = giacenze.giacenza_pdv or 0
-            giacenza_dep = giacenze.giacenza_deposito or 0
+            giacenza_pdv = giacenze['giacenza_pdv'] or 0
+            giacenza_dep = giacenze['giacenza_deposito'] or 0
             
             # Solo articoli con giacenze
             if giacenza_pdv > 0 or giacenza_dep > 0:
@@ -401,15 +346,8 @@ def report_inventario(request):
     if request.GET.get('export') == 'excel':
         excel_buffer = export_report_inventario(articoli_data, ccom=ccom)
         
-        response = HttpResponse(
-            excel_buffer.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        
         filename = f'inventario_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        return response
+        return xlsx_response(excel_buffer, filename)
     
     # Altrimenti render HTML
     context = {
@@ -447,19 +385,8 @@ def report_reparto(request, tipo):
     
     # Prepara dati
     articoli_data = []
-    for art in articoli_query:
-        # Filtro per lunghezza EAN (logica Access: Len([ean]) > 3 per alcune FAM)
-        if art.fam in ['8940', '8943', '8970']:
-            if not art.ean or len(str(art.ean)) <= 3:
-                continue
-        
-        # Filtra per EANPRINC = 1 (EAN principale)
-        giacenze = AllArticolo.objects.using('goldreport').filter(
-            codart=art.codart,
-            eanprinc=1
-        ).first()
-        
-        giacenza_pdv = giacenze.giacenza_pdv if giacenze else 0
+    for art, giacenze in iter_with_giacenze(_filtro_ean_famiglie(articoli_query)):
+        giacenza_pdv = giacenze['giacenza_pdv'] if giacenze else 0
         
         articoli_data.append({
             'sett': art.sett,
@@ -488,15 +415,8 @@ def report_reparto(request, tipo):
             include_barcode=True
         )
         
-        response = HttpResponse(
-            excel_buffer.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        
         filename = f'{tipo}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        return response
+        return xlsx_response(excel_buffer, filename)
     
     context = {
         'tipo': tipo.upper(),
@@ -512,18 +432,27 @@ def api_ccom_list(request):
     """
     search = request.GET.get('q', '')
     
-    ccom_query = MasterAssortimenti.objects.using('goldreport').values(
-        'ccom', 'descrccom'
-    ).distinct()
-    
-    if search:
-        ccom_query = ccom_query.filter(
-            Q(ccom__icontains=search) | Q(descrccom__icontains=search)
-        )
-    
-    ccom_list = list(ccom_query.order_by('ccom')[:50])
+    ccom_list = get_asso_facets().search_ccom(search, limit=50)
     
     return JsonResponse({'results': ccom_list})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def api_facets_refresh(request):
+    """
+    API per ricalcolare subito le liste filtro (dopo un aggiornamento dell'assortimento)
+    (solo utenti autenticati via JWT, come POST /api/plu/refresh/)
+    """
+    invalidate_asso_facets()
+    facets = get_asso_facets()
+    
+    return Response({
+        'ccom': len(facets.ccom_list),
+        'rep': len(facets.rep_list),
+        'srep': len(facets.srep_list),
+        'fam': len(facets.fam_list),
+    })
 def export_excel_reparti_view(request):
     """
     Export Excel ridotto per reparti (senza CCOM, Linea, Prezzo, IVA, Fornitore)
@@ -576,15 +505,10 @@ def export_excel_reparti_view(request):
     
     # Prepara dati
     articoli_data = []
-    for art in articoli_query[:500]:
-        giacenze = AllArticolo.objects.using('goldreport').filter(
-            codart=art.codart,
-            eanprinc=1
-        ).first()
-        
+    for art, giacenze in iter_with_giacenze(articoli_query):
         if giacenze:
-            giacenza_pdv = giacenze.giacenza_pdv or 0
-            giacenza_dep = giacenze.giacenza_deposito or 0
+            giacenza_pdv = giacenze['giacenza_pdv'] or 0
+            giacenza_dep = giacenze['giacenza_deposito'] or 0
         else:
             giacenza_pdv = 0
             giacenza_dep = 0
@@ -605,12 +529,5 @@ def export_excel_reparti_view(request):
     # Genera Excel
     excel_buffer = export_report_reparti(articoli_data, tipo_reparto='Reparti')
     
-    response = HttpResponse(
-        excel_buffer.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    
     filename = f'reparti_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
\ No newline at end of file
+    return xlsx_response(excel_buffer, filename)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ImportBatch, ImportRow, GoldTableSnapshot, IntermediateAggPrAcq, IntermediateAggiornaEan, IntermediateAggiornamentiVari
+from .models import ImportBatch, ImportRow, GoldTableSnapshot, GoldSyncState, GoldRossetto, GoldEan, GoldOrdineRossetto, IntermediateAggPrAcq, IntermediateAggiornaEan, IntermediateAggiornamentiVari
 
 
 @admin.register(ImportBatch)
@@ -21,6 +21,29 @@ class GoldTableSnapshotAdmin(admin.ModelAdmin):
     date_hierarchy = 'synced_at'
 
 
+@admin.register(GoldRossetto)
+class GoldRossettoAdmin(admin.ModelAdmin):
+    list_display = ('codartfo', 'codart', 'descrart', 'stato', 'pracq', 'ccom')
+    search_fields = ('codartfo', 'codart', 'descrart')
+
+
+@admin.register(GoldEan)
+class GoldEanAdmin(admin.ModelAdmin):
+    list_display = ('ean', 'codart')
+    search_fields = ('ean', 'codart')
+
+
+@admin.register(GoldOrdineRossetto)
+class GoldOrdineRossettoAdmin(admin.ModelAdmin):
+    list_display = ('codartfo', 'colliord', 'data_ordine', 'data_consegna', 'dcdcexcde')
+    search_fields = ('codartfo',)
+
+
+@admin.register(GoldSyncState)
+class GoldSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('source_table', 'synced_at', 'mode', 'rows_count', 'inserted', 'updated', 'removed')
+
+
 @admin.register(IntermediateAggPrAcq)
 class IntermediateAggPrAcqAdmin(admin.ModelAdmin):
     list_display = ('batch', 'cod_art_fo', 'codart', 'az', 'ros_pracq', 'cidac_prezzo', 'rep', 'srep', 'ccom')
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from .models import ImportBatch, ImportRow
+from .utils import ROW_HASH_FIELDS, elab_row_hash
+
+
+def _rows_by_codartfo(batch: ImportBatch) -> Dict[str, Dict[str, Any]]:
+    """CodArtFo -> prima riga del batch con quel codice (valori dei campi di dominio + row_hash)."""
+    out: Dict[str, Dict[str, Any]] = {}
+    qs = ImportRow.objects.filter(batch=batch).values('line_number', 'row_hash', *ROW_HASH_FIELDS)
+    for vals in qs.iterator(chunk_size=2000):
+        key = (vals['cod_art_fo'] or '').strip()
+        if not key or key in out:
+            continue
+        # Righe importate prima dell'introduzione di row_hash
+        if not vals['row_hash']:
+            vals['row_hash'] = elab_row_hash(vals)
+        out[key] = vals
+    return out
+
+
+def diff_batches(prev: ImportBatch, batch: ImportBatch) -> Dict[str, Any]:
+    """Differenze fra due import dello stesso fornitore, per CodArtFo.
+
+    Ritorna 'added' e 'removed' (righe presenti in uno solo dei due batch),
+    'changed' (righe con hash diverso, con l'elenco dei campi cambiati) e il
+    numero di righe 'unchanged'.
+    """
+    old = _rows_by_codartfo(prev)
+    new = _rows_by_codartfo(batch)
+
+    added = [r for k, r in new.items() if k not in old]
+    removed = [r for k, r in old.items() if k not in new]
+    changed = []
+    unchanged = 0
+    for k, r in new.items():
+        o = old.get(k)
+        if o is None:
+            continue
+        if o['row_hash'] == r['row_hash']:
+            unchanged += 1
+            continue
+        changes = [
+            {'field': f, 'old': o[f], 'new': r[f]}
+            for f in ROW_HASH_FIELDS
+            if o[f] != r[f]
+        ]
+        changed.append({'row': r, 'changes': changes})
+
+    return {
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+        'unchanged': unchanged,
+    }
@@ -0,0 +1,242 @@
+"""Benchmark della pipeline importelab su dati sintetici (vedi manage.py bench_importelab).
+
+Genera file .elab e righe Gold sintetiche di dimensione configurabile ed
+esegue le fasi della pipeline (parsing, import, sync Gold, query intermedie,
+PDF, purge) misurando tempo, numero di query e picco di memoria Python.
+Da eseguire solo su un DB locale SQLite (project_core.settings.bench): la
+sync sostituisce le snapshot Gold con i dati sintetici.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List
+from unittest import mock
+
+import gc
+import glob
+import os
+import platform
+import random
+import time
+import tracemalloc
+
+import django
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.utils import timezone
+
+from . import goldsync
+from .goldsync import ALL_COLUMNS, SYNC_BATCH_SIZE, sync_gold_tables
+from .intermediate import rebuild_intermediate_queries
+from .pdfreports import PDF_REPORTS, cached_report_pdf, pdf_cache_dir
+from .purge import purge_batches
+from .utils import parse_elab_text
+
+BENCH_SUPPLIER_FILE = '{week:02d}0126_080000_LBENCH.elab'
+
+
+# -----------------------------
+# Generatori di dati sintetici
+# -----------------------------
+
+def _codartfo(i: int) -> str:
+    return f"{i:07d}"
+
+
+def elab_line(rnd: random.Random, i: int, changed: bool = False) -> str:
+    """Una riga .elab (CodArtFo;Descrizione;Iva;PrzAcq;Campo5;PzXCrt;CrtXstr;StrXplt;TotColli;Ean)."""
+    prz = Decimal(rnd.randint(50, 99999)) / 100
+    if changed:
+        prz += Decimal('0.10')
+    return ';'.join([
+        _codartfo(i),
+        f"ARTICOLO SINTETICO {i}",
+        str(rnd.choice((4, 10, 22))),
+        str(prz).replace('.', ','),
+        '0',
+        str(rnd.choice((6, 12, 24))),
+        str(rnd.choice((4, 5, 8))),
+        str(rnd.choice((5, 6))),
+        str(rnd.randint(1, 50)),
+        str(8000000000000 + i),
+    ])
+
+
+def generate_elab(size: int, seed: int = 0, changed_every: int = 0) -> bytes:
+    """Contenuto di un file .elab di `size` righe; con `changed_every` una riga ogni N ha un prezzo diverso."""
+    rnd = random.Random(seed)
+    lines = [elab_line(rnd, i, changed=bool(changed_every) and i % changed_every == 0) for i in range(size)]
+    return ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+
+def gold_rows(table: str, size: int, seed: int = 0, version: int = 0) -> Iterator[Dict[str, Any]]:
+    """Righe sintetiche della tabella Gold `table` (circa 90% degli articoli coincide con l'.elab).
+
+    A ogni `version` successiva cambia PRACQ di una riga di t_Rossetto su cento.
+    """
+    rnd = random.Random(f"{seed}:{table}")
+    if table == 'dbo.t_Rossetto':
+        for i in range(size):
+            pracq = rnd.randint(50, 99999) / 100
+            if version and i % 100 == 0:
+                pracq += version
+            yield {
+                'CODARTFO': _codartfo(i if i % 10 else size + i),
+                'CODART': str(100000 + i),
+                'DESCRART': f"ARTICOLO SINTETICO {i}",
+                'STATO': 'A',
+                'DTAAGGIO': f"2026-01-{i % 28 + 1:02d}",
+                'PRACQ': f"{pracq:.4f}",
+                'IVA': rnd.choice((4, 10, 22)),
+                'SETT': str(i % 5),
+                'REP': str(i % 20),
+                'SREP': str(i % 50),
+                'CCOM': str(i % 300),
+                'DESCRCCOM': f"FORNITORE {i % 300}",
+                'PZXCRT': rnd.choice((6, 12, 24)),
+                'STRATO': rnd.choice((4, 5, 8)),
+                'PALLET': rnd.choice((5, 6)),
+                'ETICEAN': i % 2,
+            }
+    elif table == 'dbo.t_t_Ean':
+        for i in range(size):
+            if i % 7:
+                yield {'CODART': str(100000 + i), 'EAN': str(8000000000000 + i), 'EANA': ''}
+    elif table == 'dbo.t_OrdiniRossetto':
+        for i in range(max(1, size // 10)):
+            yield {
+                'CODARTFO': _codartfo(i),
+                'COLLIORD': rnd.randint(1, 99),
+                'DATA_ORDINE': '05/02/2026',
+                'DATA_CONSEGNA': '09/02/2026',
+                'DCDCEXCDE': f"DCDCEX{i:08d}",
+            }
+
+
+@contextmanager
+def synthetic_gold_source(size: int, seed: int = 0, version: int = 0):
+    """Sostituisce la lettura da goldreport con le righe di gold_rows (stessi batch di fetchmany)."""
+    def _batches(table_name: str, limit: int = 0, batch_size: int = SYNC_BATCH_SIZE, order_by=()):
+        rows = gold_rows(table_name, size, seed, version)
+        if order_by:
+            rows = sorted(rows, key=lambda r: tuple(
+                str(v or '') for v in (r.values() if order_by == ALL_COLUMNS else (r.get(c) for c in order_by))
+            ))
+        batch: List[Dict[str, Any]] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    with mock.patch.object(goldsync, '_iter_row_batches', _batches):
+        yield
+
+
+# -----------------------------
+# Misura
+# -----------------------------
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(stage: str, fn: Callable[[], Any], trace_memory: bool = True) -> tuple[Dict[str, Any], Any]:
+    """Esegue `fn` e ne misura tempo, query sul DB default e picco di memoria allocata da Python.
+
+    tracemalloc rallenta sensibilmente l'esecuzione: con `trace_memory=False`
+    i tempi sono più realistici e 'peak_memory_mb' è None.
+    """
+    gc.collect()
+    counter = _QueryCounter()
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with connections['default'].execute_wrapper(counter):
+            started = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - started
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return {
+        'stage': stage,
+        'seconds': round(elapsed, 4),
+        'queries': counter.count,
+        'peak_memory_mb': round(peak / (1024 * 1024), 2) if peak is not None else None,
+    }, result
+
+
+# -----------------------------
+# Pipeline
+# -----------------------------
+
+def run_size(size: int, seed: int = 0, log: Callable[[str], None] | None = None,
+             trace_memory: bool = True) -> Dict[str, Any]:
+    """Esegue tutte le fasi per una dimensione e ritorna le misure."""
+    from .views import _ingest_elab_upload
+
+    stages: List[Dict[str, Any]] = []
+
+    def step(stage: str, fn: Callable[[], Any]) -> Any:
+        m, result = measure(stage, fn, trace_memory)
+        stages.append(m)
+        if log:
+            mem = f", {m['peak_memory_mb']} MB" if trace_memory else ''
+            log(f"  {stage}: {m['seconds']} s, {m['queries']} query{mem}")
+        return result
+
+    content = generate_elab(size, seed)
+    step('parse_elab_text', lambda: len(parse_elab_text(content.decode('utf-8'))))
+    batch = step('ingest_elab', lambda: _ingest_elab_upload(
+        SimpleUploadedFile(BENCH_SUPPLIER_FILE.format(week=1), content)))
+
+    with synthetic_gold_source(size, seed, version=0):
+        step('sync_gold_full', lambda: sync_gold_tables(incremental=False))
+    with synthetic_gold_source(size, seed, version=1):
+        step('sync_gold_incremental', lambda: sync_gold_tables(incremental=True))
+
+    step('rebuild_intermediate', lambda: rebuild_intermediate_queries(batch))
+
+    # Secondo import dello stesso fornitore con il 2% di righe cambiate: riuso dei risultati
+    batch2 = _ingest_elab_upload(SimpleUploadedFile(
+        BENCH_SUPPLIER_FILE.format(week=2), generate_elab(size, seed, changed_every=50)))
+    step('rebuild_intermediate_reuse', lambda: rebuild_intermediate_queries(batch2))
+
+    for path in glob.glob(os.path.join(pdf_cache_dir(), '*.pdf')):
+        os.remove(path)
+    for report in PDF_REPORTS:
+        step(f'pdf_{report}', lambda report=report: cached_report_pdf(report, batch))
+
+    step('purge_batches', lambda: purge_batches([batch.id, batch2.id], delete_files=True))
+    return {'size': size, 'stages': stages}
+
+
+def run_benchmark(sizes: List[int], seed: int = 0, log: Callable[[str], None] | None = None,
+                  trace_memory: bool = True) -> Dict[str, Any]:
+    """Esegue il benchmark per ogni dimensione e ritorna il report (serializzabile in JSON)."""
+    results = []
+    for size in sizes:
+        if log:
+            log(f"{size} righe")
+        results.append(run_size(size, seed, log, trace_memory))
+    return {
+        'generated_at': timezone.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connections['default'].vendor,
+        'seed': seed,
+        'trace_memory': trace_memory,
+        'results': results,
+    }
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import threading
+
+from django.db.models import Max
+
+from .models import GoldEan, GoldRossetto, GoldSyncState
+
+# Campi di dbo.t_Rossetto (tabella tipizzata) tenuti in memoria
+ROSSETTO_FIELDS = (
+    'codartfo', 'codart', 'codart_norm', 'descrart', 'stato', 'dtaaggio', 'pracq', 'pracq_raw', 'iva',
+    'sett', 'rep', 'srep', 'ccom', 'descrccom', 'pzxcrt', 'strato', 'pallet', 'eticean',
+)
+
+
+def canonical_codart(value: Any) -> str:
+    """Forma canonica di un CODART, usata come chiave unica di confronto fra sorgenti.
+
+    Equivale alle varianti storiche (strip, zeri iniziali tolti, int(float())):
+    "00123", "123" e "123.0" diventano tutti "123". Il caso comune (solo cifre)
+    non passa dal parsing float.
+    """
+    if value is None:
+        return ''
+    s = str(value).strip()
+    if not s:
+        return ''
+    if s.isdigit():
+        return s.lstrip('0') or '0'
+    try:
+        f = float(s)
+    except ValueError:
+        return s.lstrip('0') or '0'
+    if f.is_integer():
+        return str(int(f))
+    return s.lstrip('0') or '0'
+
+
+class GoldLookupIndex:
+    """Indici in memoria su t_Rossetto (per CODARTFO e CODART) e t_t_Ean, per una generazione di sync."""
+
+    def __init__(self, generation: str):
+        self.generation = generation
+        self.by_codartfo: Dict[str, Dict[str, Any]] = {}
+        self.by_codart: Dict[str, Dict[str, Any]] = {}  # chiave: canonical_codart
+        self.eans: set[str] = set()
+
+    def build(self) -> 'GoldLookupIndex':
+        # A parità di chiave vince la riga con id maggiore
+        qs = GoldRossetto.objects.order_by('id').values(*ROSSETTO_FIELDS)
+        for row in qs.iterator(chunk_size=5000):
+            if row['codartfo']:
+                self.by_codartfo[row['codartfo']] = row
+            if row['codart_norm']:
+                self.by_codart[row['codart_norm']] = row
+        self.eans = set(GoldEan.objects.exclude(ean='').values_list('ean', flat=True).iterator(chunk_size=5000))
+        return self
+
+    def rossetto_by_codartfo(self, codartfo: Any) -> Dict[str, Any] | None:
+        return self.by_codartfo.get(str(codartfo or '').strip())
+
+    def rossetto_by_codart(self, codart: Any) -> Dict[str, Any] | None:
+        return self.by_codart.get(canonical_codart(codart))
+
+    def has_ean(self, ean: Any) -> bool:
+        return str(ean or '').strip() in self.eans
+
+
+_lock = threading.Lock()
+_current: GoldLookupIndex | None = None
+
+
+def current_generation() -> str:
+    """Generazione delle snapshot Gold: istante dell'ultima sync completata (condiviso fra processi)."""
+    last = GoldSyncState.objects.aggregate(last=Max('synced_at'))['last']
+    return last.isoformat() if last else ''
+
+
+def get_gold_index() -> GoldLookupIndex:
+    """Return the process-wide index for the current sync generation, building it if needed."""
+    global _current
+    generation = current_generation()
+    index = _current
+    if index is not None and index.generation == generation:
+        return index
+    with _lock:
+        if _current is None or _current.generation != generation:
+            _current = GoldLookupIndex(generation).build()
+        return _current
+
+
+def invalidate_gold_index() -> None:
+    """Drop the cached index (chiamata a fine sync; gli altri processi vedono la nuova generazione)."""
+    global _current
+    with _lock:
+        _current = None
@@ -1,17 +1,31 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
 
 import base64
 import datetime as _dt
 import decimal
+import hashlib
+import json
+import pickle
+import tempfile
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pyodbc
 from django.conf import settings
-from django.db import transaction
+from django.db import router, transaction
 
-from .models import GoldTableSnapshot
+from .goldindex import canonical_codart, invalidate_gold_index
+from .intermediate import _to_decimal, _to_int
+from .models import (
+    GoldEan,
+    GoldOrdineRossetto,
+    GoldRossetto,
+    GoldSyncState,
+    GoldTableSnapshot,
+)
 from django.db import connections
 
 GOLD_TABLES: Tuple[str, str, str] = (
@@ -20,6 +34,20 @@ GOLD_TABLES: Tuple[str, str, str] = (
     'dbo.t_t_Ean',
 )
 
+# Colonne che identificano una riga Gold (sync incrementale).
+# Senza chiave naturale la riga è identificata dal suo hash: una modifica
+# diventa quindi rimozione + inserimento.
+GOLD_TABLE_KEYS: Dict[str, Tuple[str, ...]] = {
+    'dbo.t_OrdiniRossetto': (),
+    'dbo.t_Rossetto': ('CODARTFO',),
+    'dbo.t_t_Ean': ('CODART', 'EAN', 'EANA'),
+}
+
+SYNC_BATCH_SIZE = 1000
+
+# order_by di _iter_row_batches: tutte le colonne, nell'ordine della tabella
+ALL_COLUMNS: Tuple[str, ...] = ('*',)
+
 
 def _json_safe(value: Any) -> Any:
     """Convert common SQL Server/pyodbc types to JSON-serializable values."""
@@ -36,47 +64,454 @@ def _json_safe(value: Any) -> Any:
         return str(value)
     return value
 
-def _fetch_rows(table_name: str, limit: int = 0) -> List[Dict[str, Any]]:
-    """Fetch rows from SQL Server Gold table using Django connection."""
+def _iter_row_batches(
+    table_name: str,
+    limit: int = 0,
+    batch_size: int = SYNC_BATCH_SIZE,
+    order_by: Tuple[str, ...] = (),
+) -> Iterator[List[Dict[str, Any]]]:
+    """Stream rows from a Gold table in fetchmany() batches of JSON-safe dicts.
+
+    Al massimo `batch_size` righe sono in memoria alla volta. Con `order_by`
+    le righe arrivano ordinate per quelle colonne (duplicati contigui); con
+    ALL_COLUMNS per tutte le colonne (posizioni 1..n lette prima dallo schema).
+    """
     sql = f"SELECT * FROM {table_name}"
     if limit and limit > 0:
         sql = f"SELECT TOP ({limit}) * FROM {table_name}"
 
     with connections['goldreport'].cursor() as cur:
+        if order_by == ALL_COLUMNS:
+            cur.execute(f"SELECT * FROM {table_name} WHERE 1 = 0")
+            order_by = tuple(str(i) for i in range(1, len(cur.description or ()) + 1))
+        if order_by:
+            sql += " ORDER BY " + ", ".join(order_by)
         cur.execute(sql)
         columns = [col[0] for col in cur.description] if cur.description else []
-        rows = cur.fetchall()
+        while True:
+            chunk = cur.fetchmany(batch_size)
+            if not chunk:
+                break
+            yield [{columns[i]: _json_safe(r[i]) for i in range(len(columns))} for r in chunk]
+
+
+def _fetch_rows(table_name: str, limit: int = 0) -> List[Dict[str, Any]]:
+    """Fetch rows from SQL Server Gold table using Django connection."""
+    return [row for batch in _iter_row_batches(table_name, limit=limit) for row in batch]
+
+
+def _row_hash(row: Dict[str, Any]) -> str:
+    """Hash stabile del payload (indipendente dall'ordine delle colonne)."""
+    data = json.dumps(row, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class _RowKeyer:
+    """Calcola la chiave naturale delle righe di una tabella, batch dopo batch.
+
+    Le colonne chiave sono risolte sulla prima riga. Le righe arrivano ordinate
+    per chiave (GOLD_TABLE_KEYS), quindi i duplicati di una chiave sono
+    contigui: il gruppo viene trattenuto finché la chiave cambia e i suffissi
+    (#1, #2, ...) sono assegnati in ordine di hash della riga, non di arrivo.
+    Chiavi e checksum non dipendono quindi dall'ordine in cui Gold restituisce
+    le righe, e in memoria c'è solo il gruppo corrente. Senza chiave naturale
+    la chiave è l'hash stesso (i duplicati sono righe identiche,
+    intercambiabili) e le righe sono ordinate per tutte le colonne.
+    Il confronto fra righe segue la collation di SQL Server usata dall'ORDER BY:
+    maiuscole/minuscole e spazi finali non contano.
+    """
+
+    def __init__(self, table: str):
+        self.table = table
+        self.key_cols: Tuple[str, ...] | None = None
+        self._checksum = 0
+
+    @property
+    def order_by(self) -> Tuple[str, ...]:
+        """Colonne per l'ORDER BY della lettura da Gold (tutte senza chiave naturale)."""
+        return GOLD_TABLE_KEYS.get(self.table) or ALL_COLUMNS
+
+    @staticmethod
+    def _collate(values: Iterable[Any]) -> str:
+        return '|'.join('' if v is None else str(v).rstrip() for v in values).casefold()
+
+    def _base_key(self, row: Dict[str, Any], row_hash: str) -> str:
+        if self.key_cols is None:
+            present = {str(k).upper(): k for k in row.keys()}
+            self.key_cols = tuple(present[c] for c in GOLD_TABLE_KEYS.get(self.table, ()) if c in present)
+        if not self.key_cols:
+            return row_hash
+        return self._collate(row.get(c) for c in self.key_cols)
+
+    def _group_id(self, row: Dict[str, Any], base: str) -> str:
+        """Valore dell'ORDER BY della riga: righe con lo stesso valore arrivano contigue."""
+        return base if self.key_cols else self._collate(row.values())
+
+    def _assign(self, group: List[Tuple[str, str, Dict[str, Any]]]) -> List[Tuple[Dict[str, Any], str, str]]:
+        out = []
+        seen: Dict[str, int] = {}
+        for base, row_hash, row in sorted(group, key=lambda g: (g[0], g[1])):
+            n = seen.get(base, 0)
+            seen[base] = n + 1
+            key = f"{base}#{n}" if n else base
+            digest = hashlib.sha1(f"{key}:{row_hash}".encode('utf-8')).hexdigest()
+            self._checksum = (self._checksum + int(digest, 16)) % (1 << 160)
+            out.append((row, key, row_hash))
+        return out
+
+    def keyed(self, batches: Iterable[List[Dict[str, Any]]]) -> Iterator[List[Tuple[Dict[str, Any], str, str]]]:
+        """Batch di (riga, chiave, hash) con le chiavi assegnate."""
+        group: List[Tuple[str, str, Dict[str, Any]]] = []
+        group_id = None
+        for rows in batches:
+            out = []
+            for row in rows:
+                row_hash = _row_hash(row)
+                base = self._base_key(row, row_hash)
+                gid = self._group_id(row, base)
+                if group and gid != group_id:
+                    out.extend(self._assign(group))
+                    group = []
+                group_id = gid
+                group.append((base, row_hash, row))
+            if out:
+                yield out
+        if group:
+            yield self._assign(group)
+
+    @property
+    def checksum(self) -> str:
+        return f"{self._checksum:040x}"
+
+
+def _text(value: Any, max_length: int = 0) -> str:
+    s = '' if value is None or value == '' else str(value)
+    return s[:max_length] if max_length else s
+
+
+def _code(value: Any, max_length: int) -> str:
+    """Codice senza spazi ai bordi, troncato alla lunghezza della colonna."""
+    return _text(value).strip()[:max_length]
+
+
+# Ogni valore è troncato alla max_length del campo: su SQL Server un valore
+# più lungo farebbe fallire l'intera transazione della tabella.
+
+def _typed_rossetto(key: str, row: Dict[str, Any]) -> GoldRossetto:
+    g = {str(k).upper(): v for k, v in row.items()}.get
+    codart = _code(g('CODART'), 50)
+    return GoldRossetto(
+        row_key=key,
+        codartfo=_code(g('CODARTFO'), 50),
+        codart=codart,
+        codart_norm=canonical_codart(codart)[:50],
+        descrart=_text(g('DESCRART'), 255),
+        stato=_text(g('STATO'), 32),
+        dtaaggio=_text(g('DTAAGGIO'), 32),
+        pracq=_to_decimal(g('PRACQ')),
+        pracq_raw=_text(g('PRACQ'), 64),
+        iva=_to_int(g('IVA')),
+        sett=_text(g('SETT'), 32),
+        rep=_text(g('REP'), 32),
+        srep=_text(g('SREP'), 32),
+        ccom=_text(g('CCOM'), 32),
+        descrccom=_text(g('DESCRCCOM'), 255),
+        pzxcrt=_to_int(g('PZXCRT')),
+        strato=_to_int(g('STRATO')),
+        pallet=_to_int(g('PALLET')),
+        eticean=_to_int(g('ETICEAN')),
+    )
+
+
+def _typed_ean(key: str, row: Dict[str, Any]) -> GoldEan:
+    g = {str(k).upper(): v for k, v in row.items()}.get
+    eana = g('EANA')
+    return GoldEan(
+        row_key=key,
+        codart=_code(g('CODART'), 50),
+        ean=_code(eana if eana is not None else g('EAN'), 32),
+    )
+
+
+def _typed_ordine(key: str, row: Dict[str, Any]) -> GoldOrdineRossetto:
+    g = {str(k).upper(): v for k, v in row.items()}.get
+    return GoldOrdineRossetto(
+        row_key=key,
+        codartfo=_code(g('CODARTFO'), 50),
+        colliord=_code(g('COLLIORD'), 32),
+        data_ordine=_code(g('DATA_ORDINE'), 32),
+        data_consegna=_code(g('DATA_CONSEGNA'), 32),
+        dcdcexcde=_code(g('DCDCEXCDE'), 64),
+    )
 
-    out: List[Dict[str, Any]] = []
-    for r in rows:
-        row_dict = {columns[i]: r[i] for i in range(len(columns))}
-        out.append({k: _json_safe(v) for k, v in row_dict.items()})
-    return out
 
+# Tabelle tipizzate mantenute in parallelo alle snapshot (source_table -> modello, costruttore)
+TYPED_SNAPSHOTS = {
+    'dbo.t_OrdiniRossetto': (GoldOrdineRossetto, _typed_ordine),
+    'dbo.t_Rossetto': (GoldRossetto, _typed_rossetto),
+    'dbo.t_t_Ean': (GoldEan, _typed_ean),
+}
 
-def sync_gold_tables(limit: int = 0) -> Dict[str, Dict[str, Any]]:
-    """Synchronize configured Gold tables into local SQLite snapshots (Strategy B)."""
+
+def _delete_typed(table: str, keys: List[str]) -> None:
+    model, _ = TYPED_SNAPSHOTS[table]
+    for i in range(0, len(keys), SYNC_BATCH_SIZE):
+        model.objects.filter(row_key__in=keys[i:i + SYNC_BATCH_SIZE]).delete()
+
+
+def rebuild_typed_snapshot(table: str) -> int:
+    """Ricostruisce la tabella tipizzata di `table` a partire dai payload delle snapshot."""
+    model, build = TYPED_SNAPSHOTS[table]
+    count = 0
+    with transaction.atomic():
+        model.objects.all().delete()
+        objs = []
+        qs = GoldTableSnapshot.objects.filter(source_table=table).values_list('row_key', 'payload')
+        for key, payload in qs.iterator(chunk_size=SYNC_BATCH_SIZE):
+            objs.append(build(key, payload or {}))
+            if len(objs) >= SYNC_BATCH_SIZE:
+                model.objects.bulk_create(objs)
+                count += len(objs)
+                objs = []
+        if objs:
+            model.objects.bulk_create(objs)
+            count += len(objs)
+    return count
+
+
+KeyedBatches = Iterable[List[Tuple[Dict[str, Any], str, str]]]
+
+
+def _sync_table_full(table: str, batches: KeyedBatches, preview: List) -> Dict[str, int]:
+    model, build = TYPED_SNAPSHOTS[table]
+    inserted = 0
+    with transaction.atomic():
+        removed, _ = GoldTableSnapshot.objects.filter(source_table=table).delete()
+        model.objects.all().delete()
+        for keyed in batches:
+            if not preview:
+                preview.extend(row for row, _, _ in keyed[:5])
+            objs = []
+            typed = []
+            for row, key, row_hash in keyed:
+                objs.append(GoldTableSnapshot(source_table=table, payload=row, row_key=key, row_hash=row_hash))
+                typed.append(build(key, row))
+            GoldTableSnapshot.objects.bulk_create(objs, batch_size=SYNC_BATCH_SIZE)
+            model.objects.bulk_create(typed, batch_size=SYNC_BATCH_SIZE)
+            inserted += len(objs)
+    return {'inserted': inserted, 'updated': 0, 'removed': removed, 'unchanged': 0}
+
+
+def _sync_table_incremental(table: str, batches: KeyedBatches) -> Dict[str, int]:
+    """Upsert per chiave: inserisce le righe nuove, aggiorna quelle con hash diverso, rimuove le assenti.
+
+    In memoria restano solo (chiave, id, hash) delle righe locali e un batch Gold alla volta.
+    """
+    existing: Dict[str, Tuple[int, str]] = {}
+    stale_ids: List[int] = []
+    for pk, row_key, row_hash in (
+        GoldTableSnapshot.objects.filter(source_table=table)
+        .values_list('id', 'row_key', 'row_hash')
+        .iterator(chunk_size=5000)
+    ):
+        # Righe senza chiave (snapshot pre-incrementale) o chiavi duplicate: da eliminare
+        if not row_key or row_key in existing:
+            stale_ids.append(pk)
+        else:
+            existing[row_key] = (pk, row_hash)
+
+    model, build = TYPED_SNAPSHOTS[table]
+    inserted = updated = unchanged = 0
+    with transaction.atomic():
+        for keyed in batches:
+            to_create: List[GoldTableSnapshot] = []
+            to_update: List[GoldTableSnapshot] = []
+            typed = []
+            for row, key, row_hash in keyed:
+                current = existing.pop(key, None)
+                if current is None:
+                    to_create.append(GoldTableSnapshot(source_table=table, payload=row, row_key=key, row_hash=row_hash))
+                elif current[1] != row_hash:
+                    to_update.append(GoldTableSnapshot(id=current[0], payload=row, row_hash=row_hash))
+                else:
+                    unchanged += 1
+                    continue
+                typed.append(build(key, row))
+            if to_update:
+                GoldTableSnapshot.objects.bulk_update(to_update, ['payload', 'row_hash'], batch_size=SYNC_BATCH_SIZE)
+            if to_create:
+                GoldTableSnapshot.objects.bulk_create(to_create, batch_size=SYNC_BATCH_SIZE)
+            if typed:
+                _delete_typed(table, [t.row_key for t in typed])
+                model.objects.bulk_create(typed, batch_size=SYNC_BATCH_SIZE)
+            inserted += len(to_create)
+            updated += len(to_update)
+
+        # Ciò che resta in existing non è più presente su Gold
+        _delete_typed(table, list(existing.keys()))
+        stale_ids.extend(pk for pk, _ in existing.values())
+        for i in range(0, len(stale_ids), SYNC_BATCH_SIZE):
+            GoldTableSnapshot.objects.filter(id__in=stale_ids[i:i + SYNC_BATCH_SIZE]).delete()
+
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'removed': len(stale_ids),
+        'unchanged': unchanged,
+    }
+
+
+def _spool(batches: KeyedBatches, spool, preview: List) -> int:
+    """Copia i batch con chiave su un file temporaneo; ritorna il numero di righe."""
+    count = 0
+    for keyed in batches:
+        if not preview:
+            preview.extend(row for row, _, _ in keyed[:5])
+        pickle.dump(keyed, spool, protocol=pickle.HIGHEST_PROTOCOL)
+        count += len(keyed)
+    return count
+
+
+def _replay(spool) -> KeyedBatches:
+    spool.seek(0)
+    while True:
+        try:
+            yield pickle.load(spool)
+        except EOFError:
+            return
+
+
+def _sync_one_table(table: str, limit: int, incremental: bool) -> Dict[str, Any]:
+    """Sync di una singola tabella Gold: lettura in streaming e scrittura locale nella stessa transazione.
+
+    In modalità incrementale le righe Gold (con chiave e hash) passano da un
+    file temporaneo: se checksum e numero di righe coincidono con l'ultima
+    sync le snapshot locali non vengono né lette né scritte, altrimenti il
+    file è riletto per l'upsert. Gold è letto una sola volta e la memoria
+    resta limitata a un batch.
+    """
+    started = time.perf_counter()
+    keyer = _RowKeyer(table)
+    batches = keyer.keyed(_iter_row_batches(table, limit=limit, order_by=keyer.order_by))
+    preview: List[Dict[str, Any]] = []
+
+    if incremental:
+        with tempfile.TemporaryFile() as spool:
+            fetched = _spool(batches, spool, preview)
+            state = GoldSyncState.objects.filter(source_table=table).first()
+            if state and state.checksum == keyer.checksum and state.rows_count == fetched:
+                counts = {'inserted': 0, 'updated': 0, 'removed': 0, 'unchanged': fetched}
+            else:
+                counts = _sync_table_incremental(table, _replay(spool))
+        changed = counts['inserted'] or counts['updated'] or counts['removed']
+        mode = 'incremental' if changed else 'unchanged'
+    else:
+        counts = _sync_table_full(table, batches, preview)
+        mode = 'full'
+
+    rows_fetched = counts['inserted'] + counts['updated'] + counts['unchanged']
+
+    # Tabella tipizzata disallineata (es. prima sync dopo la migrazione): ricostruzione completa
+    model, _ = TYPED_SNAPSHOTS[table]
+    if model.objects.count() != rows_fetched:
+        rebuild_typed_snapshot(table)
+
+    GoldSyncState.objects.update_or_create(
+        source_table=table,
+        defaults={
+            'checksum': keyer.checksum,
+            'rows_count': rows_fetched,
+            'mode': mode,
+            'inserted': counts['inserted'],
+            'updated': counts['updated'],
+            'removed': counts['removed'],
+        },
+    )
+
+    return {
+        'rows_fetched': rows_fetched,
+        'preview': preview,
+        'mode': mode,
+        'seconds': round(time.perf_counter() - started, 2),
+        **counts,
+    }
+
+
+def _sync_one_table_in_thread(table: str, limit: int, incremental: bool) -> Dict[str, Any]:
+    # Ogni thread ha le sue connessioni Django (goldreport e locale): vanno chiuse a fine lavoro
+    try:
+        return _sync_one_table(table, limit, incremental)
+    finally:
+        connections.close_all()
+
+
+def _parallel_workers() -> int:
+    """Numero di tabelle sincronizzate in parallelo (1 = sequenziale).
+
+    SQLite non gestisce scritture concorrenti: con DB locale SQLite la sync resta sequenziale.
+    """
+    if not getattr(settings, 'GOLD_SYNC_PARALLEL', True):
+        return 1
+    if connections[router.db_for_write(GoldTableSnapshot)].vendor == 'sqlite':
+        return 1
+    return max(1, min(len(GOLD_TABLES), getattr(settings, 'GOLD_SYNC_WORKERS', len(GOLD_TABLES))))
+
+
+def sync_gold_tables(
+    limit: int = 0,
+    incremental: bool | None = None,
+    progress: Callable[[int, str], None] | None = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Synchronize configured Gold tables into local snapshots.
+
+    Oltre alla snapshot JSON (usata per l'anteprima) viene mantenuta la
+    tabella tipizzata corrispondente (TYPED_SNAPSHOTS), usata per i lookup.
+    Le righe sono lette a batch (fetchmany) e scritte batch per batch, quindi
+    la memoria resta limitata a SYNC_BATCH_SIZE righe per tabella.
+    In modalità incrementale (default, settings.GOLD_SYNC_INCREMENTAL) vengono
+    scritte solo le righe cambiate; una tabella con checksum e numero di righe
+    uguali all'ultima sync non tocca le snapshot locali.
+    Le tabelle sono indipendenti: con GOLD_SYNC_PARALLEL (default) ognuna è
+    sincronizzata in un thread con le proprie connessioni; le scritture di una
+    tabella restano in un'unica transazione del suo thread.
+    `progress(percentuale, messaggio)` viene chiamata al termine di ogni tabella.
+    Ogni riepilogo riporta anche la durata della tabella ('seconds').
+    """
     if limit is None:
         limit = 0
+    if incremental is None:
+        incremental = getattr(settings, 'GOLD_SYNC_INCREMENTAL', True)
 
     summaries: Dict[str, Dict[str, Any]] = {}
 
-    for table in GOLD_TABLES:
-        rows = _fetch_rows(table, limit=limit)
-        preview = rows[:5]
-
-        with transaction.atomic():
-            GoldTableSnapshot.objects.filter(source_table=table).delete()
-            objs = [GoldTableSnapshot(source_table=table, payload=row) for row in rows]
-            if objs:
-                GoldTableSnapshot.objects.bulk_create(objs, batch_size=1000)
+    def _done(table: str, summary: Dict[str, Any]) -> None:
+        summaries[table] = summary
+        if progress:
+            progress(int(100 * len(summaries) / len(GOLD_TABLES)), f"Sincronizzata {table} ({summary['seconds']} s)")
 
-        summaries[table] = {
-            'rows_fetched': len(rows),
-            'preview': preview,
-        }
+    workers = _parallel_workers()
+    if workers == 1:
+        for table in GOLD_TABLES:
+            _done(table, _sync_one_table(table, limit, incremental))
+    else:
+        errors: List[Exception] = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='goldsync') as pool:
+            futures = {
+                pool.submit(_sync_one_table_in_thread, table, limit, incremental): table
+                for table in GOLD_TABLES
+            }
+            for future in as_completed(futures):
+                try:
+                    _done(futures[future], future.result())
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            invalidate_gold_index()
+            raise errors[0]
 
-    return summaries
+    invalidate_gold_index()
+    # Ordine stabile (come GOLD_TABLES) anche se le tabelle terminano in ordine diverso
+    return {table: summaries[table] for table in GOLD_TABLES}
 
 
 def get_preview_from_local(limit: int = 5) -> Dict[str, List[Dict[str, Any]]]:
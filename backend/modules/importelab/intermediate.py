@@ -1,12 +1,19 @@
 from __future__ import annotations
 
 from decimal import Decimal, InvalidOperation
-from typing import Any, Dict, Iterable, List, Tuple
+from typing import Any, Dict, List, Tuple
 
-from django.db import transaction
+import hashlib
 
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .goldindex import get_gold_index
 from .models import (
-    GoldTableSnapshot,
+    GoldEan,
+    GoldRossetto,
+    GoldSyncState,
     ImportBatch,
     ImportRow,
     IntermediateAggPrAcq,
@@ -42,112 +49,113 @@ def _to_int(v: Any) -> int | None:
             return None
 
 
-def _get_payload_value(payload: Dict[str, Any], *keys: str) -> Any:
-    """Return first matching key from payload (case-insensitive support)."""
-    if not payload:
+INTERMEDIATE_MODELS = (IntermediateAggPrAcq, IntermediateAggiornaEan, IntermediateAggiornamentiVari)
+
+
+def gold_version() -> str:
+    """Versione del contenuto di t_Rossetto e t_t_Ean (checksum dell'ultima sync), '' se mai sincronizzate.
+
+    Due batch con query intermedie calcolate sulla stessa versione danno lo
+    stesso risultato per righe con lo stesso ImportRow.row_hash.
+    """
+    states = {s.source_table: s for s in GoldSyncState.objects.filter(source_table__in=(T_ROSSETTO, T_EAN))}
+    if len(states) < 2:
+        return ''
+    parts = [f"{t}:{states[t].checksum}:{states[t].rows_count}" for t in (T_ROSSETTO, T_EAN)]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def previous_supplier_batch(batch: ImportBatch, version: str | None = None) -> ImportBatch | None:
+    """Ultimo batch precedente dello stesso fornitore; con `version`, solo se calcolato su quella versione Gold."""
+    if not batch.supplier_key:
         return None
-    lower_map = {str(k).lower(): k for k in payload.keys()}
-    for k in keys:
-        if k in payload:
-            return payload[k]
-        lk = str(k).lower()
-        if lk in lower_map:
-            return payload[lower_map[lk]]
-    return None
-
-
-def _load_rossetto_index() -> Dict[str, Dict[str, Any]]:
-    """Index dbo.t_Rossetto by CODARTFO."""
-    out: Dict[str, Dict[str, Any]] = {}
-    qs = GoldTableSnapshot.objects.filter(source_table=T_ROSSETTO).only('payload')
-    for snap in qs.iterator(chunk_size=2000):
-        p = snap.payload or {}
-        codartfo = _get_payload_value(p, 'CODARTFO', 'CodArtFo', 'codartfo')
-        if codartfo is None:
-            continue
-        out[str(codartfo).strip()] = p
-    return out
+    qs = ImportBatch.objects.filter(supplier_key=batch.supplier_key, id__lt=batch.id)
+    if version is not None:
+        qs = qs.filter(intermediate_version=version)
+    return qs.order_by('-id').first()
 
 
-def _load_ean_set() -> set[str]:
-    """Load all EAN values from dbo.t_t_Ean (field EANA)."""
-    s: set[str] = set()
-    qs = GoldTableSnapshot.objects.filter(source_table=T_EAN).only('payload')
-    for snap in qs.iterator(chunk_size=5000):
-        p = snap.payload or {}
-        eana = _get_payload_value(p, 'EANA', 'EAN', 'Ean', 'eana')
-        if eana is None:
-            continue
-        e = str(eana).strip()
-        if e:
-            s.add(e)
-    return s
+def _result_fields(model) -> List[Any]:
+    """Campi di risultato di una query intermedia (esclusi id, batch, created_at e row_hash)."""
+    return [f for f in model._meta.concrete_fields if f.name not in ('id', 'batch', 'created_at', 'row_hash')]
 
 
-def rebuild_intermediate_queries(batch: ImportBatch) -> Dict[str, int]:
-    """Rigenera le 3 query intermedie per il batch dato usando le snapshot Gold in SQLite."""
-    ros_idx = _load_rossetto_index()
-    ean_set = _load_ean_set()
+def _reused_hashes(prev: ImportBatch):
+    """Subquery dei row_hash (non vuoti) del batch `prev`: righe i cui risultati si copiano."""
+    return ImportRow.objects.filter(batch=prev).exclude(row_hash='').values('row_hash')
+
+
+def _compute_python(batch: ImportBatch, prev: ImportBatch | None = None) -> Tuple[List[IntermediateAggPrAcq], List[IntermediateAggiornaEan], List[IntermediateAggiornamentiVari]]:
+    """Confronto riga per riga in Python (fallback per i DB senza motore set-based, es. SQLite).
+
+    Le righe con un row_hash già presente in `prev` sono escluse: i loro
+    risultati sono copiati da _reuse_statements.
+    """
+    gold = get_gold_index()
 
     rows = ImportRow.objects.filter(batch=batch).only(
-        'cod_art_fo', 'descrizione_articolo', 'ean', 'iva', 'prz_acq', 'pz_x_crt', 'crt_x_str', 'str_x_plt'
+        'cod_art_fo', 'descrizione_articolo', 'ean', 'iva', 'prz_acq', 'pz_x_crt', 'crt_x_str', 'str_x_plt', 'row_hash'
     )
+    if prev is not None:
+        rows = rows.exclude(row_hash__in=_reused_hashes(prev))
 
     q1_objs: List[IntermediateAggPrAcq] = []
     q2_objs: List[IntermediateAggiornaEan] = []
     q3_objs: List[IntermediateAggiornamentiVari] = []
 
     for r in rows.iterator(chunk_size=2000):
+        h = r.row_hash
         cod_fo = (r.cod_art_fo or '').strip()
         if not cod_fo:
             continue
 
-        ros = ros_idx.get(cod_fo)
+        ros = gold.rossetto_by_codartfo(cod_fo)
         if not ros:
             continue
 
         # --- Q1: q_AggPrAcqu (PRACQ diverso)
         ros_pracq = r.prz_acq
-        cidac_pracq_raw = _get_payload_value(ros, 'PRACQ')
-        cidac_pracq = _to_decimal(cidac_pracq_raw)
+        cidac_pracq = ros['pracq']
         if cidac_pracq is not None and ros_pracq is not None and cidac_pracq != ros_pracq:
             q1_objs.append(IntermediateAggPrAcq(
                 batch=batch,
-                dta_aggio=str(_get_payload_value(ros, 'DTAAGGIO') or ''),
+                row_hash=h,
+                dta_aggio=ros['dtaaggio'],
                 cod_art_fo=cod_fo,
-                codart=str(_get_payload_value(ros, 'CODART') or ''),
-                descrart=str(_get_payload_value(ros, 'DESCRART') or ''),
-                stato=str(_get_payload_value(ros, 'STATO') or ''),
-                cidac_prezzo=str(cidac_pracq_raw or ''),
+                codart=ros['codart'],
+                descrart=ros['descrart'],
+                stato=ros['stato'],
+                cidac_prezzo=ros['pracq_raw'],
                 az='Agg',
                 ros_pracq=ros_pracq,
-                sett=str(_get_payload_value(ros, 'SETT') or ''),
-                rep=str(_get_payload_value(ros, 'REP') or ''),
-                srep=str(_get_payload_value(ros, 'SREP') or ''),
-                ccom=str(_get_payload_value(ros, 'CCOM') or ''),
-                descrccom=str(_get_payload_value(ros, 'DESCRCCOM') or ''),
+                sett=ros['sett'],
+                rep=ros['rep'],
+                srep=ros['srep'],
+                ccom=ros['ccom'],
+                descrccom=ros['descrccom'],
                 ros_iva=r.iva,
-                cidac_iva=_to_int(_get_payload_value(ros, 'IVA')),
+                cidac_iva=ros['iva'],
             ))
 
         # --- Q2: q_AggiornaEan (EAN dell'elab non presente in dbo_t_t_Ean)
         ean = (r.ean or '').strip()
-        if ean and ean not in ean_set:
+        if ean and not gold.has_ean(ean):
             q2_objs.append(IntermediateAggiornaEan(
                 batch=batch,
+                row_hash=h,
                 cod_art_fo=cod_fo,
                 descrizione_articolo=r.descrizione_articolo or '',
                 ean=ean,
-                codart=str(_get_payload_value(ros, 'CODART') or ''),
+                codart=ros['codart'],
             ))
 
         # --- Q3: q_AggiornamentiVari
         # Conditions from Access:
         # (PzXCrt diff AND ETICEAN=1) OR (CrtXstr diff) OR (StrXplt diff)
-        cidac_pzxcrt = _to_int(_get_payload_value(ros, 'PZXCRT'))
-        cidac_strato = _to_int(_get_payload_value(ros, 'STRATO'))
-        cidac_pallet = _to_int(_get_payload_value(ros, 'PALLET'))
-        eticean = _to_int(_get_payload_value(ros, 'ETICEAN'))  # 1 means true
+        cidac_pzxcrt = ros['pzxcrt']
+        cidac_strato = ros['strato']
+        cidac_pallet = ros['pallet']
+        eticean = ros['eticean']  # 1 means true
 
         rpzxcrt = r.pz_x_crt
         rcrtstr = r.crt_x_str
@@ -161,8 +169,9 @@ def rebuild_intermediate_queries(batch: ImportBatch) -> Dict[str, int]:
         if cond:
             q3_objs.append(IntermediateAggiornamentiVari(
                 batch=batch,
+                row_hash=h,
                 cod_art_fo=cod_fo,
-                codart=str(_get_payload_value(ros, 'CODART') or ''),
+                codart=ros['codart'],
                 descrizione_articolo=r.descrizione_articolo or '',
                 ean=ean,
                 cidac_pz_x_crt=cidac_pzxcrt,
@@ -176,22 +185,153 @@ def rebuild_intermediate_queries(batch: ImportBatch) -> Dict[str, int]:
                 agg_str_x_plt='AGG' if diff_strplt else '',
             ))
 
-    with transaction.atomic():
+    return q1_objs, q2_objs, q3_objs
+
+
+# Vendor su cui le tre query sono eseguite come INSERT ... SELECT nel database
+SET_BASED_VENDORS = {'microsoft'}
+
+# Trim della chiave lato ImportRow (TRIM non esiste prima di SQL Server 2017)
+_TRIM_FO = "LTRIM(RTRIM(r.cod_art_fo))"
+_TRIM_EAN = "LTRIM(RTRIM(r.ean))"
+
+
+def _set_based_statements() -> List[Tuple[str, str]]:
+    """Return (nome query, SQL) for the three Access-equivalent queries as INSERT ... SELECT.
+
+    Parametri di ogni statement: created_at, batch_id, id del batch precedente
+    (le righe con row_hash presente in quel batch sono escluse: vedi _reuse_statements).
+    """
+    t_row = ImportRow._meta.db_table
+    t_ros = GoldRossetto._meta.db_table
+    t_ean = GoldEan._meta.db_table
+
+    # A parità di CODARTFO si usa la riga Gold con id maggiore
+    ros_join = (
+        f"INNER JOIN {t_ros} g ON g.codartfo = {_TRIM_FO} "
+        f"AND g.id = (SELECT MAX(g2.id) FROM {t_ros} g2 WHERE g2.codartfo = g.codartfo)"
+    )
+    where_batch = (
+        f"WHERE r.batch_id = %s AND {_TRIM_FO} <> '' "
+        f"AND NOT EXISTS (SELECT 1 FROM {t_row} p WHERE p.batch_id = %s AND p.row_hash = r.row_hash AND p.row_hash <> '')"
+    )
+
+    diff_pz = "(r.pz_x_crt IS NOT NULL AND g.pzxcrt IS NOT NULL AND r.pz_x_crt <> g.pzxcrt)"
+    diff_crt = "(r.crt_x_str IS NOT NULL AND g.strato IS NOT NULL AND r.crt_x_str <> g.strato)"
+    diff_str = "(r.str_x_plt IS NOT NULL AND g.pallet IS NOT NULL AND r.str_x_plt <> g.pallet)"
+
+    q1 = (
+        f"INSERT INTO {IntermediateAggPrAcq._meta.db_table} "
+        "(created_at, batch_id, row_hash, dta_aggio, cod_art_fo, codart, descrart, stato, cidac_prezzo, az, ros_pracq, "
+        "sett, rep, srep, ccom, descrccom, ros_iva, cidac_iva) "
+        f"SELECT %s, r.batch_id, r.row_hash, g.dtaaggio, {_TRIM_FO}, g.codart, g.descrart, g.stato, g.pracq_raw, 'Agg', r.prz_acq, "
+        "g.sett, g.rep, g.srep, g.ccom, g.descrccom, r.iva, g.iva "
+        f"FROM {t_row} r {ros_join} {where_batch} "
+        "AND g.pracq IS NOT NULL AND r.prz_acq IS NOT NULL AND g.pracq <> r.prz_acq"
+    )
+    q2 = (
+        f"INSERT INTO {IntermediateAggiornaEan._meta.db_table} "
+        "(created_at, batch_id, row_hash, cod_art_fo, descrizione_articolo, ean, codart) "
+        f"SELECT %s, r.batch_id, r.row_hash, {_TRIM_FO}, COALESCE(r.descrizione_articolo, ''), {_TRIM_EAN}, g.codart "
+        f"FROM {t_row} r {ros_join} {where_batch} "
+        f"AND {_TRIM_EAN} <> '' "
+        f"AND NOT EXISTS (SELECT 1 FROM {t_ean} e WHERE e.ean = {_TRIM_EAN})"
+    )
+    # (PzXCrt diff AND ETICEAN=1) OR (CrtXstr diff) OR (StrXplt diff)
+    q3 = (
+        f"INSERT INTO {IntermediateAggiornamentiVari._meta.db_table} "
+        "(created_at, batch_id, row_hash, cod_art_fo, codart, descrizione_articolo, ean, "
+        "cidac_pz_x_crt, agg_pz_x_crt, r_pz_x_crt, cidac_crt_x_str, agg_crt_x_str, r_crt_x_str, "
+        "r_str_x_plt, cidac_str_x_plt, agg_str_x_plt) "
+        f"SELECT %s, r.batch_id, r.row_hash, {_TRIM_FO}, g.codart, COALESCE(r.descrizione_articolo, ''), "
+        f"COALESCE({_TRIM_EAN}, ''), "
+        f"g.pzxcrt, CASE WHEN {diff_pz} THEN 'AGG' ELSE '' END, r.pz_x_crt, "
+        f"g.strato, CASE WHEN {diff_crt} THEN 'AGG' ELSE '' END, r.crt_x_str, "
+        f"r.str_x_plt, g.pallet, CASE WHEN {diff_str} THEN 'AGG' ELSE '' END "
+        f"FROM {t_row} r {ros_join} {where_batch} "
+        f"AND (({diff_pz} AND g.eticean = 1) OR {diff_crt} OR {diff_str})"
+    )
+    return [('q_AggPrAcqu', q1), ('q_AggiornaEan', q2), ('q_AggiornamentiVari', q3)]
+
+
+def _reuse_statements() -> List[Tuple[str, str]]:
+    """INSERT ... SELECT che copiano dal batch precedente i risultati delle righe con lo stesso row_hash.
+
+    Parametri di ogni statement: created_at, id del batch precedente, batch_id.
+    """
+    t_row = ImportRow._meta.db_table
+    out = []
+    for name, model in zip(('q_AggPrAcqu', 'q_AggiornaEan', 'q_AggiornamentiVari'), INTERMEDIATE_MODELS):
+        table = model._meta.db_table
+        cols = [f.column for f in _result_fields(model)]
+        out.append((name, (
+            f"INSERT INTO {table} (created_at, batch_id, row_hash, {', '.join(cols)}) "
+            f"SELECT %s, r.batch_id, r.row_hash, {', '.join('t.' + c for c in cols)} "
+            f"FROM {t_row} r INNER JOIN {table} t ON t.batch_id = %s AND t.row_hash = r.row_hash "
+            f"AND t.id = (SELECT MIN(t2.id) FROM {table} t2 WHERE t2.batch_id = t.batch_id AND t2.row_hash = t.row_hash) "
+            "WHERE r.batch_id = %s AND r.row_hash <> ''"
+        )))
+    return out
+
+
+def rebuild_intermediate_queries(batch: ImportBatch) -> Dict[str, int]:
+    """Rigenera le 3 query intermedie per il batch dato usando le tabelle Gold tipizzate.
+
+    Su SQL Server ogni query è un unico INSERT ... SELECT eseguito nel database;
+    sugli altri backend (SQLite) si usa il confronto in Python.
+    Se il batch precedente dello stesso fornitore è stato calcolato sulla stessa
+    versione Gold (gold_version), le righe invariate (stesso row_hash) ne copiano
+    i risultati con INSERT ... SELECT (su ogni backend) e solo le righe nuove o
+    modificate sono confrontate con Gold
+    (disattivabile con settings.ELAB_REUSE_PREVIOUS_RESULTS = False).
+    """
+    alias = router.db_for_write(IntermediateAggPrAcq)
+    connection = connections[alias]
+    set_based = connection.vendor in SET_BASED_VENDORS
+
+    version = gold_version()
+    prev = None
+    if version and getattr(settings, 'ELAB_REUSE_PREVIOUS_RESULTS', True):
+        prev = previous_supplier_batch(batch, version)
+
+    if not set_based:
+        q1_objs, q2_objs, q3_objs = _compute_python(batch, prev)
+
+    with transaction.atomic(using=alias):
+        # Un solo ricalcolo per batch alla volta (job di rigenerazione e ricalcolo dopo l'upload)
+        ImportBatch.objects.using(alias).select_for_update().filter(pk=batch.pk).first()
         IntermediateAggPrAcq.objects.filter(batch=batch).delete()
         IntermediateAggiornaEan.objects.filter(batch=batch).delete()
         IntermediateAggiornamentiVari.objects.filter(batch=batch).delete()
 
-        if q1_objs:
-            IntermediateAggPrAcq.objects.bulk_create(q1_objs, batch_size=1000)
-        if q2_objs:
-            IntermediateAggiornaEan.objects.bulk_create(q2_objs, batch_size=1000)
-        if q3_objs:
-            IntermediateAggiornamentiVari.objects.bulk_create(q3_objs, batch_size=1000)
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cur:
+            if set_based:
+                for _, sql in _set_based_statements():
+                    cur.execute(sql, [now, batch.id, prev.id if prev else 0])
+            if prev:
+                for _, sql in _reuse_statements():
+                    cur.execute(sql, [now, prev.id, batch.id])
+        reused = 0
+        if prev:
+            reused = ImportRow.objects.filter(batch=batch, row_hash__in=_reused_hashes(prev)).count()
+        if not set_based:
+            if q1_objs:
+                IntermediateAggPrAcq.objects.bulk_create(q1_objs, batch_size=1000)
+            if q2_objs:
+                IntermediateAggiornaEan.objects.bulk_create(q2_objs, batch_size=1000)
+            if q3_objs:
+                IntermediateAggiornamentiVari.objects.bulk_create(q3_objs, batch_size=1000)
+
+        batch.intermediate_version = version
+        batch.intermediate_reused_from = prev
+        batch.intermediate_reused_rows = reused
+        batch.save(update_fields=['intermediate_version', 'intermediate_reused_from', 'intermediate_reused_rows'])
 
     return {
-        'q_AggPrAcqu': len(q1_objs),
-        'q_AggiornaEan': len(q2_objs),
-        'q_AggiornamentiVari': len(q3_objs),
+        'q_AggPrAcqu': IntermediateAggPrAcq.objects.filter(batch=batch).count(),
+        'q_AggiornaEan': IntermediateAggiornaEan.objects.filter(batch=batch).count(),
+        'q_AggiornamentiVari': IntermediateAggiornamentiVari.objects.filter(batch=batch).count(),
     }
 
 
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import ImportBatch, ImportJob
+
+logger = logging.getLogger(__name__)
+
+JOB_SYNC_GOLD = 'sync_gold'
+JOB_REGEN_INTERMEDIATE = 'regen_intermediate'
+JOB_REPORT_PDF = 'report_pdf'
+
+ACTIVE_STATUSES = (ImportJob.STATUS_PENDING, ImportJob.STATUS_RUNNING)
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _fail_orphaned_jobs() -> int:
+    """Chiude come falliti i job rimasti in coda o in esecuzione.
+
+    I job vivono solo nel pool del processo server (waitress sotto NSSM): un
+    job ancora attivo quando il pool parte è stato interrotto da un riavvio e
+    non verrà più eseguito.
+    """
+    orphaned = ImportJob.objects.filter(status__in=ACTIVE_STATUSES).update(
+        status=ImportJob.STATUS_FAILED,
+        active_key=None,
+        error='Interrotto dal riavvio del server',
+        finished_at=timezone.now(),
+    )
+    if orphaned:
+        logger.warning("importelab: %s job interrotti dal riavvio segnati come falliti", orphaned)
+    return orphaned
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Pool di thread del processo (IMPORTELAB_JOB_WORKERS, default 2).
+
+    Alla creazione i job orfani di un processo precedente sono segnati come falliti.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _fail_orphaned_jobs()
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMPORTELAB_JOB_WORKERS', 2),
+                thread_name_prefix='importelab-job',
+            )
+        return _executor
+
+
+def start_job_runner() -> None:
+    """Avvia il pool del processo se non è ancora partito (e chiude i job orfani)."""
+    _get_executor()
+
+
+def jobs_output_dir() -> str:
+    """Cartella dei file prodotti dai job (settings.IMPORTELAB_JOBS_DIR, fuori dal codice)."""
+    root = getattr(settings, 'IMPORTELAB_JOBS_DIR', None) or os.path.join(settings.BASE_DIR, 'runtime', 'importelab_jobs')
+    root = os.path.abspath(root)
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def set_progress(job: ImportJob, progress: int, message: str = '') -> None:
+    job.progress = max(0, min(100, int(progress)))
+    job.message = message[:255]
+    ImportJob.objects.filter(pk=job.pk).update(progress=job.progress, message=job.message)
+
+
+# -----------------------------
+# Job implementations
+# -----------------------------
+
+def _run_sync_gold(job: ImportJob) -> Dict[str, Any]:
+    from .goldsync import sync_gold_tables
+
+    summaries = sync_gold_tables(
+        limit=job.params.get('limit') or 0,
+        progress=lambda pct, msg: set_progress(job, pct, msg),
+    )
+    return {
+        'synced_at': timezone.localtime().isoformat(timespec='seconds'),
+        'summary': {
+            k: {f: v.get(f) for f in ('rows_fetched', 'mode', 'inserted', 'updated', 'removed', 'seconds')}
+            for k, v in summaries.items()
+        },
+    }
+
+
+def _run_regen_intermediate(job: ImportJob) -> Dict[str, Any]:
+    from .intermediate import rebuild_intermediate_queries
+
+    batch = ImportBatch.objects.get(pk=job.params['batch_id'])
+    set_progress(job, 10, f"Rigenerazione query intermedie per {batch.filename}")
+    counts = rebuild_intermediate_queries(batch)
+    return {'batch_id': batch.id, 'filename': batch.filename, 'counts': counts}
+
+
+def _run_report_pdf(job: ImportJob) -> Dict[str, Any]:
+    from .pdfreports import cached_report_pdf, report_filename
+
+    report = job.params['report']
+    batch = ImportBatch.objects.filter(pk=job.params.get('batch_id')).first()
+    fname = report_filename(report, batch)
+    path = os.path.join(jobs_output_dir(), f"job{job.id}_{fname}")
+    set_progress(job, 10, f"Generazione {fname}")
+    # La cache può essere ripulita da generazioni successive: il job tiene una sua copia
+    shutil.copyfile(cached_report_pdf(report, batch), path)
+    job.output_path = path
+    ImportJob.objects.filter(pk=job.pk).update(output_path=path)
+    return {'filename': fname}
+
+
+JOB_RUNNERS: Dict[str, Callable[[ImportJob], Dict[str, Any]]] = {
+    JOB_SYNC_GOLD: _run_sync_gold,
+    JOB_REGEN_INTERMEDIATE: _run_regen_intermediate,
+    JOB_REPORT_PDF: _run_report_pdf,
+}
+
+
+def _execute(job_id: int) -> None:
+    close_old_connections()
+    try:
+        job = ImportJob.objects.get(pk=job_id)
+        ImportJob.objects.filter(pk=job_id).update(status=ImportJob.STATUS_RUNNING, started_at=timezone.now())
+        try:
+            result = JOB_RUNNERS[job.kind](job)
+        except Exception as e:
+            logger.exception("importelab job %s (%s) fallito", job_id, job.kind)
+            ImportJob.objects.filter(pk=job_id).update(
+                status=ImportJob.STATUS_FAILED, active_key=None, error=str(e), finished_at=timezone.now(),
+            )
+            return
+        ImportJob.objects.filter(pk=job_id).update(
+            status=ImportJob.STATUS_DONE, active_key=None, progress=100, result=result or {},
+            finished_at=timezone.now(),
+        )
+    finally:
+        # I thread del pool non passano dal ciclo request/response: chiudiamo noi le connessioni
+        connections.close_all()
+
+
+def _active_key(kind: str, params: Dict[str, Any]) -> str:
+    """Chiave (sha1) di tipo e parametri del job, indipendente dall'ordine delle chiavi."""
+    payload = json.dumps([kind, params], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def submit_job(kind: str, params: Dict[str, Any] | None = None) -> ImportJob:
+    """Crea il record del job e lo accoda al pool dopo il commit della transazione corrente.
+
+    Se un job dello stesso tipo con gli stessi parametri è già in coda o in
+    esecuzione (doppio click, più utenti) ritorna quello invece di accodarne un
+    secondo: la riga attiva è letta con select_for_update e l'unicità di
+    active_key blocca gli inserimenti concorrenti.
+    """
+    if kind not in JOB_RUNNERS:
+        raise ValueError(f"Tipo di job sconosciuto: {kind}")
+    params = params or {}
+    key = _active_key(kind, params)
+    executor = _get_executor()
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update().filter(active_key=key).first()
+        if job is not None:
+            return job
+        try:
+            with transaction.atomic():
+                job = ImportJob.objects.create(kind=kind, params=params, active_key=key)
+        except IntegrityError:
+            # Stesso job creato in parallelo da un'altra richiesta
+            job = ImportJob.objects.filter(active_key=key).first()
+            if job is not None:
+                return job
+            return submit_job(kind, params)
+        transaction.on_commit(lambda: executor.submit(_execute, job.id))
+    return job
+
+
+def last_finished_job(kind: str) -> ImportJob | None:
+    return ImportJob.objects.filter(kind=kind, status=ImportJob.STATUS_DONE).order_by('-finished_at').first()
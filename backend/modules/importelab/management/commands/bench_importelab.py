@@ -0,0 +1,75 @@
+"""
+Management command di benchmark della pipeline importelab su dati sintetici.
+
+Misura parsing .elab, import, sync Gold, query intermedie, PDF e purge per
+ogni dimensione richiesta e scrive un report JSON (tempo, query, picco memoria).
+Gira solo su DB SQLite locale: usare le impostazioni project_core.settings.bench.
+
+Uso:
+    python manage.py bench_importelab --settings=project_core.settings.bench
+    python manage.py bench_importelab --settings=project_core.settings.bench --sizes 1000,50000,500000
+    python manage.py bench_importelab --settings=project_core.settings.bench --no-memory
+    python manage.py bench_importelab --settings=project_core.settings.bench --output bench.json
+"""
+
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from modules.importelab.bench import run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark della pipeline importelab con file .elab e snapshot Gold sintetici'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=str,
+            default='1000,10000',
+            help='Dimensioni (righe .elab / Gold) separate da virgola, es. 1000,100000,500000',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed dei generatori sintetici',
+        )
+        parser.add_argument(
+            '--no-memory',
+            action='store_true',
+            help='Non traccia la memoria con tracemalloc (tempi più realistici)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='',
+            help='File JSON del report (default bench_importelab_<data>.json)',
+        )
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError(
+                'Il benchmark sovrascrive le snapshot Gold: eseguirlo solo su SQLite '
+                '(--settings=project_core.settings.bench)'
+            )
+        try:
+            sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        except ValueError:
+            raise CommandError(f"--sizes non valido: {options['sizes']}")
+        if not sizes or any(s <= 0 for s in sizes):
+            raise CommandError('--sizes deve contenere numeri positivi')
+
+        call_command('migrate', 'importelab', database='default', interactive=False, verbosity=0)
+
+        report = run_benchmark(
+            sizes, seed=options['seed'], log=self.stdout.write, trace_memory=not options['no_memory'],
+        )
+
+        output = options['output'] or f"bench_importelab_{timezone.now():%Y%m%d_%H%M%S}.json"
+        with open(output, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Report scritto in {output}'))
@@ -0,0 +1,93 @@
+"""
+Management command di retention per gli import .elab.
+
+Elimina i batch più vecchi di N giorni con righe e query intermedie collegate,
+con DELETE a blocchi (vedi importelab.purge). Pensato per essere schedulato.
+
+Uso:
+    python manage.py purge_importelab_batches
+    python manage.py purge_importelab_batches --days 90 --keep-last 4
+    python manage.py purge_importelab_batches --dry-run
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from modules.importelab.models import ImportBatch
+from modules.importelab.purge import MAX_PURGE_CHUNK_SIZE, PURGE_CHUNK_SIZE, purge_batches
+
+
+class Command(BaseCommand):
+    help = 'Elimina i batch .elab più vecchi della retention (righe e query intermedie comprese)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'ELAB_RETENTION_DAYS', 180),
+            help='Elimina i batch caricati da più di N giorni (default settings.ELAB_RETENTION_DAYS o 180)',
+        )
+        parser.add_argument(
+            '--keep-last',
+            type=int,
+            default=2,
+            help='Mantiene comunque gli ultimi N batch di ogni fornitore (confronto e riuso dei risultati)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=PURGE_CHUNK_SIZE,
+            help=f'Batch eliminati per statement (max {MAX_PURGE_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--delete-files',
+            action='store_true',
+            help='Rimuove anche la copia del file .elab salvata su disco',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Mostra cosa verrebbe eliminato senza eliminare',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        keep_last = options['keep_last']
+        chunk_size = options['chunk_size']
+        if days < 0 or keep_last < 0:
+            raise CommandError('--days e --keep-last devono essere >= 0')
+        if not 0 < chunk_size <= MAX_PURGE_CHUNK_SIZE:
+            raise CommandError(f'--chunk-size deve essere fra 1 e {MAX_PURGE_CHUNK_SIZE}')
+
+        cutoff = timezone.now() - timedelta(days=days)
+
+        # Ultimi N batch per fornitore: esclusi dalla cancellazione
+        protected = set()
+        if keep_last:
+            seen = {}
+            for pk, supplier in ImportBatch.objects.order_by('-uploaded_at', '-id').values_list('id', 'supplier_key'):
+                if seen.get(supplier, 0) < keep_last:
+                    seen[supplier] = seen.get(supplier, 0) + 1
+                    protected.add(pk)
+
+        old = ImportBatch.objects.filter(uploaded_at__lt=cutoff).order_by('id')
+        batch_ids = [pk for pk in old.values_list('id', flat=True) if pk not in protected]
+
+        self.stdout.write(f'Batch più vecchi del {cutoff:%d/%m/%Y %H:%M}: {len(batch_ids)} da eliminare')
+        if not batch_ids:
+            return
+        if options['dry_run']:
+            selected = set(batch_ids)
+            for b in old:
+                if b.id in selected:
+                    self.stdout.write(f'  {b.id}: {b}')
+            self.stdout.write(self.style.WARNING('Dry run: nessuna eliminazione'))
+            return
+
+        counts = purge_batches(batch_ids, chunk_size=chunk_size, delete_files=options['delete_files'])
+        for table, n in counts.items():
+            self.stdout.write(f'  {table}: {n} righe eliminate')
+        self.stdout.write(self.style.SUCCESS(f'Eliminati {counts.get(ImportBatch._meta.db_table, 0)} batch'))
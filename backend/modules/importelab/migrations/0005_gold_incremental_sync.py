@@ -0,0 +1,41 @@
+# Generated by Django 5.2.10 on 2026-10-18 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('importelab', '0004_rename_importelab__batch_i_ef4a7d_idx_importelab__batch_i_101e7a_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoldSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_table', models.CharField(max_length=128, unique=True)),
+                ('checksum', models.CharField(blank=True, default='', max_length=40)),
+                ('rows_count', models.PositiveIntegerField(default=0)),
+                ('mode', models.CharField(blank=True, default='', max_length=16)),
+                ('inserted', models.PositiveIntegerField(default=0)),
+                ('updated', models.PositiveIntegerField(default=0)),
+                ('removed', models.PositiveIntegerField(default=0)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='goldtablesnapshot',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='goldtablesnapshot',
+            name='row_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='goldtablesnapshot',
+            index=models.Index(fields=['source_table', 'row_key'], name='importelab__source__b46e40_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.10 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('importelab', '0005_gold_incremental_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoldEan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_key', models.CharField(db_index=True, max_length=255)),
+                ('codart', models.CharField(blank=True, db_index=True, max_length=50)),
+                ('ean', models.CharField(blank=True, db_index=True, max_length=32)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GoldOrdineRossetto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_key', models.CharField(db_index=True, max_length=255)),
+                ('codartfo', models.CharField(blank=True, db_index=True, max_length=50)),
+                ('colliord', models.CharField(blank=True, max_length=32)),
+                ('data_ordine', models.CharField(blank=True, max_length=32)),
+                ('data_consegna', models.CharField(blank=True, max_length=32)),
+                ('dcdcexcde', models.CharField(blank=True, max_length=64)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GoldRossetto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_key', models.CharField(db_index=True, max_length=255)),
+                ('codartfo', models.CharField(blank=True, db_index=True, max_length=50)),
+                ('codart', models.CharField(blank=True, db_index=True, max_length=50)),
+                ('descrart', models.CharField(blank=True, max_length=255)),
+                ('stato', models.CharField(blank=True, max_length=32)),
+                ('dtaaggio', models.CharField(blank=True, max_length=32)),
+                ('pracq', models.DecimalField(blank=True, decimal_places=6, max_digits=18, null=True)),
+                ('pracq_raw', models.CharField(blank=True, max_length=64)),
+                ('iva', models.IntegerField(blank=True, null=True)),
+                ('sett', models.CharField(blank=True, max_length=32)),
+                ('rep', models.CharField(blank=True, max_length=32)),
+                ('srep', models.CharField(blank=True, max_length=32)),
+                ('ccom', models.CharField(blank=True, max_length=32)),
+                ('descrccom', models.CharField(blank=True, max_length=255)),
+                ('pzxcrt', models.IntegerField(blank=True, null=True)),
+                ('strato', models.IntegerField(blank=True, null=True)),
+                ('pallet', models.IntegerField(blank=True, null=True)),
+                ('eticean', models.IntegerField(blank=True, null=True)),
+            ],
+        ),
+    ]
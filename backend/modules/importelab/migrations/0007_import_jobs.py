@@ -0,0 +1,34 @@
+# Generated by Django 5.2.10 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('importelab', '0006_gold_typed_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=32, verbose_name='Tipo')),
+                ('status', models.CharField(choices=[('pending', 'In coda'), ('running', 'In esecuzione'), ('done', 'Completato'), ('failed', 'Fallito')], default='pending', max_length=16, verbose_name='Stato')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='Avanzamento %')),
+                ('message', models.CharField(blank=True, default='', max_length=255, verbose_name='Messaggio')),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+                ('output_path', models.CharField(blank=True, default='', max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['kind', 'status'], name='importelab__kind_113e8a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.10 on 2026-10-18 14:19
+
+from django.db import migrations, models
+
+
+def canonical_codart(value):
+    """Copia di goldindex.canonical_codart al momento della migrazione (non importare il codice vivo)."""
+    if value is None:
+        return ''
+    s = str(value).strip()
+    if not s:
+        return ''
+    if s.isdigit():
+        return s.lstrip('0') or '0'
+    try:
+        f = float(s)
+    except ValueError:
+        return s.lstrip('0') or '0'
+    if f.is_integer():
+        return str(int(f))
+    return s.lstrip('0') or '0'
+
+
+def fill_codart_norm(apps, schema_editor):
+    GoldRossetto = apps.get_model('importelab', 'GoldRossetto')
+    batch = []
+    for obj in GoldRossetto.objects.only('id', 'codart').iterator(chunk_size=2000):
+        obj.codart_norm = canonical_codart(obj.codart)[:50]
+        batch.append(obj)
+        if len(batch) >= 2000:
+            GoldRossetto.objects.bulk_update(batch, ['codart_norm'])
+            batch = []
+    if batch:
+        GoldRossetto.objects.bulk_update(batch, ['codart_norm'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('importelab', '0007_import_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goldrossetto',
+            name='codart_norm',
+            field=models.CharField(blank=True, db_index=True, max_length=50),
+        ),
+        migrations.RunPython(fill_codart_norm, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 5.2.10 on 2026-10-18 14:25
+
+import hashlib
+import json
+import os
+import re
+from decimal import Decimal, InvalidOperation
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copia di utils.elab_row_hash / elab_supplier_key al momento della migrazione
+# (non importare il codice vivo: le righe esistenti vanno calcolate come allora)
+ROW_HASH_FIELDS = (
+    'cod_art_fo', 'descrizione_articolo', 'iva', 'prz_acq', 'campo5',
+    'pz_x_crt', 'crt_x_str', 'str_x_plt', 'tot_colli', 'ean',
+)
+_DECIMAL_STEP = Decimal('0.0001')
+
+
+def _hash_value(value):
+    if isinstance(value, (float, Decimal)):
+        try:
+            return str(Decimal(str(value)).quantize(_DECIMAL_STEP).normalize())
+        except InvalidOperation:
+            return str(value)
+    return value
+
+
+def elab_row_hash(row):
+    values = [_hash_value(getattr(row, f)) for f in ROW_HASH_FIELDS]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def elab_supplier_key(filename):
+    stem = os.path.splitext(os.path.basename(filename or ''))[0]
+    parts = [p for p in re.split(r'[_\-\s]+', stem) if p]
+    for part in reversed(parts):
+        if any(c.isalpha() for c in part):
+            return part.upper()[:64]
+    return stem.upper()[:64]
+
+
+def fill_supplier_and_row_hash(apps, schema_editor):
+    ImportBatch = apps.get_model('importelab', 'ImportBatch')
+    ImportRow = apps.get_model('importelab', 'ImportRow')
+    for batch in ImportBatch.objects.only('id', 'filename').iterator():
+        batch.supplier_key = elab_supplier_key(batch.filename)
+        batch.save(update_fields=['supplier_key'])
+
+    pending = []
+    for row in ImportRow.objects.iterator(chunk_size=2000):
+        row.row_hash = elab_row_hash(row)
+        pending.append(row)
+        if len(pending) >= 2000:
+            ImportRow.objects.bulk_update(pending, ['row_hash'])
+            pending = []
+    if pending:
+        ImportRow.objects.bulk_update(pending, ['row_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('importelab', '0008_goldrossetto_codart_norm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importbatch',
+            name='intermediate_reused_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='importelab.importbatch'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='intermediate_reused_rows',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='intermediate_version',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='supplier_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='Fornitore'),
+        ),
+        migrations.AddField(
+            model_name='importrow',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='intermediateaggiornaean',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='intermediateaggiornamentivari',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='intermediateaggpracq',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='importrow',
+            index=models.Index(fields=['batch', 'row_hash'], name='importelab__batch_i_b75956_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='intermediateaggiornaean',
+            index=models.Index(fields=['batch', 'row_hash'], name='importelab__batch_i_19d242_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='intermediateaggiornamentivari',
+            index=models.Index(fields=['batch', 'row_hash'], name='importelab__batch_i_60ae85_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='intermediateaggpracq',
+            index=models.Index(fields=['batch', 'row_hash'], name='importelab__batch_i_e13b33_idx'),
+        ),
+        migrations.RunPython(fill_supplier_and_row_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('importelab', '0009_batch_row_hash_reuse'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='active_key',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, unique=True),
+        ),
+    ]
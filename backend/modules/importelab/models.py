@@ -1,16 +1,45 @@
+import base64
+import os
+import zlib
+
 from django.db import models
 
+# Prefisso di raw_content quando il contenuto è salvato compresso (zlib + base64)
+RAW_ZLIB_PREFIX = 'zlib:'
+
 
 class ImportBatch(models.Model):
     filename = models.CharField('Nome file', max_length=255)
     uploaded_at = models.DateTimeField('Caricato il', auto_now_add=True)
+    # Testo del file (default), compresso (RAW_ZLIB_PREFIX) oppure vuoto se si usa la copia su disco:
+    # leggerlo con get_raw_content (settings.ELAB_RAW_CONTENT_MODE)
     raw_content = models.TextField('Contenuto originale')
     import_dir = models.CharField('Cartella import', max_length=500, blank=True, default='')
     import_saved_name = models.CharField('Nome file salvato', max_length=255, blank=True, default='')
+    # Fornitore (dal nome file, vedi utils.elab_supplier_key): i batch dello stesso fornitore si confrontano fra loro
+    supplier_key = models.CharField('Fornitore', max_length=64, blank=True, default='', db_index=True)
+    # Versione delle tabelle Gold con cui sono state calcolate le query intermedie
+    intermediate_version = models.CharField(max_length=40, blank=True, default='')
+    # Batch precedente da cui sono stati riusati i risultati delle righe invariate
+    intermediate_reused_from = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.SET_NULL, related_name='+',
+    )
+    intermediate_reused_rows = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.filename} ({self.uploaded_at:%Y-%m-%d %H:%M})"
 
+    def get_raw_content(self) -> str:
+        """Contenuto originale del file, qualunque sia la modalità di salvataggio."""
+        if self.raw_content.startswith(RAW_ZLIB_PREFIX):
+            data = base64.b64decode(self.raw_content[len(RAW_ZLIB_PREFIX):])
+            return zlib.decompress(data).decode('utf-8')
+        if not self.raw_content and self.import_dir and self.import_saved_name:
+            from .utils import decode_elab
+            with open(os.path.join(self.import_dir, self.import_saved_name), 'rb') as fp:
+                return decode_elab(fp.read())
+        return self.raw_content
+
 
 class ImportRow(models.Model):
     """
@@ -46,8 +75,12 @@ class ImportRow(models.Model):
 
     ean = models.CharField('EAN', max_length=32, blank=True)
 
+    # utils.elab_row_hash dei campi di dominio: uguale fra batch se la riga non è cambiata
+    row_hash = models.CharField(max_length=40, blank=True, default='')
+
     class Meta:
         ordering = ['line_number']
+        indexes = [models.Index(fields=['batch', 'row_hash'])]
 
     def __str__(self):
         return f"{self.batch.filename} – riga {self.line_number}"
@@ -58,18 +91,91 @@ class GoldTableSnapshot(models.Model):
     source_table = models.CharField(max_length=128)
     # Raw row as JSON (columns -> values). Useful for fast prototyping without full schema.
     payload = models.JSONField()
+    # Chiave naturale della riga Gold e hash del payload (sync incrementale)
+    row_key = models.CharField(max_length=255, blank=True, default='')
+    row_hash = models.CharField(max_length=40, blank=True, default='')
     synced_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['source_table']),
             models.Index(fields=['synced_at']),
+            models.Index(fields=['source_table', 'row_key']),
         ]
 
     def __str__(self):
         return f"{self.source_table} snapshot {self.id}"
 
 
+class GoldRossetto(models.Model):
+    """Proiezione tipizzata di dbo.t_Rossetto (una riga per GoldTableSnapshot.row_key)."""
+    row_key = models.CharField(max_length=255, db_index=True)
+    codartfo = models.CharField(max_length=50, blank=True, db_index=True)
+    codart = models.CharField(max_length=50, blank=True, db_index=True)
+    codart_norm = models.CharField(max_length=50, blank=True, db_index=True)  # goldindex.canonical_codart(codart)
+    descrart = models.CharField(max_length=255, blank=True)
+    stato = models.CharField(max_length=32, blank=True)
+    dtaaggio = models.CharField(max_length=32, blank=True)
+
+    pracq = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
+    pracq_raw = models.CharField(max_length=64, blank=True)  # PRACQ come letto da Gold (stringa safe)
+    iva = models.IntegerField(null=True, blank=True)
+
+    sett = models.CharField(max_length=32, blank=True)
+    rep = models.CharField(max_length=32, blank=True)
+    srep = models.CharField(max_length=32, blank=True)
+    ccom = models.CharField(max_length=32, blank=True)
+    descrccom = models.CharField(max_length=255, blank=True)
+
+    pzxcrt = models.IntegerField(null=True, blank=True)
+    strato = models.IntegerField(null=True, blank=True)
+    pallet = models.IntegerField(null=True, blank=True)
+    eticean = models.IntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"t_Rossetto {self.codartfo} ({self.codart})"
+
+
+class GoldEan(models.Model):
+    """Proiezione tipizzata di dbo.t_t_Ean (EANA/EAN per CODART)."""
+    row_key = models.CharField(max_length=255, db_index=True)
+    codart = models.CharField(max_length=50, blank=True, db_index=True)
+    ean = models.CharField(max_length=32, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"t_t_Ean {self.ean} ({self.codart})"
+
+
+class GoldOrdineRossetto(models.Model):
+    """Proiezione tipizzata di dbo.t_OrdiniRossetto."""
+    row_key = models.CharField(max_length=255, db_index=True)
+    codartfo = models.CharField(max_length=50, blank=True, db_index=True)
+    colliord = models.CharField(max_length=32, blank=True)
+    data_ordine = models.CharField(max_length=32, blank=True)
+    data_consegna = models.CharField(max_length=32, blank=True)
+    dcdcexcde = models.CharField(max_length=64, blank=True)
+
+    def __str__(self):
+        return f"t_OrdiniRossetto {self.codartfo}"
+
+
+class GoldSyncState(models.Model):
+    """Watermark per tabella Gold: stato dell'ultima sincronizzazione riuscita."""
+    source_table = models.CharField(max_length=128, unique=True)
+    # Hash aggregato di tutte le righe (indipendente dall'ordine): se invariato, insieme
+    # a rows_count, la sync incrementale non legge né scrive le snapshot locali
+    checksum = models.CharField(max_length=40, blank=True, default='')
+    rows_count = models.PositiveIntegerField(default=0)
+    mode = models.CharField(max_length=16, blank=True, default='')
+    inserted = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    removed = models.PositiveIntegerField(default=0)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source_table} @ {self.synced_at:%Y-%m-%d %H:%M}"
+
+
 class IntermediateAggPrAcq(models.Model):
     """Risultato equivalente a query Access q_AggPrAcqu per uno specifico batch."""
     batch = models.ForeignKey(ImportBatch, on_delete=models.CASCADE, related_name='q_agg_pracq', verbose_name='Batch')
@@ -92,10 +198,13 @@ class IntermediateAggPrAcq(models.Model):
     ros_iva = models.IntegerField(null=True, blank=True)
     cidac_iva = models.IntegerField(null=True, blank=True)
 
+    # ImportRow.row_hash della riga che ha prodotto il risultato (riuso fra batch)
+    row_hash = models.CharField(max_length=40, blank=True, default='')
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        indexes = [models.Index(fields=['batch', 'cod_art_fo'])]
+        indexes = [models.Index(fields=['batch', 'cod_art_fo']), models.Index(fields=['batch', 'row_hash'])]
         ordering = ['rep', 'srep', 'ccom', 'cod_art_fo']
 
 
@@ -107,10 +216,17 @@ class IntermediateAggiornaEan(models.Model):
     ean = models.CharField(max_length=32, blank=True)
     codart = models.CharField(max_length=50, blank=True)  # da dbo_t_Rossetto
 
+    # ImportRow.row_hash della riga che ha prodotto il risultato (riuso fra batch)
+    row_hash = models.CharField(max_length=40, blank=True, default='')
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        indexes = [models.Index(fields=['batch', 'ean']), models.Index(fields=['batch', 'cod_art_fo'])]
+        indexes = [
+            models.Index(fields=['batch', 'ean']),
+            models.Index(fields=['batch', 'cod_art_fo']),
+            models.Index(fields=['batch', 'row_hash']),
+        ]
         ordering = ['descrizione_articolo', 'cod_art_fo']
 
 
@@ -134,8 +250,53 @@ class IntermediateAggiornamentiVari(models.Model):
     cidac_str_x_plt = models.IntegerField(null=True, blank=True)  # PALLET
     agg_str_x_plt = models.CharField(max_length=8, blank=True)
 
+    # ImportRow.row_hash della riga che ha prodotto il risultato (riuso fra batch)
+    row_hash = models.CharField(max_length=40, blank=True, default='')
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        indexes = [models.Index(fields=['batch', 'cod_art_fo'])]
+        indexes = [models.Index(fields=['batch', 'cod_art_fo']), models.Index(fields=['batch', 'row_hash'])]
         ordering = ['cod_art_fo']
+
+
+class ImportJob(models.Model):
+    """Lavoro in background (sync Gold, rigenerazione query intermedie, PDF report)."""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'In coda'),
+        (STATUS_RUNNING, 'In esecuzione'),
+        (STATUS_DONE, 'Completato'),
+        (STATUS_FAILED, 'Fallito'),
+    ]
+
+    kind = models.CharField('Tipo', max_length=32)
+    status = models.CharField('Stato', max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    progress = models.PositiveSmallIntegerField('Avanzamento %', default=0)
+    message = models.CharField('Messaggio', max_length=255, blank=True, default='')
+    params = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    # File prodotto dal job (es. PDF), scaricabile dalla vista job_download
+    output_path = models.CharField(max_length=500, blank=True, default='')
+    # Chiave tipo+parametri finché il job è in coda o in esecuzione (NULL quando finisce):
+    # l'unicità impedisce due job attivi uguali (vedi jobs.submit_job)
+    active_key = models.CharField(max_length=40, null=True, blank=True, unique=True, editable=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['kind', 'status'])]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import csv
+import mmap
+import os
+import re
+import threading
+
+ORDINI_FIELDS = ("CODARTFO", "COLLIORD", "DATA_ORDINE", "DATA_CONSEGNA", "DCDCEXCDE")
+
+# Export Rossetto senza header (verificato su dbo_t_OrdiniRossetto_giovedi.txt): posizioni fisse,
+# nell'ordine di ORDINI_FIELDS
+_NO_HEADER_POSITIONS = (9, 11, 2, 3, 10)
+
+# Layout riconosciuto per file: firma (path, dimensione, mtime) -> (delimiter, quoted, has_header, positions)
+Layout = Tuple[str, bool, bool, Tuple[int, ...]]
+_LAYOUT_CACHE_SIZE = 32
+_layout_cache: Dict[Tuple[str, int, int], Layout] = {}
+_layout_lock = threading.Lock()
+
+
+def _norm(s: str) -> str:
+    return re.sub(r"[^A-Z0-9_]", "", (s or "").strip().upper())
+
+
+def _file_signature(txt_path: str, st: os.stat_result) -> Tuple[str, int, int]:
+    return (os.path.realpath(txt_path), st.st_size, st.st_mtime_ns)
+
+
+def _detect_dialect(sample: str) -> Tuple[str, bool]:
+    """(delimiter, quoted) dalla prima riga non vuota."""
+    if sample.count(";") >= 3:
+        return ";", True
+    for d in ["\t", "|", ","]:
+        if sample.count(d) >= 3:
+            return d, False
+    raise ValueError("Separatore TXT non riconosciuto. Attesi ';' (consigliato), tab, '|', ','.")
+
+
+def _detect_layout(delimiter: str, quoted: bool, first_row: List[str]) -> Layout:
+    first_norm = [_norm(c) for c in first_row]
+    has_header = any(h in ORDINI_FIELDS for h in first_norm)
+
+    if has_header:
+        idx = {first_norm[i]: i for i in range(len(first_norm))}
+        missing = [c for c in ORDINI_FIELDS if c not in idx]
+        if missing:
+            raise ValueError(f"Header TXT mancante colonne: {missing}. Header letto: {first_norm}")
+        return delimiter, quoted, True, tuple(idx[c] for c in ORDINI_FIELDS)
+
+    if not quoted:
+        raise ValueError("TXT senza header non supportato per questo formato. Usa export con ';' e virgolette oppure aggiungi header.")
+    return delimiter, quoted, False, _NO_HEADER_POSITIONS
+
+
+def _iter_rows(lines: Iterable[str], delimiter: str, quoted: bool) -> Iterator[List[str]]:
+    """Righe tokenizzate non vuote."""
+    if quoted:
+        for r in csv.reader(lines, delimiter=delimiter, quotechar='"'):
+            if any((c or "").strip() for c in r):
+                yield r
+    else:
+        for ln in lines:
+            if ln.strip():
+                yield ln.rstrip("\r\n").split(delimiter)
+
+
+def _emit(rows: Iterator[List[str]], positions: Tuple[int, ...], closers) -> Iterator[Dict[str, str]]:
+    try:
+        for parts in rows:
+            n = len(parts)
+            yield {f: (parts[i].strip() if i < n else "") for f, i in zip(ORDINI_FIELDS, positions)}
+    finally:
+        for c in closers:
+            c.close()
+
+
+def iter_ordini_rossetto_txt(txt_path: str) -> Iterator[Dict[str, str]]:
+    """Legge un export TXT di dbo_t_OrdiniRossetto e restituisce le righe (dict) in modo lazy.
+
+    Supporta:
+    - header (preferito) con i nomi colonna, separatore ; | tab o virgola
+    - NESSUN header: posizioni fisse dell'export Rossetto (CSV con ';' e virgolette)
+
+    Il file è letto una sola volta tramite mmap; il layout (separatore, header,
+    posizioni delle colonne) è calcolato sulla prima riga e messo in cache per
+    firma del file (path, dimensione, mtime). Eventuali errori di formato sono
+    sollevati subito, prima di restituire l'iteratore.
+
+    Chiavi restituite: CODARTFO, COLLIORD, DATA_ORDINE, DATA_CONSEGNA, DCDCEXCDE
+    """
+    st = os.stat(txt_path)
+    if st.st_size == 0:
+        return iter(())
+
+    fp = open(txt_path, "rb")
+    try:
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception:
+        fp.close()
+        raise
+
+    try:
+        # Le righe sono separate su b"\n": una sequenza UTF-8 non viene mai spezzata
+        lines: Iterator[str] = (b.decode("utf-8", errors="replace") for b in iter(mm.readline, b""))
+        sample = next((ln for ln in lines if ln.strip()), None)
+        if sample is None:
+            mm.close()
+            fp.close()
+            return iter(())
+        lines = chain([sample], lines)
+
+        signature = _file_signature(txt_path, st)
+        layout = _layout_cache.get(signature)
+        if layout is not None:
+            delimiter, quoted, has_header, positions = layout
+            rows = _iter_rows(lines, delimiter, quoted)
+            if has_header:
+                next(rows, None)
+        else:
+            delimiter, quoted = _detect_dialect(sample)
+            rows = _iter_rows(lines, delimiter, quoted)
+            first_row = next(rows, None)
+            if first_row is None:
+                mm.close()
+                fp.close()
+                return iter(())
+            layout = _detect_layout(delimiter, quoted, first_row)
+            positions = layout[3]
+            if not layout[2]:
+                rows = chain([first_row], rows)
+            with _layout_lock:
+                if len(_layout_cache) >= _LAYOUT_CACHE_SIZE:
+                    _layout_cache.pop(next(iter(_layout_cache)))
+                _layout_cache[signature] = layout
+    except Exception:
+        mm.close()
+        fp.close()
+        raise
+
+    return _emit(rows, positions, (mm, fp))
@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import glob
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .goldindex import GoldLookupIndex, current_generation, get_gold_index
+from .models import ImportBatch, IntermediateAggiornaEan, IntermediateAggiornamentiVari, IntermediateAggPrAcq
+
+# Righe lette dal DB per volta (sia per l'ordinamento che per il disegno)
+PDF_CHUNK_SIZE = 2000
+
+
+# -----------------------------
+# Motore comune dei report r_*
+# -----------------------------
+
+def _draw_pdf_header(c, title, print_date, page_num):
+    from reportlab.lib.units import mm
+    c.setFont("Helvetica-Bold", 20)
+    c.drawString(20*mm, 280*mm, title)
+    c.setFont("Helvetica", 9)
+    c.drawRightString(190*mm, 280*mm, f"Data stampa: {print_date}")
+    c.setFont("Helvetica", 8)
+    c.drawRightString(190*mm, 10*mm, f"Pagina {page_num}")
+
+
+class _GroupedReportCanvas:
+    """Canvas A4 con i gruppi Data Agg. / CodFo dei report Access e cambio pagina automatico."""
+
+    def __init__(self, fp, title: str, print_date: str):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import mm
+        from reportlab.pdfgen import canvas
+
+        self.mm = mm
+        self.title = title
+        self.print_date = print_date
+        self.page_num = 1
+        self.c = canvas.Canvas(fp, pagesize=A4)
+        _draw_pdf_header(self.c, title, print_date, self.page_num)
+        self.y = 270*mm
+        self.c.setFont("Helvetica", 9)
+
+    def _ensure(self, min_y_mm: float) -> None:
+        if self.y < min_y_mm*self.mm:
+            self.page_num += 1
+            self.c.showPage()
+            _draw_pdf_header(self.c, self.title, self.print_date, self.page_num)
+            self.y = 260*self.mm
+
+    def batch_line(self, batch) -> None:
+        self.c.drawString(20*self.mm, self.y, f"Batch: {batch.filename} ({batch.uploaded_at:%d/%m/%Y %H:%M})")
+        self.y -= 8*self.mm
+
+    def date_header(self, dtaaggio) -> None:
+        self._ensure(30)
+        self.c.setFont("Helvetica-Bold", 11)
+        self.c.drawString(20*self.mm, self.y, f"Data Agg.: {dtaaggio}")
+        self.y -= 7*self.mm
+
+    def codfo_header(self, codfo, descrccom) -> None:
+        self._ensure(28)
+        self.c.setFont("Helvetica-Bold", 10)
+        self.c.drawString(20*self.mm, self.y, f"CodFo {codfo}  {descrccom}")
+        self.y -= 6*self.mm
+        self.c.setFont("Helvetica", 9)
+
+    def lines(self, lines: List[str]) -> None:
+        from reportlab.lib.utils import simpleSplit
+        for line in lines:
+            for w in simpleSplit(line, "Helvetica", 9, 170*self.mm):
+                self._ensure(20)
+                self.c.drawString(20*self.mm, self.y, w)
+                self.y -= 5*self.mm
+        self.y -= 4*self.mm
+
+    def save(self) -> None:
+        self.c.save()
+
+
+def _iter_sorted(qs, key_fields: Tuple[str, ...], sort_key: Callable[..., tuple], chunk_size: int = PDF_CHUNK_SIZE) -> Iterator[Any]:
+    """Itera gli oggetti di `qs` nell'ordine dato da `sort_key(*valori key_fields)`.
+
+    In memoria restano solo le chiavi di ordinamento e le PK; gli oggetti
+    vengono caricati a blocchi di `chunk_size`. A parità di chiave vale
+    l'ordinamento del queryset (come il sort stabile sulle liste).
+    """
+    keys = [
+        (sort_key(*vals), seq, pk)
+        for seq, (pk, *vals) in enumerate(qs.values_list('pk', *key_fields).iterator(chunk_size=chunk_size))
+    ]
+    keys.sort()
+    ids = [pk for _, _, pk in keys]
+    del keys
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        objs = qs.model.objects.in_bulk(chunk)
+        for pk in chunk:
+            yield objs[pk]
+
+
+def _codfo(value):
+    return int(value) if str(value).isdigit() else value
+
+
+def _write_grouped_report(fp, title: str, batch, rows: Iterator[Dict[str, Any]], lines: Callable[[Dict[str, Any]], List[str]]) -> None:
+    """Disegna su `fp` le righe (già ordinate) raggruppate per Data Agg. e CodFo."""
+    pdf = _GroupedReportCanvas(fp, title, timezone.now().strftime('%d/%m/%Y'))
+    if batch:
+        pdf.batch_line(batch)
+
+    current_date = None
+    current_codfo = None
+    for r in rows:
+        if r['dtaaggio'] != current_date:
+            current_date = r['dtaaggio']
+            current_codfo = None
+            pdf.date_header(current_date)
+        if r['codfo'] != current_codfo:
+            current_codfo = r['codfo']
+            pdf.codfo_header(current_codfo, r.get('descrccom', ''))
+        pdf.lines(lines(r))
+
+    pdf.save()
+
+
+# -----------------------------
+# Report
+# -----------------------------
+
+def _write_r_aggprezziacq_pdf(batch, fp):
+    """Disegna il PDF r_AggPrezziAcq del batch su `fp` (file-like binario)."""
+    # Ordinamento Access: raggruppa per DataAgg, poi CodFo
+    def sort_key(dta_aggio, ccom, cod_art_fo):
+        codfo = int(ccom) if ccom.strip().isdigit() else ccom
+        return (str(dta_aggio or ''), str(codfo), str(cod_art_fo))
+
+    def rows():
+        if not batch:
+            return
+        qs = IntermediateAggPrAcq.objects.filter(batch=batch)
+        for r in _iter_sorted(qs, ('dta_aggio', 'ccom', 'cod_art_fo'), sort_key):
+            yield {
+                'dtaaggio': r.dta_aggio or '',
+                'codfo': int(r.ccom) if r.ccom.strip().isdigit() else r.ccom,
+                'descrccom': r.descrccom or '',
+                'codart': r.codart,
+                'cod_art_fo': r.cod_art_fo,
+                'stato': r.stato,
+                'descrart': r.descrart,
+                'cidac_prezzo': r.cidac_prezzo,
+                'ros_pracq': r.ros_pracq,
+                'ros_iva': r.ros_iva,
+            }
+
+    _write_grouped_report(fp, "Aggiornamento Prezzi di listino Rossetto", batch, rows(), lambda r: [
+        f"CodArticolo: {r['codart']}  |  CodArtFo: {r['cod_art_fo']}  |  Stato: {r['stato']}",
+        f"{r['descrart']}",
+        f"Prezzo CIDAC {r['cidac_prezzo']}  --->  Ros PrAcq {r['ros_pracq']}  IVA {r['ros_iva']}",
+    ])
+
+
+def _rossetto_sort_key(gold: GoldLookupIndex) -> Callable[[Any, Any], tuple]:
+    """Chiave DataAgg/CodFo/CodArtFo/CodArt presa da t_Rossetto (via indice Gold) per i report EAN e logistica."""
+    def sort_key(codart, cod_art_fo):
+        p = gold.rossetto_by_codart(codart) or {}
+        return (str(p.get('dtaaggio', '') or ''), str(_codfo(p.get('ccom'))), str(cod_art_fo), str(codart))
+    return sort_key
+
+
+def _write_r_aggean_pdf(batch, fp):
+    """Disegna il PDF r_AggEAN del batch su `fp` (file-like binario)."""
+    gold = get_gold_index()
+
+    def rows():
+        if not batch:
+            return
+        qs = IntermediateAggiornaEan.objects.filter(batch=batch)
+        for r in _iter_sorted(qs, ('codart', 'cod_art_fo'), _rossetto_sort_key(gold)):
+            p = gold.rossetto_by_codart(r.codart) or {}
+            yield {
+                'dtaaggio': p.get('dtaaggio', '') or '',
+                'codfo': _codfo(p.get('ccom')),
+                'descrccom': p.get('descrccom', ''),
+                'codart': r.codart,
+                'cod_art_fo': r.cod_art_fo,
+                'stato': p.get('stato', ''),
+                'descrart': p.get('descrart', r.descrizione_articolo),
+                'ean': r.ean,
+            }
+
+    _write_grouped_report(fp, "Aggiornamento EAN Rossetto", batch, rows(), lambda r: [
+        f"CodArticolo: {r['codart']}  |  CodArtFo: {r['cod_art_fo']}  |  Stato: {r['stato']}",
+        f"{r['descrart']}",
+        f"AGGIUNGERE  --->  {r['ean']}",
+    ])
+
+
+def _write_r_agglogistica_pdf(batch, fp):
+    """Disegna il PDF r_AggLogistica del batch su `fp` (file-like binario)."""
+    gold = get_gold_index()
+
+    def rows():
+        if not batch:
+            return
+        qs = IntermediateAggiornamentiVari.objects.filter(batch=batch)
+        for r in _iter_sorted(qs, ('codart', 'cod_art_fo'), _rossetto_sort_key(gold)):
+            p = gold.rossetto_by_codart(r.codart) or {}
+            yield {
+                'dtaaggio': p.get('dtaaggio', '') or '',
+                'codfo': _codfo(p.get('ccom')),
+                'descrccom': p.get('descrccom', ''),
+                'codart': r.codart,
+                'cod_art_fo': r.cod_art_fo,
+                'stato': p.get('stato', ''),
+                'descrizione_articolo': r.descrizione_articolo,
+                'cidac_pz_x_crt': r.cidac_pz_x_crt,
+                'agg_pz_x_crt': r.agg_pz_x_crt,
+                'r_pz_x_crt': r.r_pz_x_crt,
+                'cidac_crt_x_str': r.cidac_crt_x_str,
+                'agg_crt_x_str': r.agg_crt_x_str,
+                'r_crt_x_str': r.r_crt_x_str,
+                'cidac_str_x_plt': r.cidac_str_x_plt,
+                'agg_str_x_plt': r.agg_str_x_plt,
+                'r_str_x_plt': r.r_str_x_plt,
+            }
+
+    _write_grouped_report(fp, "Aggiornamento Logistica Rossetto", batch, rows(), lambda r: [
+        f"CodArticolo: {r['codart']}  |  CodArtFo: {r['cod_art_fo']}  |  Stato: {r['stato']}",
+        f"{r['descrizione_articolo']}",
+        f"PezziXCartone: {r['cidac_pz_x_crt']} ---> {r['r_pz_x_crt']}  {r['agg_pz_x_crt'] or ''}",
+        f"CartoniXStrato: {r['cidac_crt_x_str']} ---> {r['r_crt_x_str']}  {r['agg_crt_x_str'] or ''}",
+        f"StratoXPallet: {r['cidac_str_x_plt']} ---> {r['r_str_x_plt']}  {r['agg_str_x_plt'] or ''}",
+    ])
+
+
+# Report PDF: nome -> (writer, prefisso file, modello intermedio)
+PDF_REPORTS = {
+    'r_aggprezziacq': (_write_r_aggprezziacq_pdf, "r_AggPrezziAcq", IntermediateAggPrAcq),
+    'r_aggean': (_write_r_aggean_pdf, "r_AggEAN", IntermediateAggiornaEan),
+    'r_agglogistica': (_write_r_agglogistica_pdf, "r_AggLogistica", IntermediateAggiornamentiVari),
+}
+
+
+# -----------------------------
+# Cache su disco
+# -----------------------------
+
+def pdf_cache_dir() -> str:
+    from .jobs import jobs_output_dir
+
+    root = getattr(settings, 'IMPORTELAB_PDF_CACHE_DIR', None) or os.path.join(jobs_output_dir(), 'pdf_cache')
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def report_filename(report: str, batch: ImportBatch | None) -> str:
+    _, prefix, _ = PDF_REPORTS[report]
+    return f"{prefix}_batch{batch.id if batch else 'NA'}.pdf"
+
+
+def _cache_key(report: str, batch: ImportBatch | None) -> str:
+    """Chiave del PDF: batch, generazione Gold, stato delle righe intermedie e data di stampa."""
+    _, _, model = PDF_REPORTS[report]
+    rows = {'n': 0, 'last': None}
+    if batch:
+        rows = model.objects.filter(batch=batch).aggregate(n=Count('id'), last=Max('id'))
+    # Solo la generazione (una query aggregata): l'indice Gold si costruisce se il PDF va generato
+    parts = (report, batch.id if batch else 'NA', current_generation(), rows['n'], rows['last'], timezone.now().strftime('%Y%m%d'))
+    return hashlib.sha1('|'.join(map(str, parts)).encode('utf-8')).hexdigest()[:16]
+
+
+def cached_report_pdf(report: str, batch: ImportBatch | None) -> str:
+    """Percorso del PDF `report` per `batch`, generato solo se non già in cache.
+
+    Il PDF viene scritto su un file temporaneo e poi rinominato, quindi chi
+    legge la cache non vede mai file parziali; le versioni superate dello
+    stesso report/batch vengono rimosse.
+    """
+    writer, _, _ = PDF_REPORTS[report]
+    root = pdf_cache_dir()
+    stem = report_filename(report, batch)[:-len('.pdf')]
+    path = os.path.join(root, f"{stem}_{_cache_key(report, batch)}.pdf")
+    if os.path.exists(path):
+        return path
+
+    fd, tmp = tempfile.mkstemp(dir=root, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            writer(batch, fp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    for old in glob.glob(os.path.join(root, f"{glob.escape(stem)}_*.pdf")):
+        if old != path:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return path
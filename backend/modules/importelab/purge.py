@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List
+
+import os
+import shutil
+
+from django.db import router, transaction
+
+from .models import (
+    ImportBatch,
+    ImportRow,
+    IntermediateAggiornaEan,
+    IntermediateAggiornamentiVari,
+    IntermediateAggPrAcq,
+)
+
+# Batch per statement/transazione: ogni tabella figlia è svuotata con un DELETE
+# ... WHERE batch_id IN (...). SQL Server accetta al massimo 2100 parametri per
+# statement: il blocco non può superare MAX_PURGE_CHUNK_SIZE (come goldsync e giacenze)
+PURGE_CHUNK_SIZE = 100
+MAX_PURGE_CHUNK_SIZE = 1000
+
+# Tabelle figlie di ImportBatch, cancellate prima del batch
+BATCH_CHILD_MODELS = (IntermediateAggPrAcq, IntermediateAggiornaEan, IntermediateAggiornamentiVari, ImportRow)
+
+
+def _delete_batch_rows(model, batch_ids: List[int]) -> int:
+    """DELETE set-based delle righe di `model` dei batch dati.
+
+    I modelli figli non hanno relazioni né segnali: QuerySet.delete() esegue
+    un solo DELETE ... WHERE batch_id IN (...) senza caricare gli oggetti.
+    """
+    alias = router.db_for_write(model)
+    with transaction.atomic(using=alias):
+        n, _ = model.objects.using(alias).filter(batch_id__in=batch_ids).delete()
+    return n
+
+
+def purge_batches(batch_ids: Iterable[int], chunk_size: int = PURGE_CHUNK_SIZE, delete_files: bool = False) -> Dict[str, int]:
+    """Elimina i batch indicati e tutte le righe collegate, tabella per tabella.
+
+    Evita la cascade dell'ORM (che raccoglie in memoria ogni ImportRow e riga
+    intermedia): a blocchi di `chunk_size` batch (max MAX_PURGE_CHUNK_SIZE),
+    ogni tabella figlia è svuotata con un DELETE per blocco, poi si eliminano
+    i batch. Con `delete_files` viene rimossa anche la cartella server-side
+    del batch (import_dir).
+    Ritorna il numero di righe eliminate per tabella.
+    """
+    if not 0 < chunk_size <= MAX_PURGE_CHUNK_SIZE:
+        raise ValueError(f"chunk_size deve essere fra 1 e {MAX_PURGE_CHUNK_SIZE}")
+    batch_ids = list(batch_ids)
+    if not batch_ids:
+        return {}
+
+    counts = {model._meta.db_table: 0 for model in BATCH_CHILD_MODELS + (ImportBatch,)}
+    dirs = []
+    for i in range(0, len(batch_ids), chunk_size):
+        chunk = batch_ids[i:i + chunk_size]
+        for model in BATCH_CHILD_MODELS:
+            counts[model._meta.db_table] += _delete_batch_rows(model, chunk)
+        if delete_files:
+            dirs.extend(d for d in ImportBatch.objects.filter(pk__in=chunk).values_list('import_dir', flat=True) if d)
+        with transaction.atomic(using=router.db_for_write(ImportBatch)):
+            _, per_model = ImportBatch.objects.filter(pk__in=chunk).delete()
+        counts[ImportBatch._meta.db_table] += per_model.get(ImportBatch._meta.label, 0)
+
+    for d in dirs:
+        if os.path.isdir(d):
+            shutil.rmtree(d, ignore_errors=True)
+    return counts
+
+
+def purge_batch(batch: ImportBatch) -> Dict[str, int]:
+    """Come purge_batches, per un solo batch (cancellazione dalla dashboard)."""
+    return purge_batches([batch.pk])
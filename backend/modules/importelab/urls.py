@@ -3,6 +3,7 @@ from .views import (
     dashboard_view,
     ordine_email_view,
     delete_batch_view,
+    batch_diff_view,
     sync_gold_view,
     regen_intermediate_view,
     report_r_aggprezziacq_view,
@@ -11,6 +12,9 @@ from .views import (
     report_r_aggean_pdf_view,
     report_r_agglogistica_view,
     report_r_agglogistica_pdf_view,
+    report_pdf_job_view,
+    job_status_view,
+    job_download_view,
 )
 
 app_name = 'importelab'
@@ -18,6 +22,7 @@ app_name = 'importelab'
 urlpatterns = [
     path('', dashboard_view, name='dashboard'),
     path('batch/<int:pk>/delete/', delete_batch_view, name='delete_batch'),
+    path('batch/<int:pk>/diff/', batch_diff_view, name='batch_diff'),
     path('gold/sync/', sync_gold_view, name='sync_gold'),
     path('intermediate/regen/', regen_intermediate_view, name='regen_intermediate'),
     path('ordine/email/', ordine_email_view, name='ordine_email'),
@@ -27,4 +32,7 @@ urlpatterns = [
     path('report/ean/pdf/', report_r_aggean_pdf_view, name='report_r_aggean_pdf'),
     path('report/logistica/', report_r_agglogistica_view, name='report_r_agglogistica'),
     path('report/logistica/pdf/', report_r_agglogistica_pdf_view, name='report_r_agglogistica_pdf'),
+    path('report/<str:report>/pdf/job/', report_pdf_job_view, name='report_pdf_job'),
+    path('jobs/<int:pk>/', job_status_view, name='job_status'),
+    path('jobs/<int:pk>/download/', job_download_view, name='job_download'),
 ]
\ No newline at end of file
@@ -1,3 +1,17 @@
+import codecs
+import hashlib
+import json
+import os
+import re
+from decimal import Decimal, InvalidOperation
+
+
+# Caratteri che str.splitlines() considera fine riga
+_LINE_BREAKS = '\r\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
 def decode_elab(raw_bytes: bytes) -> str:
     """Decodifica il file .elab (prima UTF-8, poi Latin-1)."""
     try:
@@ -26,9 +40,46 @@ def _to_float(value: str):
         return None
 
 
-def parse_elab_text(text: str):
+def iter_file_chunks(file_obj, chunk_size: int = READ_CHUNK_SIZE):
+    """Yield the raw bytes of an uploaded/opened file from the start, chunk by chunk."""
+    file_obj.seek(0)
+    if hasattr(file_obj, 'chunks'):
+        yield from file_obj.chunks(chunk_size)
+        return
+    while True:
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def iter_elab_text(raw_chunks, encoding: str = 'utf-8'):
+    """Decodifica incrementale di blocchi di byte del file .elab: produce blocchi di testo.
+
+    In UTF-8 la decodifica è stretta: un byte non valido solleva
+    UnicodeDecodeError e il chiamante rilegge in Latin-1, come decode_elab.
     """
-    Ritorna una lista di dict tipizzati con i campi di dominio.
+    errors = 'strict' if encoding == 'utf-8' else 'replace'
+    yield from codecs.iterdecode(raw_chunks, encoding, errors=errors)
+
+
+def iter_lines(text_chunks):
+    """Split a stream of text chunks into lines (same separators as str.splitlines)."""
+    pending = ''
+    for text in text_chunks:
+        pending += text
+        lines = pending.splitlines(keepends=True)
+        # l'ultima riga può proseguire nel blocco successivo
+        pending = lines.pop() if lines and lines[-1][-1] not in _LINE_BREAKS else ''
+        for line in lines:
+            yield line.rstrip(_LINE_BREAKS)
+    if pending:
+        yield pending
+
+
+def parse_elab_line(line: str):
+    """
+    Ritorna il dict tipizzato per una riga del file, None se la riga è vuota.
     Ordine atteso delle colonne nel file:
     0: CodArtFo (str)
     1: DescrizioneArticolo (str)
@@ -41,34 +92,83 @@ def parse_elab_text(text: str):
     8: TotColli (int)
     9: Ean (str)
     """
+    raw = line.rstrip('\n\r')
+    line = line.strip()
+    if not line:
+        return None
+
+    cols = [c.strip() for c in line.split(';')]
+
+    # garantisco almeno 10 colonne
+    while len(cols) < 10:
+        cols.append('')
+
+    return {
+        "raw_line": raw,
+        "cod_art_fo": cols[0],
+        "descrizione_articolo": cols[1],
+        "iva": _to_int(cols[2]),
+        "prz_acq": _to_float(cols[3]),
+        "campo5": _to_float(cols[4]),
+        "pz_x_crt": _to_int(cols[5]),
+        "crt_x_str": _to_int(cols[6]),
+        "str_x_plt": _to_int(cols[7]),
+        "tot_colli": _to_int(cols[8]),
+        "ean": cols[9],
+    }
 
-    rows = []
-
-    for line in text.splitlines():
-        raw = line.rstrip('\n\r')
-        line = line.strip()
-        if not line:
-            continue
-
-        cols = [c.strip() for c in line.split(';')]
-
-        # garantisco almeno 10 colonne
-        while len(cols) < 10:
-            cols.append('')
-
-        row = {
-            "raw_line": raw,
-            "cod_art_fo": cols[0],
-            "descrizione_articolo": cols[1],
-            "iva": _to_int(cols[2]),
-            "prz_acq": _to_float(cols[3]),
-            "campo5": _to_float(cols[4]),
-            "pz_x_crt": _to_int(cols[5]),
-            "crt_x_str": _to_int(cols[6]),
-            "str_x_plt": _to_int(cols[7]),
-            "tot_colli": _to_int(cols[8]),
-            "ean": cols[9],
-        }
-        rows.append(row)
-
-    return rows
+
+def iter_parse_elab(lines):
+    """Generatore: una riga tipizzata (vedi parse_elab_line) per ogni riga non vuota."""
+    for line in lines:
+        row = parse_elab_line(line)
+        if row is not None:
+            yield row
+
+
+def parse_elab_text(text: str):
+    """Ritorna una lista di dict tipizzati con i campi di dominio (vedi parse_elab_line)."""
+    return list(iter_parse_elab(text.splitlines()))
+
+
+# Campi di dominio di ImportRow che entrano nell'hash di riga (tutti tranne raw_line)
+ROW_HASH_FIELDS = (
+    'cod_art_fo', 'descrizione_articolo', 'iva', 'prz_acq', 'campo5',
+    'pz_x_crt', 'crt_x_str', 'str_x_plt', 'tot_colli', 'ean',
+)
+
+# Cifre decimali di ImportRow.prz_acq / campo5: l'hash usa il valore come salvato nel DB
+_DECIMAL_STEP = Decimal('0.0001')
+
+
+def _hash_value(value):
+    if isinstance(value, (float, Decimal)):
+        try:
+            return str(Decimal(str(value)).quantize(_DECIMAL_STEP).normalize())
+        except InvalidOperation:
+            return str(value)
+    return value
+
+
+def elab_row_hash(row) -> str:
+    """Hash (sha1) dei campi di dominio di una riga .elab: dict di parse_elab_line o ImportRow.
+
+    I decimali sono normalizzati come nel DB, quindi la riga appena letta dal
+    file e la stessa riga riletta da ImportRow hanno lo stesso hash.
+    """
+    get = row.get if isinstance(row, dict) else (lambda f: getattr(row, f))
+    values = [_hash_value(get(f)) for f in ROW_HASH_FIELDS]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def elab_supplier_key(filename: str) -> str:
+    """Codice fornitore dal nome del file .elab (es. 090226_125420_L030060.elab -> L030060).
+
+    È l'ultimo blocco del nome che contiene lettere; data e ora dell'export vengono ignorate.
+    """
+    stem = os.path.splitext(os.path.basename(filename or ''))[0]
+    parts = [p for p in re.split(r'[_\-\s]+', stem) if p]
+    for part in reversed(parts):
+        if any(c.isalpha() for c in part):
+            return part.upper()[:64]
+    return stem.upper()[:64]
@@ -32,16 +32,18 @@ def _format_colliord_to_5digits(value) -> str:
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.utils import timezone
 from django.db.models import Q
-from django.db import connections
+from django.db import connections, transaction
 from django.conf import settings
 from datetime import datetime
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 import os
 import csv
+import base64
+import zlib
 from pathlib import Path
 
 # Email draft (.eml) generation for environments without Outlook
@@ -49,60 +51,25 @@ from email.message import EmailMessage
 from email.policy import default as email_default_policy
 from io import BytesIO
 
-def _normalize_codart_key(value):
-    if value is None:
-        return []
-    s = str(value).strip()
-    if not s:
-        return []
-    keys = [s, s.lstrip("0") or "0"]
-    try:
-        keys.append(str(int(float(s))))
-    except Exception:
-        pass
-    out=[]
-    for k in keys:
-        if k not in out:
-            out.append(k)
-    return out
-
-
-def _rossetto_index_by_codart_v2():
-    """Build index from GoldTableSnapshot rows (source_table dbo.t_Rossetto) keyed by CODART variants."""
-    index = {}
-    for snap in GoldTableSnapshot.objects.filter(source_table='dbo.t_Rossetto').only('payload').iterator(chunk_size=5000):
-        p = snap.payload or {}
-        codart = p.get('CODART') or p.get('CodArt') or p.get('codart')
-        norm = dict(p)
-        norm['stato'] = p.get('STATO') or p.get('Stato') or ''
-        norm['descrccom'] = p.get('DESCRCCOM') or p.get('DescrCCOM') or ''
-        norm['ccom'] = p.get('CCOM') or p.get('Ccom') or ''
-        norm['dtaaggio'] = p.get('DTAAGGIO') or p.get('DtaAggio') or ''
-        norm['descrart'] = p.get('DESCRART') or p.get('DescrArt') or ''
-        for k in _normalize_codart_key(codart):
-            index[k] = norm
-    return index
-
-
-def _rossetto_get(index, codart):
-    for k in _normalize_codart_key(codart):
-        r = index.get(k)
-        if r:
-            return r
-    return None
-
-
-
-from .goldsync import sync_gold_tables, get_preview_from_local
-from .intermediate import rebuild_intermediate_queries, get_intermediate_previews
+from .goldindex import get_gold_index
+from .goldsync import get_preview_from_local
+from .batchdiff import diff_batches
+from .intermediate import get_intermediate_previews, previous_supplier_batch, rebuild_intermediate_queries
+from .purge import purge_batch
+from .pdfreports import PDF_REPORTS, cached_report_pdf, report_filename
+from .jobs import (
+    JOB_REGEN_INTERMEDIATE, JOB_REPORT_PDF, JOB_SYNC_GOLD, last_finished_job, start_job_runner, submit_job,
+)
 
 from .forms import ElabUploadForm, OrderEmailForm
+from .ordinitxt import iter_ordini_rossetto_txt
 from .outlook import create_outlook_mail_with_attachment
-from .utils import decode_elab, parse_elab_text
+from .utils import elab_row_hash, elab_supplier_key, iter_elab_text, iter_file_chunks, iter_lines, iter_parse_elab
 from .models import (
+    RAW_ZLIB_PREFIX,
     ImportBatch,
+    ImportJob,
     ImportRow,
-    GoldTableSnapshot,
     IntermediateAggPrAcq,
     IntermediateAggiornaEan,
     IntermediateAggiornamentiVari,
@@ -159,149 +126,6 @@ def _safe_str(value) -> str:
 
 
 
-def _fetch_ordini_rossetto_rows_from_txt(txt_path: str):
-    """Read a TXT export of dbo_t_OrdiniRossetto and return rows as dicts.
-
-    Supports:
-    - header row (preferred) with column names, delimited by ;,|,tab,comma
-    - NO header (your current file): uses deterministic fixed positions for the Rossetto export
-      (CSV with delimiter ';' and quotechar '"').
-
-    Required keys returned: CODARTFO, COLLIORD, DATA_ORDINE, DATA_CONSEGNA, DCDCEXCDE
-    """
-    import csv
-    import re
-
-    def norm(s: str) -> str:
-        return re.sub(r"[^A-Z0-9_]", "", (s or "").strip().upper())
-
-    # Read all non-empty lines first
-    with open(txt_path, "r", encoding="utf-8", errors="replace", newline="") as fp:
-        raw = fp.read()
-
-    raw_lines = [ln for ln in raw.splitlines() if ln.strip() != ""]
-    if not raw_lines:
-        return []
-
-    sample = raw_lines[0]
-    likely_semicolon = sample.count(";") >= 3
-
-    if likely_semicolon:
-        with open(txt_path, "r", encoding="utf-8", errors="replace", newline="") as fp:
-            reader = csv.reader(fp, delimiter=";", quotechar='"')
-            rows = [r for r in reader if any((c or "").strip() for c in r)]
-
-        if not rows:
-            return []
-
-        required = {"CODARTFO", "COLLIORD", "DATA_ORDINE", "DATA_CONSEGNA", "DCDCEXCDE"}
-        first_norm = [norm(c) for c in rows[0]]
-        has_header = any(h in required for h in first_norm)
-
-        if has_header:
-            idx = {first_norm[i]: i for i in range(len(first_norm))}
-            missing = [c for c in required if c not in idx]
-            if missing:
-                raise ValueError(f"Header TXT mancante colonne: {missing}. Header letto: {first_norm}")
-
-            out = []
-            for parts in rows[1:]:
-                out.append({
-                    "CODARTFO": parts[idx["CODARTFO"]].strip() if idx["CODARTFO"] < len(parts) else "",
-                    "COLLIORD": parts[idx["COLLIORD"]].strip() if idx["COLLIORD"] < len(parts) else "",
-                    "DATA_ORDINE": parts[idx["DATA_ORDINE"]].strip() if idx["DATA_ORDINE"] < len(parts) else "",
-                    "DATA_CONSEGNA": parts[idx["DATA_CONSEGNA"]].strip() if idx["DATA_CONSEGNA"] < len(parts) else "",
-                    "DCDCEXCDE": parts[idx["DCDCEXCDE"]].strip() if idx["DCDCEXCDE"] < len(parts) else "",
-                })
-            return out
-
-        # NO header: deterministic mapping for your export (verified on dbo_t_OrdiniRossetto_giovedi.txt)
-        def safe(parts, i):
-            return parts[i].strip() if i < len(parts) else ""
-
-        out = []
-        for parts in rows:
-            out.append({
-                "DATA_ORDINE": safe(parts, 2),
-                "DATA_CONSEGNA": safe(parts, 3),
-                "CODARTFO": safe(parts, 9),
-                "DCDCEXCDE": safe(parts, 10),
-                "COLLIORD": safe(parts, 11),
-            })
-        return out
-
-    # Fallback: delimiter detection without quotes
-    delimiter = None
-    for d in ["	", "|", ","]:
-        if sample.count(d) >= 3:
-            delimiter = d
-            break
-    if delimiter is None:
-        raise ValueError("Separatore TXT non riconosciuto. Attesi ';' (consigliato), tab, '|', ','.")
-
-    required_list = ["CODARTFO", "COLLIORD", "DATA_ORDINE", "DATA_CONSEGNA", "DCDCEXCDE"]
-    first_parts = [c.strip() for c in raw_lines[0].split(delimiter)]
-    first_norm = [norm(p) for p in first_parts]
-    has_header = any(h in set(required_list) for h in first_norm)
-
-    rows_out = []
-    if has_header:
-        idx = {first_norm[i]: i for i in range(len(first_norm))}
-        missing = [c for c in required_list if c not in idx]
-        if missing:
-            raise ValueError(f"Header TXT mancante colonne: {missing}. Header letto: {first_norm}")
-        for ln in raw_lines[1:]:
-            parts = [c.strip() for c in ln.split(delimiter)]
-            rows_out.append({
-                "CODARTFO": parts[idx["CODARTFO"]] if idx["CODARTFO"] < len(parts) else "",
-                "COLLIORD": parts[idx["COLLIORD"]] if idx["COLLIORD"] < len(parts) else "",
-                "DATA_ORDINE": parts[idx["DATA_ORDINE"]] if idx["DATA_ORDINE"] < len(parts) else "",
-                "DATA_CONSEGNA": parts[idx["DATA_CONSEGNA"]] if idx["DATA_CONSEGNA"] < len(parts) else "",
-                "DCDCEXCDE": parts[idx["DCDCEXCDE"]] if idx["DCDCEXCDE"] < len(parts) else "",
-            })
-        return rows_out
-
-    raise ValueError("TXT senza header non supportato per questo formato. Usa export con ';' e virgolette oppure aggiungi header.")
-    # No header: try heuristic mapping on first data row
-    parts0 = first_parts
-    date_idxs = [i for i, v in enumerate(parts0) if looks_like_date(v)]
-    cod_idxs = [i for i, v in enumerate(parts0) if looks_like_codartfo(v)]
-    colli_idxs = [i for i, v in enumerate(parts0) if (v or "").strip().isdigit()]
-
-    if not cod_idxs or len(date_idxs) < 2:
-        raise ValueError("Impossibile inferire le colonne dal TXT senza header. Aggiungi la riga di intestazione con i nomi dei campi.")
-
-    cod_i = cod_idxs[0]
-    colli_i = None
-    for i in colli_idxs:
-        if i not in date_idxs and i != cod_i:
-            colli_i = i
-            break
-    if colli_i is None:
-        for i in range(len(parts0)):
-            if i != cod_i and parts0[i].strip().isdigit():
-                colli_i = i
-                break
-
-    d1_i, d2_i = date_idxs[0], date_idxs[1]
-
-    candidates = [(i, len(parts0[i].strip())) for i in range(len(parts0)) if i not in {cod_i, colli_i, d1_i, d2_i} and parts0[i].strip()]
-    dcdc_i = max(candidates, key=lambda x: x[1])[0] if candidates else 0
-
-    def map_parts(parts):
-        return {
-            "CODARTFO": parts[cod_i] if cod_i < len(parts) else "",
-            "COLLIORD": parts[colli_i] if colli_i < len(parts) else "",
-            "DATA_ORDINE": parts[d1_i] if d1_i < len(parts) else "",
-            "DATA_CONSEGNA": parts[d2_i] if d2_i < len(parts) else "",
-            "DCDCEXCDE": parts[dcdc_i] if dcdc_i < len(parts) else "",
-        }
-
-    rows_out.append(map_parts(parts0))
-    for ln in raw_lines[1:]:
-        rows_out.append(map_parts(split_row(ln)))
-    return rows_out
-
 def _fetch_ordini_rossetto_rows():
     """Fetch rows for Rossetto order export.
 
@@ -309,7 +133,8 @@ def _fetch_ordini_rossetto_rows():
     1) Offline test TXT (if present in ELAB_SOURCE_DIR)
     2) GoldReport connection (connections['goldreport'])
 
-    Returns list[dict] with keys CODARTFO, COLLIORD, DATA_ORDINE, DATA_CONSEGNA, DCDCEXCDE.
+    Returns an iterable of dicts with keys CODARTFO, COLLIORD, DATA_ORDINE, DATA_CONSEGNA, DCDCEXCDE
+    (lazy for the TXT source).
     """
     # 1) Optional offline test mode
     txt_name = getattr(settings, "ORDINI_TXT_TEST_FILE", "dbo_t_OrdiniRossetto_giovedi.txt")
@@ -317,7 +142,7 @@ def _fetch_ordini_rossetto_rows():
     if source_dir:
         txt_path = Path(source_dir) / txt_name
         if txt_path.exists():
-            return _fetch_ordini_rossetto_rows_from_txt(str(txt_path))
+            return iter_ordini_rossetto_txt(str(txt_path))
 
     # 2) GoldReport
     candidates = [
@@ -393,46 +218,42 @@ def generate_ordine_ext_file(destination_dir: str) -> str:
     fixed_espr2 = "0060235"
     fixed_espr4 = " " * 32
 
-    lines = []
-    for i, r in enumerate(rows, start=1):
-        codartfo = _safe_str(r.get("CODARTFO"))
-        colliord = _safe_str(r.get("COLLIORD"))
-        data_ordine = _format_ddmmyyyy_to_yyyymmdd(r.get("DATA_ORDINE"))
-        data_consegna = _format_ddmmyyyy_to_yyyymmdd(r.get("DATA_CONSEGNA"))
-        dcdcexcde = _safe_str(r.get("DCDCEXCDE"))
-
-        espr3 = codartfo[:7]
-        espr5 = _format_colliord_to_5digits(r.get("COLLIORD"))
-
-        # Mid(DCDCEXCDE, 8, 6) in Access => python [7:13]
-        espr8 = dcdcexcde[7:13].ljust(6)
-
-        espr11 = str(i).zfill(9)
-
-        line = (
-            fixed_espr1 +
-            fixed_espr2 +
-            espr3 +
-            fixed_espr4 +
-            espr5 +
-            data_ordine +
-            data_consegna +
-            espr8 +
-            data_ordine +
-            espr11
-        )
-        lines.append(line)
-
-    # Write with CRLF, like legacy exports
+    # Write with CRLF, like legacy exports (one record at a time: rows may be lazy)
     with open(output_path, "w", encoding="utf-8", newline="") as fp:
-        for line in lines:
+        for i, r in enumerate(rows, start=1):
+            codartfo = _safe_str(r.get("CODARTFO"))
+            colliord = _safe_str(r.get("COLLIORD"))
+            data_ordine = _format_ddmmyyyy_to_yyyymmdd(r.get("DATA_ORDINE"))
+            data_consegna = _format_ddmmyyyy_to_yyyymmdd(r.get("DATA_CONSEGNA"))
+            dcdcexcde = _safe_str(r.get("DCDCEXCDE"))
+
+            espr3 = codartfo[:7]
+            espr5 = _format_colliord_to_5digits(r.get("COLLIORD"))
+
+            # Mid(DCDCEXCDE, 8, 6) in Access => python [7:13]
+            espr8 = dcdcexcde[7:13].ljust(6)
+
+            espr11 = str(i).zfill(9)
+
+            line = (
+                fixed_espr1 +
+                fixed_espr2 +
+                espr3 +
+                fixed_espr4 +
+                espr5 +
+                data_ordine +
+                data_consegna +
+                espr8 +
+                data_ordine +
+                espr11
+            )
             fp.write(line)
             fp.write("\r\n")
 
     return output_path
 
-def _save_uploaded_file_to_batch_folder(file_obj, batch_id: int) -> tuple[str, str]:
-    """Salva una copia del file caricato in una cartella server-side per il batch.
+def _batch_copy_path(file_obj, batch_id: int) -> tuple[str, str]:
+    """Cartella server-side del batch (creata) e nome della copia del file caricato.
     Ritorna (batch_folder, saved_filename).
     """
     root = getattr(settings, "IMPORT_FILES_DIR", os.path.join(os.path.dirname(__file__), "_import_files"))
@@ -442,12 +263,120 @@ def _save_uploaded_file_to_batch_folder(file_obj, batch_id: int) -> tuple[str, s
     safe_name = f"{batch_id}_{stamp}_{file_obj.name}"
     batch_folder = os.path.join(root, f"batch_{batch_id}_{stamp}")
     _ensure_dir(batch_folder)
-    saved_path = os.path.join(batch_folder, safe_name)
-    with open(saved_path, "wb") as out:
-        for chunk in file_obj.chunks():
-            out.write(chunk)
     return batch_folder, safe_name
 
+
+def _ingest_elab_rows(batch: ImportBatch, file_obj, encoding: str, copy_path, raw_mode: str) -> str:
+    """Una lettura del file: ogni blocco è scritto nella copia su disco, decodificato
+    e parsato; le ImportRow sono inserite a blocchi. Ritorna il raw_content del batch.
+    """
+    chunk_size = getattr(settings, "ELAB_INGEST_CHUNK_SIZE", 2000)
+    compressor = zlib.compressobj()
+    compressed = []
+    text_parts = []
+
+    copy_fp = None
+    if copy_path:
+        try:
+            copy_fp = open(copy_path, "wb")
+        except OSError:
+            # Non bloccare l'import se la copia su disco fallisce
+            copy_fp = None
+    if raw_mode == "file" and copy_fp is None:
+        # Senza copia su disco il testo resta nel batch
+        raw_mode = "text"
+
+    def _raw_chunks():
+        for chunk in iter_file_chunks(file_obj):
+            if copy_fp:
+                copy_fp.write(chunk)
+            yield chunk
+
+    def _text_chunks():
+        for text in iter_elab_text(_raw_chunks(), encoding):
+            if raw_mode == "compressed":
+                compressed.append(compressor.compress(text.encode("utf-8")))
+            elif raw_mode != "file":
+                text_parts.append(text)
+            yield text
+
+    try:
+        objs = []
+        for i, row in enumerate(iter_parse_elab(iter_lines(_text_chunks())), start=1):
+            objs.append(ImportRow(
+                batch=batch,
+                line_number=i,
+                raw_line=row["raw_line"],
+                cod_art_fo=row["cod_art_fo"],
+                descrizione_articolo=row["descrizione_articolo"],
+                iva=row["iva"],
+                prz_acq=row["prz_acq"],
+                campo5=row["campo5"],
+                pz_x_crt=row["pz_x_crt"],
+                crt_x_str=row["crt_x_str"],
+                str_x_plt=row["str_x_plt"],
+                tot_colli=row["tot_colli"],
+                ean=row["ean"],
+                row_hash=elab_row_hash(row),
+            ))
+            if len(objs) >= chunk_size:
+                ImportRow.objects.bulk_create(objs)
+                objs = []
+        if objs:
+            ImportRow.objects.bulk_create(objs)
+    finally:
+        if copy_fp:
+            copy_fp.close()
+
+    if copy_fp:
+        batch.import_dir, batch.import_saved_name = os.path.split(copy_path)
+
+    if raw_mode == "compressed":
+        compressed.append(compressor.flush())
+        return RAW_ZLIB_PREFIX + base64.b64encode(b"".join(compressed)).decode("ascii")
+    if raw_mode == "file":
+        return ""
+    return "".join(text_parts)
+
+
+def _ingest_elab_upload(file_obj) -> ImportBatch:
+    """Importa un file .elab in streaming con una sola lettura del file caricato:
+    copia su disco, decodifica e parsing riga per riga avvengono sugli stessi
+    blocchi; le ImportRow sono inserite a blocchi di ELAB_INGEST_CHUNK_SIZE in
+    un'unica transazione.
+
+    Come decode_elab il file è letto in UTF-8; se non lo è (raro) le righe già
+    inserite sono scartate e il file è riletto in Latin-1.
+
+    settings.ELAB_RAW_CONTENT_MODE decide cosa salvare in ImportBatch.raw_content:
+    'text' (default, testo integrale), 'compressed' (zlib) o 'file' (solo la
+    copia su disco); negli ultimi due casi va letto con ImportBatch.get_raw_content.
+    """
+    raw_mode = getattr(settings, "ELAB_RAW_CONTENT_MODE", "text")
+
+    with transaction.atomic():
+        batch = ImportBatch.objects.create(
+            filename=file_obj.name, raw_content="", supplier_key=elab_supplier_key(file_obj.name),
+        )
+
+        # Copia server-side del file importato (per ritrovare la cartella del batch)
+        try:
+            copy_path = os.path.join(*_batch_copy_path(file_obj, batch.id))
+        except OSError:
+            copy_path = None
+
+        try:
+            raw_content = _ingest_elab_rows(batch, file_obj, "utf-8", copy_path, raw_mode)
+        except UnicodeDecodeError:
+            ImportRow.objects.filter(batch=batch).delete()
+            raw_content = _ingest_elab_rows(batch, file_obj, "latin-1", copy_path, raw_mode)
+
+        batch.raw_content = raw_content
+        batch.save(update_fields=["raw_content", "import_dir", "import_saved_name"])
+
+    return batch
+
+
 @csrf_exempt
 def dashboard_view(request):
     """
@@ -476,44 +405,7 @@ def dashboard_view(request):
         form = ElabUploadForm(request.POST, request.FILES)
         if form.is_valid():
             f = form.cleaned_data['file']
-            raw_bytes = f.read()
-            text = decode_elab(raw_bytes)
-            parsed_rows = parse_elab_text(text)
-
-            batch = ImportBatch.objects.create(
-                filename=f.name,
-                raw_content=text,
-            )
-
-            # Salva una copia server-side del file importato (per ritrovare la cartella del batch)
-            try:
-                batch_folder, saved_name = _save_uploaded_file_to_batch_folder(f, batch.id)
-                batch.import_dir = batch_folder
-                batch.import_saved_name = saved_name
-                batch.save(update_fields=['import_dir', 'import_saved_name'])
-            except Exception:
-                # Non bloccare l'import se la copia su disco fallisce
-                pass
-
-            objs = []
-            for i, row in enumerate(parsed_rows, start=1):
-                objs.append(ImportRow(
-                    batch=batch,
-                    line_number=i,
-                    raw_line=row["raw_line"],
-                    cod_art_fo=row["cod_art_fo"],
-                    descrizione_articolo=row["descrizione_articolo"],
-                    iva=row["iva"],
-                    prz_acq=row["prz_acq"],
-                    campo5=row["campo5"],
-                    pz_x_crt=row["pz_x_crt"],
-                    crt_x_str=row["crt_x_str"],
-                    str_x_plt=row["str_x_plt"],
-                    tot_colli=row["tot_colli"],
-                    ean=row["ean"],
-                ))
-            if objs:
-                ImportRow.objects.bulk_create(objs)
+            batch = _ingest_elab_upload(f)
 
             # Dopo l'upload, rigenera automaticamente le query intermedie (staging)
             # per mantenere i report pronti senza step manuali.
@@ -553,7 +445,8 @@ def dashboard_view(request):
         rows = list(qs)
 
     gold_preview = None
-    gold_sync_info = request.session.get('gold_sync_last')
+    last_sync = last_finished_job(JOB_SYNC_GOLD)
+    gold_sync_info = last_sync.result if last_sync else None
     if request.GET.get('gold') == '1':
         gold_preview = get_preview_from_local(limit=5)
 
@@ -575,55 +468,33 @@ def dashboard_view(request):
         'gold_preview': gold_preview,
         'gold_sync_info': gold_sync_info,
         'upload_info': upload_info,
+        'job': _get_job_from_request(request),
     }
     return render(request, 'importelab/dashboard.html', context)
-def _normalize_codart_key(value):
-    """Return normalized string keys for matching CODART across sources."""
-    if value is None:
-        return []
-    s = str(value).strip()
-    if not s:
-        return []
-    keys = [s]
-    keys.append(s.lstrip("0") or "0")
-    try:
-        i = int(float(s))
-        keys.append(str(i))
-    except Exception:
-        pass
-    # unique preserve order
-    out=[]
-    for k in keys:
-        if k not in out:
-            out.append(k)
-    return out
-
-
-def _rossetto_index_by_codart():
-    """Index GoldTableSnapshot rows (source_table dbo.t_Rossetto) by CODART with robust normalization."""
-    index = {}
-    qs = GoldTableSnapshot.objects.filter(source_table='dbo.t_Rossetto').only('payload')
-    for snap in qs.iterator(chunk_size=5000):
-        p = snap.payload or {}
-        codart = p.get('CODART') or p.get('CodArt') or p.get('codart')
-        # normalize fields used in reports
-        p_norm = dict(p)
-        p_norm['stato'] = p.get('STATO') or p.get('Stato') or ''
-        p_norm['descrccom'] = p.get('DESCRCCOM') or p.get('DescrCCOM') or ''
-        p_norm['ccom'] = p.get('CCOM') or p.get('Ccom') or ''
-        p_norm['dta_aggio'] = p.get('DTAAGGIO') or p.get('DtaAggio') or ''
-        p_norm['descrart'] = p.get('DESCRART') or p.get('DescrArt') or ''
-        for k in _normalize_codart_key(codart):
-            index[k] = p_norm
-    return index
-
-
-def _rossetto_get(index, codart):
-    for k in _normalize_codart_key(codart):
-        r = index.get(k)
-        if r is not None:
-            return r
-    return None
+
+
+def batch_diff_view(request, pk: int):
+    """Cosa è cambiato rispetto all'import precedente dello stesso fornitore (o a ?prev=<id>)."""
+    batch = get_object_or_404(ImportBatch, pk=pk)
+    prev_id = request.GET.get('prev')
+    if prev_id:
+        prev = get_object_or_404(ImportBatch, pk=prev_id)
+    else:
+        prev = previous_supplier_batch(batch)
+
+    limit = getattr(settings, 'ELAB_DIFF_MAX_ROWS', 500)
+    diff = diff_batches(prev, batch) if prev else None
+    ctx = {
+        'batch': batch,
+        'prev': prev,
+        'diff': diff,
+        'limit': limit,
+        'added': diff['added'][:limit] if diff else [],
+        'removed': diff['removed'][:limit] if diff else [],
+        'changed': diff['changed'][:limit] if diff else [],
+    }
+    return render(request, 'importelab/batch_diff.html', ctx)
+
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
@@ -634,7 +505,7 @@ def delete_batch_view(request, pk: int):
     batch = get_object_or_404(ImportBatch, pk=pk)
 
     if request.method == "POST":
-        batch.delete()
+        purge_batch(batch)
         return redirect(reverse('importelab:dashboard'))
 
     rows_count = batch.rows.count()
@@ -647,22 +518,16 @@ def delete_batch_view(request, pk: int):
 @csrf_exempt
 @require_http_methods(["POST"])
 def sync_gold_view(request):
-    """Sync Gold SQL Server tables into local SQLite snapshots and redirect back with preview."""
+    """Accoda la sync delle tabelle Gold come job e torna in dashboard, che ne segue l'avanzamento."""
     limit = getattr(settings, 'GOLD_SYNC_LIMIT', 0)
-    summaries = sync_gold_tables(limit=limit)
-    # store a lightweight message in session
-    request.session['gold_sync_last'] = {
-        'synced_at': datetime.now().isoformat(timespec='seconds'),
-        'summary': {k: {'rows_fetched': v['rows_fetched']} for k, v in summaries.items()},
-    }
-    request.session.modified = True
+    job = submit_job(JOB_SYNC_GOLD, {'limit': limit})
     url = reverse('importelab:dashboard')
-    return redirect(f"{url}?gold=1")
+    return redirect(f"{url}?gold=1&job={job.id}")
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def regen_intermediate_view(request):
-    """Rigenera le 3 query intermedie per il batch selezionato e torna in dashboard con preview."""
+    """Accoda la rigenerazione delle 3 query intermedie per il batch selezionato (job in background)."""
     batch_id = request.POST.get('batch_id') or request.GET.get('batch')
     batch = None
     if batch_id:
@@ -673,16 +538,10 @@ def regen_intermediate_view(request):
             url = reverse('importelab:dashboard')
             return redirect(url)
 
-    counts = rebuild_intermediate_queries(batch)
-    request.session['intermediate_last'] = {
-        'batch_id': batch.id,
-        'filename': batch.filename,
-        'created_at': datetime.now().isoformat(timespec='seconds'),
-        'counts': counts,
-    }
+    job = submit_job(JOB_REGEN_INTERMEDIATE, {'batch_id': batch.id})
 
     url = reverse('importelab:dashboard')
-    return redirect(f"{url}?batch={batch.id}&inter=1")
+    return redirect(f"{url}?batch={batch.id}&inter=1&job={job.id}")
 
 
 
@@ -696,25 +555,20 @@ def _get_batch_from_request(request):
         return get_object_or_404(ImportBatch, pk=batch_id)
     return ImportBatch.objects.order_by('-uploaded_at').first()
 
+def _get_job_from_request(request):
+    """Job da seguire nella pagina (?job=<id>), se presente."""
+    job_id = request.GET.get('job') or ''
+    return ImportJob.objects.filter(pk=job_id).first() if job_id.isdigit() else None
+
 def _get_batch_from_request_or_latest(request):
     """Backward-compatible helper for report views."""
     return _get_batch_from_request(request)
 
-def _draw_pdf_header(c, title, print_date, page_num):
-    from reportlab.lib.units import mm
-    c.setFont("Helvetica-Bold", 20)
-    c.drawString(20*mm, 280*mm, title)
-    c.setFont("Helvetica", 9)
-    c.drawRightString(190*mm, 280*mm, f"Data stampa: {print_date}")
-    c.setFont("Helvetica", 8)
-    c.drawRightString(190*mm, 10*mm, f"Pagina {page_num}")
-
-
-def _pdf_new_page(c, title, print_date, page_num):
-    from reportlab.lib.units import mm
-    c.showPage()
-    _draw_pdf_header(c, title, print_date, page_num)
-    return 270*mm  # y start
+def _pdf_response(report, batch):
+    """PDF del report dalla cache su disco (generato se serve), inviato in streaming."""
+    path = cached_report_pdf(report, batch)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=report_filename(report, batch),
+                        content_type='application/pdf')
 
 
 def report_r_aggprezziacq_view(request):
@@ -747,106 +601,25 @@ def report_r_aggprezziacq_view(request):
         'rows_count': len(rows),
         'print_date': timezone.now().strftime('%d/%m/%Y'),
         'pdf_url': f"{reverse('importelab:report_r_aggprezziacq_pdf')}?batch={batch.id}" if batch else "#",
+        'pdf_job_url': f"{reverse('importelab:report_pdf_job', args=['r_aggprezziacq'])}?batch={batch.id}" if batch else "",
+        'job': _get_job_from_request(request),
     }
     return render(request, 'importelab/report_r_aggprezziacq.html', ctx)
 
 
 def report_r_aggprezziacq_pdf_view(request):
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.units import mm
-    from reportlab.lib.utils import simpleSplit
     batch = _get_batch_from_request(request)
-    rows = list(IntermediateAggPrAcq.objects.filter(batch=batch)) if batch else []
-
-    resp = HttpResponse(content_type='application/pdf')
-    fname = f"r_AggPrezziAcq_batch{batch.id if batch else 'NA'}.pdf"
-    resp['Content-Disposition'] = f'attachment; filename="{fname}"'
-
-    c = canvas.Canvas(resp, pagesize=A4)
-    print_date = timezone.now().strftime('%d/%m/%Y')
-    page_num = 1
-    _draw_pdf_header(c, "Aggiornamento Prezzi di listino Rossetto", print_date, page_num)
-
-    y = 270*mm
-    c.setFont("Helvetica", 9)
-    if batch:
-        c.drawString(20*mm, y, f"Batch: {batch.filename} ({batch.uploaded_at:%d/%m/%Y %H:%M})")
-        y -= 8*mm
-
-    # Prepara righe + ordinamento (Access: raggruppa per DataAgg, poi CodFo)
-    prepared = []
-    for r in rows:
-        codfo_val = (int(r.ccom) if getattr(r, 'ccom', '').strip().isdigit() else getattr(r, 'ccom', ''))
-        prepared.append({
-            'dtaaggio': r.dta_aggio or '',
-            'codfo': codfo_val,
-            'descrccom': r.descrccom or '',
-            'codart': r.codart,
-            'cod_art_fo': r.cod_art_fo,
-            'stato': r.stato,
-            'descrart': r.descrart,
-            'cidac_prezzo': r.cidac_prezzo,
-            'ros_pracq': r.ros_pracq,
-            'ros_iva': r.ros_iva,
-        })
-    prepared.sort(key=lambda x: (str(x['dtaaggio']), str(x['codfo']), str(x['cod_art_fo'])))
-
-    current_date = None
-    current_codfo = None
-
-    for r in prepared:
-        if r['dtaaggio'] != current_date:
-            current_date = r['dtaaggio']
-            current_codfo = None
-            # Header DataAgg
-            if y < 30*mm:
-                page_num += 1
-                y = _pdf_new_page(c, "Aggiornamento Prezzi di listino Rossetto", print_date, page_num)
-                y -= 10*mm
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(20*mm, y, f"Data Agg.: {current_date}")
-            y -= 7*mm
-
-        if r['codfo'] != current_codfo:
-            current_codfo = r['codfo']
-            if y < 28*mm:
-                page_num += 1
-                y = _pdf_new_page(c, "Aggiornamento Prezzi di listino Rossetto", print_date, page_num)
-                y -= 10*mm
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(20*mm, y, f"CodFo {current_codfo}  {r.get('descrccom','')}")
-            y -= 6*mm
-            c.setFont("Helvetica", 9)
-
-        lines = [
-            f"CodArticolo: {r['codart']}  |  CodArtFo: {r['cod_art_fo']}  |  Stato: {r['stato']}",
-            f"{r['descrart']}",
-            f"Prezzo CIDAC {r['cidac_prezzo']}  --->  Ros PrAcq {r['ros_pracq']}  IVA {r['ros_iva']}",
-        ]
-        for line in lines:
-            wrapped = simpleSplit(line, "Helvetica", 9, 170*mm)
-            for w in wrapped:
-                if y < 20*mm:
-                    page_num += 1
-                    y = _pdf_new_page(c, "Aggiornamento Prezzi di listino Rossetto", print_date, page_num)
-                    y -= 10*mm
-                c.drawString(20*mm, y, w)
-                y -= 5*mm
-        y -= 4*mm
-
-    c.save()
-    return resp
+    return _pdf_response("r_aggprezziacq", batch)
 
 
 def report_r_aggean_view(request):
     batch = _get_batch_from_request(request)
     base_rows = list(IntermediateAggiornaEan.objects.filter(batch=batch)) if batch else []
 
-    ros_idx = _rossetto_index_by_codart_v2()
+    gold = get_gold_index()
     rows = []
     for r in base_rows:
-        ros = _rossetto_get(ros_idx, r.codart)
+        ros = gold.rossetto_by_codart(r.codart)
         if not ros:
             # Access report uses INNER JOIN with Rossetto: if no match, the row is excluded
             continue
@@ -889,107 +662,24 @@ def report_r_aggean_view(request):
         "rows_count": len(rows),
         "data_agg": data_agg,
         "pdf_url": reverse("importelab:report_r_aggean_pdf") + (f"?batch={batch.id}" if batch else ""),
+        "pdf_job_url": reverse("importelab:report_pdf_job", args=["r_aggean"]) + (f"?batch={batch.id}" if batch else ""),
+        "job": _get_job_from_request(request),
     }
     return render(request, "importelab/report_r_aggean.html", ctx)
 
 def report_r_aggean_pdf_view(request):
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.units import mm
-    from reportlab.lib.utils import simpleSplit
     batch = _get_batch_from_request(request)
-    ros_idx = _rossetto_index_by_codart()
-    base_rows = list(IntermediateAggiornaEan.objects.filter(batch=batch)) if batch else []
-
-    resp = HttpResponse(content_type='application/pdf')
-    fname = f"r_AggEAN_batch{batch.id if batch else 'NA'}.pdf"
-    resp['Content-Disposition'] = f'attachment; filename="{fname}"'
-
-    c = canvas.Canvas(resp, pagesize=A4)
-    print_date = timezone.now().strftime('%d/%m/%Y')
-    page_num = 1
-    _draw_pdf_header(c, "Aggiornamento EAN Rossetto", print_date, page_num)
-    y = 270*mm
-
-    c.setFont("Helvetica", 9)
-    if batch:
-        c.drawString(20*mm, y, f"Batch: {batch.filename} ({batch.uploaded_at:%d/%m/%Y %H:%M})")
-        y -= 8*mm
-
-    # Prepara righe + ordinamento (Access: raggruppa per DataAgg, poi CodFo)
-    prepared = []
-    for r in base_rows:
-        p = ros_idx.get((r.codart or '').strip(), {})
-        codfo = p.get('CCOM')
-        descrccom = p.get('DESCRCCOM', '')
-        descrart = p.get('DESCRART', r.descrizione_articolo)
-        stato = p.get('STATO', '')
-        dtaaggio = p.get('DTAAGGIO', '')
-        prepared.append({
-            'dtaaggio': dtaaggio or '',
-            'codfo': int(codfo) if str(codfo).isdigit() else codfo,
-            'descrccom': descrccom,
-            'codart': r.codart,
-            'cod_art_fo': r.cod_art_fo,
-            'stato': stato,
-            'descrart': descrart,
-            'ean': r.ean,
-        })
-    prepared.sort(key=lambda x: (str(x['dtaaggio']), str(x['codfo']), str(x['cod_art_fo']), str(x['codart'])))
-
-    current_date = None
-    current_codfo = None
-
-    for r in prepared:
-        if r['dtaaggio'] != current_date:
-            current_date = r['dtaaggio']
-            current_codfo = None
-            if y < 30*mm:
-                page_num += 1
-                y = _pdf_new_page(c, "Aggiornamento EAN Rossetto", print_date, page_num)
-                y -= 10*mm
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(20*mm, y, f"Data Agg.: {current_date}")
-            y -= 7*mm
-
-        if r['codfo'] != current_codfo:
-            current_codfo = r['codfo']
-            if y < 28*mm:
-                page_num += 1
-                y = _pdf_new_page(c, "Aggiornamento EAN Rossetto", print_date, page_num)
-                y -= 10*mm
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(20*mm, y, f"CodFo {current_codfo}  {r.get('descrccom','')}")
-            y -= 6*mm
-            c.setFont("Helvetica", 9)
-
-        lines = [
-            f"CodArticolo: {r['codart']}  |  CodArtFo: {r['cod_art_fo']}  |  Stato: {r['stato']}",
-            f"{r['descrart']}",
-            f"AGGIUNGERE  --->  {r['ean']}",
-        ]
-        for line in lines:
-            for w in simpleSplit(line, "Helvetica", 9, 170*mm):
-                if y < 20*mm:
-                    page_num += 1
-                    y = _pdf_new_page(c, "Aggiornamento EAN Rossetto", print_date, page_num)
-                    y -= 10*mm
-                c.drawString(20*mm, y, w)
-                y -= 5*mm
-        y -= 4*mm
-
-    c.save()
-    return resp
+    return _pdf_response("r_aggean", batch)
 
 
 def report_r_agglogistica_view(request):
     batch = _get_batch_from_request(request)
     base_rows = list(IntermediateAggiornamentiVari.objects.filter(batch=batch)) if batch else []
 
-    ros_idx = _rossetto_index_by_codart_v2()
+    gold = get_gold_index()
     rows = []
     for r in base_rows:
-        ros = _rossetto_get(ros_idx, r.codart)
+        ros = gold.rossetto_by_codart(r.codart)
         # Access query uses LEFT JOIN to Rossetto in the report dataset, so keep row even if ros is missing
         codfo_raw = (ros.get("ccom") if ros else "") or ""
         codfo = int(codfo_raw) if str(codfo_raw).isdigit() else (codfo_raw or "")
@@ -1036,106 +726,56 @@ def report_r_agglogistica_view(request):
         "rows_count": len(rows),
         "data_agg": data_agg,
         "pdf_url": reverse("importelab:report_r_agglogistica_pdf") + (f"?batch={batch.id}" if batch else ""),
+        "pdf_job_url": reverse("importelab:report_pdf_job", args=["r_agglogistica"]) + (f"?batch={batch.id}" if batch else ""),
+        "job": _get_job_from_request(request),
     }
     return render(request, "importelab/report_r_agglogistica.html", ctx)
 
 def report_r_agglogistica_pdf_view(request):
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.units import mm
-    from reportlab.lib.utils import simpleSplit
     batch = _get_batch_from_request(request)
-    ros_idx = _rossetto_index_by_codart()
-    base_rows = list(IntermediateAggiornamentiVari.objects.filter(batch=batch)) if batch else []
-
-    resp = HttpResponse(content_type='application/pdf')
-    fname = f"r_AggLogistica_batch{batch.id if batch else 'NA'}.pdf"
-    resp['Content-Disposition'] = f'attachment; filename="{fname}"'
+    return _pdf_response("r_agglogistica", batch)
 
-    c = canvas.Canvas(resp, pagesize=A4)
-    print_date = timezone.now().strftime('%d/%m/%Y')
-    page_num = 1
-    _draw_pdf_header(c, "Aggiornamento Logistica Rossetto", print_date, page_num)
-    y = 270*mm
 
-    c.setFont("Helvetica", 9)
-    if batch:
-        c.drawString(20*mm, y, f"Batch: {batch.filename} ({batch.uploaded_at:%d/%m/%Y %H:%M})")
-        y -= 8*mm
-
-    # Prepara righe + ordinamento (Access: raggruppa per DataAgg, poi CodFo)
-    prepared = []
-    for r in base_rows:
-        p = ros_idx.get((r.codart or '').strip(), {})
-        codfo = p.get('CCOM')
-        descrccom = p.get('DESCRCCOM', '')
-        stato = p.get('STATO', '')
-        dtaaggio = p.get('DTAAGGIO', '')
-        prepared.append({
-            'dtaaggio': dtaaggio or '',
-            'codfo': int(codfo) if str(codfo).isdigit() else codfo,
-            'descrccom': descrccom,
-            'codart': r.codart,
-            'cod_art_fo': r.cod_art_fo,
-            'stato': stato,
-            'descrizione_articolo': r.descrizione_articolo,
-            'cidac_pz_x_crt': r.cidac_pz_x_crt,
-            'agg_pz_x_crt': r.agg_pz_x_crt,
-            'r_pz_x_crt': r.r_pz_x_crt,
-            'cidac_crt_x_str': r.cidac_crt_x_str,
-            'agg_crt_x_str': r.agg_crt_x_str,
-            'r_crt_x_str': r.r_crt_x_str,
-            'cidac_str_x_plt': r.cidac_str_x_plt,
-            'agg_str_x_plt': r.agg_str_x_plt,
-            'r_str_x_plt': r.r_str_x_plt,
-        })
-    prepared.sort(key=lambda x: (str(x['dtaaggio']), str(x['codfo']), str(x['cod_art_fo']), str(x['codart'])))
-
-    current_date = None
-    current_codfo = None
-
-    for r in prepared:
-        if r['dtaaggio'] != current_date:
-            current_date = r['dtaaggio']
-            current_codfo = None
-            if y < 30*mm:
-                page_num += 1
-                y = _pdf_new_page(c, "Aggiornamento Logistica Rossetto", print_date, page_num)
-                y -= 10*mm
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(20*mm, y, f"Data Agg.: {current_date}")
-            y -= 7*mm
-
-        if r['codfo'] != current_codfo:
-            current_codfo = r['codfo']
-            if y < 28*mm:
-                page_num += 1
-                y = _pdf_new_page(c, "Aggiornamento Logistica Rossetto", print_date, page_num)
-                y -= 10*mm
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(20*mm, y, f"CodFo {current_codfo}  {r.get('descrccom','')}")
-            y -= 6*mm
-            c.setFont("Helvetica", 9)
-
-        lines = [
-            f"CodArticolo: {r['codart']}  |  CodArtFo: {r['cod_art_fo']}  |  Stato: {r['stato']}",
-            f"{r['descrizione_articolo']}",
-            f"PezziXCartone: {r['cidac_pz_x_crt']} ---> {r['r_pz_x_crt']}  {r['agg_pz_x_crt'] or ''}",
-            f"CartoniXStrato: {r['cidac_crt_x_str']} ---> {r['r_crt_x_str']}  {r['agg_crt_x_str'] or ''}",
-            f"StratoXPallet: {r['cidac_str_x_plt']} ---> {r['r_str_x_plt']}  {r['agg_str_x_plt'] or ''}",
-        ]
-        for line in lines:
-            for w in simpleSplit(line, "Helvetica", 9, 170*mm):
-                if y < 20*mm:
-                    page_num += 1
-                    y = _pdf_new_page(c, "Aggiornamento Logistica Rossetto", print_date, page_num)
-                    y -= 10*mm
-                c.drawString(20*mm, y, w)
-                y -= 5*mm
-        y -= 4*mm
-
-    c.save()
-    return resp
+@csrf_exempt
+@require_http_methods(["POST"])
+def report_pdf_job_view(request, report: str):
+    """Accoda la generazione del PDF come job e torna al report con il job da seguire."""
+    if report not in PDF_REPORTS:
+        raise Http404("Report sconosciuto")
+    batch = _get_batch_from_request(request)
+    job = submit_job(JOB_REPORT_PDF, {'report': report, 'batch_id': batch.id if batch else None})
+    url = reverse(f'importelab:report_{report}')
+    return redirect(f"{url}?batch={batch.id if batch else ''}&job={job.id}")
+
+
+def job_status_view(request, pk: int):
+    """Stato di un job in JSON (polling dalla UI)."""
+    # Dopo un riavvio i job rimasti attivi risultano falliti già al primo polling
+    start_job_runner()
+    job = get_object_or_404(ImportJob, pk=pk)
+    data = {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'error': job.error,
+        'result': job.result,
+        'finished': job.is_finished,
+        'download_url': None,
+    }
+    if job.status == ImportJob.STATUS_DONE and job.output_path:
+        data['download_url'] = reverse('importelab:job_download', args=[job.id])
+    return JsonResponse(data)
+
+
+def job_download_view(request, pk: int):
+    """Scarica il file prodotto da un job completato (es. PDF)."""
+    job = get_object_or_404(ImportJob, pk=pk, status=ImportJob.STATUS_DONE)
+    if not job.output_path or not os.path.exists(job.output_path):
+        raise Http404("File del job non disponibile")
+    filename = job.result.get('filename') or os.path.basename(job.output_path)
+    return FileResponse(open(job.output_path, 'rb'), as_attachment=True, filename=filename)
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
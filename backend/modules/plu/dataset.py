@@ -0,0 +1,331 @@
+# modules/plu/dataset.py
+"""
+Dataset PLU materializzato.
+
+La query PLU su Gold (CTE codvel/codean su t_t_Ean, t_AnagArticoli,
+t_masterData e t_Reparti) viene eseguita solo al refresh: il risultato è
+salvato nella tabella locale PluArticolo con uno stamp di versione
+(PluDatasetState) e tenuto in memoria per processo. Gli endpoint leggono da
+qui invece di rieseguire la query.
+
+Refresh:
+- schedulato: manage.py refresh_plu_dataset
+- on demand: POST /api/plu/refresh/
+- automatico alla prima lettura se il dataset non è mai stato calcolato
+- in background se il dataset è più vecchio di settings.PLU_DATASET_MAX_AGE
+  secondi (default 900, 0 = mai): la richiesta riceve subito la versione
+  corrente; se Gold non risponde l'errore va nel log e resta la versione
+  precedente (nuovo tentativo dopo settings.PLU_DATASET_RETRY_DELAY secondi,
+  default 60)
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+from functools import cached_property
+from typing import Any, Dict, Iterator, List, Sequence
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .facets import compute_plu_facets
+from .models import PluArticolo, PluDatasetState
+from .search import PluSearchIndex, substring_matches, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Chiavi di ogni riga (= campi di PluArticolo), nell'ordine della risposta API
+PLU_FIELDS = (
+    'ccom', 'descrccom', 'rep', 'reparto_nome', 'codArticolo', 'descrizione',
+    'bancobilancia', 'plu', 'ean', 'ean_formatted', 'plu_int',
+)
+
+FETCH_BATCH_SIZE = 2000
+
+# Ordinamento stabile del dataset: reparto e PLU, poi codice articolo ed EAN come spareggio
+DEFAULT_ORDERING = ('rep', 'plu', 'codArticolo', 'ean')
+
+# Campi salvati come testo ma numerici su Gold: si ordinano per valore (10 dopo 9, come ORDER BY a.REP)
+NUMERIC_SORT_FIELDS = ('rep',)
+
+# Stessa logica dell'Excel dei colleghi, con JOIN a t_Reparti per il nome reparto
+PLU_QUERY = """
+WITH codvel AS (
+    SELECT DISTINCT
+        dbo.t_AnagArticoli.REP,
+        dbo.t_t_Ean.CODART,
+        dbo.t_AnagArticoli.DESCRART,
+        dbo.t_t_Ean.EAN
+    FROM dbo.t_t_Ean
+    INNER JOIN dbo.t_AnagArticoli ON dbo.t_t_Ean.CODART = dbo.t_AnagArticoli.CODART
+    WHERE dbo.t_t_Ean.TIPO = 5 AND dbo.t_AnagArticoli.EANPRINC = 0
+),
+codean AS (
+    SELECT DISTINCT
+        t_t_Ean_1.CODART,
+        t_t_Ean_1.EAN
+    FROM dbo.t_t_Ean AS t_t_Ean_1
+    INNER JOIN dbo.t_AnagArticoli AS t_AnagArticoli_1 ON t_t_Ean_1.CODART = t_AnagArticoli_1.CODART
+    WHERE t_t_Ean_1.TIPO NOT IN (5) AND t_t_Ean_1.PRINC = 1 AND t_AnagArticoli_1.EANPRINC = 1
+)
+SELECT DISTINCT
+    m.CCOM as ccom,
+    m.DESCRCCOM as descrccom,
+    a.REP as rep,
+    r.RepDescrizione as reparto_nome,
+    a.CODART AS codArticolo,
+    a.DESCRART AS descrizione,
+    SUBSTRING(a.EAN, 1, 2) AS bancobilancia,
+    SUBSTRING(a.EAN, 3, 7) AS plu,
+    b.EAN as ean
+FROM codvel AS a
+INNER JOIN codean AS b ON a.CODART = b.CODART
+LEFT OUTER JOIN dbo.t_masterData AS m ON a.CODART = m.CODART
+LEFT OUTER JOIN dbo.t_Reparti AS r ON a.REP = r.NrReparto
+ORDER BY a.REP, SUBSTRING(a.EAN, 3, 7)
+"""
+
+
+def _text(value: Any) -> str | None:
+    return None if value is None else str(value)
+
+
+def _plu_row(row_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Riga della query Gold -> riga del dataset (campi calcolati compresi)."""
+    out = {f: _text(row_dict.get(f)) for f in PLU_FIELDS if f not in ('ean_formatted', 'plu_int')}
+    out['codArticolo'] = out['codArticolo'] or ''
+    out['ean_formatted'] = str(row_dict.get('ean', '')).zfill(13) if row_dict.get('ean') else ''
+
+    # Se manca reparto_nome, usa il codice
+    if not out.get('reparto_nome'):
+        out['reparto_nome'] = f"Reparto {row_dict.get('rep', '')}"
+
+    try:
+        out['plu_int'] = int(row_dict.get('plu', 0)) if row_dict.get('plu') else 0
+    except (ValueError, TypeError):
+        out['plu_int'] = 0
+    return {f: out[f] for f in PLU_FIELDS}
+
+
+def iter_gold_plu_rows(batch_size: int = FETCH_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """Esegue la query PLU su Gold (solo lettura) e restituisce le righe del dataset, a blocchi di fetchmany."""
+    with connections['goldreport'].cursor() as cursor:
+        cursor.execute(PLU_QUERY)
+        columns = [col[0] for col in cursor.description]
+        while True:
+            chunk = cursor.fetchmany(batch_size)
+            if not chunk:
+                break
+            for row in chunk:
+                yield _plu_row(dict(zip(columns, row)))
+
+
+def _sort_value(value: Any) -> Any:
+    return '' if value is None else value
+
+
+def _numeric_sort_value(value: Any) -> tuple:
+    """NULL e vuoti per primi, poi i valori interi in ordine numerico, poi gli altri come testo."""
+    if value is None or value == '':
+        return (0, 0, '')
+    try:
+        return (1, int(value), '')
+    except (TypeError, ValueError):
+        return (2, 0, str(value))
+
+
+def sort_rows(rows: Sequence[Dict[str, Any]], ordering: Sequence[str] = ()) -> List[Dict[str, Any]]:
+    """Ordina le righe per i campi dati ('-campo' = decrescente), con DEFAULT_ORDERING come spareggio."""
+    named = {o.lstrip('-') for o in ordering}
+    keys = list(ordering) + [f for f in DEFAULT_ORDERING if f not in named]
+    out = list(rows)
+    # sort stabili, dall'ultimo criterio al primo
+    for key in reversed(keys):
+        field = key.lstrip('-')
+        value = _numeric_sort_value if field in NUMERIC_SORT_FIELDS else _sort_value
+        out.sort(key=lambda r: value(r[field]), reverse=key.startswith('-'))
+    return out
+
+
+class PluDataset:
+    """Righe del dataset PLU di una versione, in memoria (ordinate per reparto e PLU),
+    con indice per codice articolo."""
+
+    def __init__(self, version: int, refreshed_at, rows: List[Dict[str, Any]]):
+        self.version = version
+        self.refreshed_at = refreshed_at
+        self.rows = sort_rows(rows)
+        # Un articolo può avere più righe (più EAN/fornitori): vale la prima, come nella scansione originale
+        self.by_codart: Dict[str, Dict[str, Any]] = {}
+        for row in self.rows:
+            self.by_codart.setdefault(row['codArticolo'], row)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @cached_property
+    def facets(self) -> Dict[str, Any]:
+        """Reparti, banchi, fornitori e statistiche della versione (vedi facets.py), calcolati una volta."""
+        return compute_plu_facets(self.rows)
+
+    def get(self, cod_articolo: Any) -> Dict[str, Any] | None:
+        """Prima riga dell'articolo `cod_articolo`, o None."""
+        return self.by_codart.get(str(cod_articolo))
+
+    @cached_property
+    def search_index(self) -> PluSearchIndex:
+        """Indice di ricerca della versione (vedi search.py), costruito alla prima ricerca."""
+        return PluSearchIndex(self.rows)
+
+    def filter(self, reparto=None, banco=None, fornitore=None, search=None) -> List[Dict[str, Any]]:
+        """Righe che soddisfano i filtri (stessa semantica dei WHERE della query originale).
+
+        Con `search` la ricerca passa dall'indice (prefissi, sottostringhe,
+        errori di battitura su descrizione, codice articolo, PLU e fornitore) e
+        le righe sono ordinate per rilevanza invece che per reparto e PLU.
+        Una ricerca senza lettere né cifre filtra per sottostringa (nessuna riga
+        se non c'è nulla da cercare), mai l'intero dataset.
+        """
+        if search and tokenize(search):
+            rows = [self.rows[pos] for pos, _ in self.search_index.search(search)]
+        elif search:
+            rows = substring_matches(self.rows, search)
+        else:
+            rows = self.rows
+        if reparto:
+            rows = [r for r in rows if r['rep'] == str(reparto)]
+        if banco:
+            rows = [r for r in rows if r['bancobilancia'] == str(banco)]
+        if fornitore:
+            rows = [r for r in rows if r['ccom'] == str(fornitore)]
+        return list(rows)
+
+
+def _rows_checksum(rows: List[Dict[str, Any]]) -> str:
+    h = hashlib.sha1()
+    for row in rows:
+        h.update(json.dumps([row[f] for f in PLU_FIELDS], ensure_ascii=False).encode('utf-8'))
+        h.update(b'\n')
+    return h.hexdigest()
+
+
+def refresh_plu_dataset() -> Dict[str, Any]:
+    """Riesegue la query su Gold e aggiorna il dataset locale.
+
+    Se il contenuto non è cambiato (stesso checksum) la tabella non viene
+    riscritta e la versione resta la stessa; si aggiorna solo refreshed_at.
+    Ritorna un riepilogo: version, rows, changed, seconds.
+    """
+    started = time.perf_counter()
+    rows = list(iter_gold_plu_rows())
+    checksum = _rows_checksum(rows)
+
+    with transaction.atomic():
+        state = PluDatasetState.objects.select_for_update().filter(pk=1).first()
+        if state is None:
+            state = PluDatasetState(pk=1)
+        changed = state.checksum != checksum or state.rows_count != len(rows)
+        if changed:
+            PluArticolo.objects.all().delete()
+            PluArticolo.objects.bulk_create((PluArticolo(**row) for row in rows), batch_size=FETCH_BATCH_SIZE)
+            state.version += 1
+            state.checksum = checksum
+            state.rows_count = len(rows)
+        state.refreshed_at = timezone.now()
+        state.save()
+
+    invalidate_plu_dataset()
+    return {
+        'version': state.version,
+        'rows': len(rows),
+        'changed': changed,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_current: PluDataset | None = None
+_refresh_failed_at: float | None = None
+
+
+def _is_stale(state: PluDatasetState | None) -> bool:
+    if state is None or state.refreshed_at is None:
+        return True
+    max_age = getattr(settings, 'PLU_DATASET_MAX_AGE', 900)
+    return bool(max_age) and state.refreshed_at < timezone.now() - timedelta(seconds=max_age)
+
+
+def _refresh_in_background() -> None:
+    """Refresh nel thread di background: gli errori vanno nel log e resta la versione corrente."""
+    global _refresh_failed_at
+    close_old_connections()
+    try:
+        refresh_plu_dataset()
+        _refresh_failed_at = None
+    except Exception:
+        _refresh_failed_at = time.monotonic()
+        logger.exception("Refresh del dataset PLU fallito: resta la versione corrente")
+    finally:
+        _refresh_lock.release()
+        # Il thread non passa dal ciclo request/response: chiudiamo noi le connessioni
+        connections.close_all()
+
+
+def _start_background_refresh() -> None:
+    """Avvia il refresh in un thread, se non ce n'è già uno e non è appena fallito."""
+    retry_delay = getattr(settings, 'PLU_DATASET_RETRY_DELAY', 60)
+    if _refresh_failed_at is not None and time.monotonic() - _refresh_failed_at < retry_delay:
+        return
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        threading.Thread(target=_refresh_in_background, name='plu-refresh', daemon=True).start()
+    except Exception:
+        _refresh_lock.release()
+        raise
+
+
+def get_plu_dataset() -> PluDataset:
+    """Dataset PLU della versione corrente (condiviso nel processo).
+
+    Solo la prima costruzione (nessuno stato salvato) avviene nella richiesta;
+    un dataset scaduto è servito così com'è mentre il refresh gira in background.
+    """
+    global _current
+    state = PluDatasetState.objects.filter(pk=1).first()
+    if state is None:
+        with _refresh_lock:
+            state = PluDatasetState.objects.filter(pk=1).first()
+            if state is None:
+                try:
+                    refresh_plu_dataset()
+                except Exception:
+                    logger.exception("Prima costruzione del dataset PLU fallita")
+                    return PluDataset(0, None, [])
+                state = PluDatasetState.objects.get(pk=1)
+    elif _is_stale(state):
+        _start_background_refresh()
+
+    dataset = _current
+    if dataset is not None and dataset.version == state.version:
+        dataset.refreshed_at = state.refreshed_at
+        return dataset
+    with _lock:
+        if _current is None or _current.version != state.version:
+            rows = list(PluArticolo.objects.order_by('id').values(*PLU_FIELDS).iterator(chunk_size=FETCH_BATCH_SIZE))
+            _current = PluDataset(state.version, state.refreshed_at, rows)
+        return _current
+
+
+def invalidate_plu_dataset() -> None:
+    """Scarta il dataset in memoria (gli altri processi vedono la nuova versione dallo stato)."""
+    global _current
+    with _lock:
+        _current = None
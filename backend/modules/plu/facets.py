@@ -0,0 +1,89 @@
+# modules/plu/facets.py
+"""
+Aggregazioni del dataset PLU (reparti, banchi, fornitori, statistiche)
+calcolate in una sola passata sulle righe. Il risultato è tenuto in cache
+insieme al dataset (PluDataset.facets), quindi gli endpoint di facet della
+dashboard condividono un unico calcolo per versione.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable
+
+
+def compute_plu_facets(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ritorna le risposte di /reparti/, /banchi/, /fornitori/ e /stats/ per le righe date."""
+    totale = 0
+    reparti: Dict[Any, Dict[str, Any]] = {}
+    banchi: Dict[str, int] = {}
+    fornitori: Dict[str, str] = {}
+    ccom_set = set()
+    per_reparto: Dict[Any, Dict[str, Any]] = {}
+
+    for item in rows:
+        totale += 1
+        rep = item['rep']
+        banco = item['bancobilancia']
+        ccom = item['ccom']
+
+        # Tutti i reparti, anche senza codice (solo /reparti/)
+        entry = reparti.get(rep)
+        if entry is None:
+            entry = reparti[rep] = {
+                'reparto': rep,
+                'reparto_nome': item['reparto_nome'],
+                'totale_articoli': 0,
+            }
+        entry['totale_articoli'] += 1
+
+        if rep:
+            stats = per_reparto.get(rep)
+            if stats is None:
+                stats = per_reparto[rep] = {
+                    'reparto': rep,
+                    'reparto_nome': item['reparto_nome'],
+                    'totale_articoli': 0,
+                    'totale_plu': set(),
+                    'banchi': set(),
+                }
+            stats['totale_articoli'] += 1
+            if item['plu']:
+                stats['totale_plu'].add(item['plu'])
+            if banco:
+                stats['banchi'].add(banco)
+
+        if banco:
+            banchi[banco] = banchi.get(banco, 0) + 1
+        if ccom:
+            ccom_set.add(ccom)
+            if item['descrccom'] and ccom not in fornitori:
+                fornitori[ccom] = item['descrccom']
+
+    stats_reparti = [
+        {
+            'reparto': r['reparto'],
+            'reparto_nome': r['reparto_nome'],
+            'totale_articoli': r['totale_articoli'],
+            'totale_plu': len(r['totale_plu']),
+            'banchi': sorted(r['banchi']),
+        }
+        for r in per_reparto.values()
+    ]
+
+    return {
+        'reparti': sorted(reparti.values(), key=lambda x: str(x['reparto'] or '')),
+        'banchi': sorted(
+            ({'banco': b, 'totale_articoli': n} for b, n in banchi.items()),
+            key=lambda x: str(x['banco'] or ''),
+        ),
+        'fornitori': sorted(
+            ({'codice': c, 'descrizione': d} for c, d in fornitori.items()),
+            key=lambda x: x['descrizione'] or '',
+        ),
+        'stats': {
+            'totale_articoli': totale,
+            'totale_reparti': len(per_reparto),
+            'totale_banchi': len(banchi),
+            'totale_fornitori': len(ccom_set),
+            'per_reparto': sorted(stats_reparti, key=lambda x: str(x['reparto'] or '')),
+        },
+    }
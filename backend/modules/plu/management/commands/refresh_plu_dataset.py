@@ -0,0 +1,25 @@
+"""
+Management command di refresh del dataset PLU materializzato.
+
+Riesegue la query PLU su Gold e aggiorna la tabella locale letta dalle API
+(vedi modules.plu.dataset). Pensato per essere schedulato.
+
+Uso:
+    python manage.py refresh_plu_dataset
+"""
+
+from django.core.management.base import BaseCommand
+
+from modules.plu.dataset import refresh_plu_dataset
+
+
+class Command(BaseCommand):
+    help = 'Aggiorna il dataset PLU materializzato dalla query su Gold'
+
+    def handle(self, *args, **options):
+        summary = refresh_plu_dataset()
+        if summary['changed']:
+            msg = f"Dataset PLU aggiornato alla versione {summary['version']}: {summary['rows']} righe in {summary['seconds']} s"
+        else:
+            msg = f"Dataset PLU invariato (versione {summary['version']}, {summary['rows']} righe) in {summary['seconds']} s"
+        self.stdout.write(self.style.SUCCESS(msg))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.10 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plu', '0003_reparto_remove_plumodifica_utente_delete_plualert_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PluArticolo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ccom', models.CharField(blank=True, max_length=4000, null=True)),
+                ('descrccom', models.CharField(blank=True, max_length=4000, null=True)),
+                ('rep', models.CharField(blank=True, max_length=13, null=True)),
+                ('reparto_nome', models.CharField(blank=True, default='', max_length=64)),
+                ('codArticolo', models.CharField(db_index=True, max_length=50)),
+                ('descrizione', models.CharField(blank=True, max_length=4000, null=True)),
+                ('bancobilancia', models.CharField(blank=True, max_length=2, null=True)),
+                ('plu', models.CharField(blank=True, max_length=7, null=True)),
+                ('plu_int', models.IntegerField(default=0)),
+                ('ean', models.CharField(blank=True, max_length=20, null=True)),
+                ('ean_formatted', models.CharField(blank=True, default='', max_length=20)),
+            ],
+            options={
+                'verbose_name': 'Articolo PLU (dataset)',
+                'verbose_name_plural': 'Articoli PLU (dataset)',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PluDatasetState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('checksum', models.CharField(blank=True, default='', max_length=40)),
+                ('rows_count', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Stato dataset PLU',
+                'verbose_name_plural': 'Stato dataset PLU',
+            },
+        ),
+    ]
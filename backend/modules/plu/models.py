@@ -107,4 +107,50 @@ class RepartoPlu(models.Model):
         """EAN formattato (13 cifre con padding)"""
         if self.ean:
             return str(self.ean).zfill(13)
-        return ''
\ No newline at end of file
+        return ''
+
+class PluArticolo(models.Model):
+    """
+    Riga del dataset PLU materializzato: copia locale del risultato della
+    query PLU su Gold (vedi modules.plu.dataset), letta da tutti gli endpoint.
+    I nomi dei campi coincidono con le chiavi restituite dall'API.
+    """
+
+    class Meta:
+        verbose_name = 'Articolo PLU (dataset)'
+        verbose_name_plural = 'Articoli PLU (dataset)'
+        ordering = ['id']
+
+    ccom = models.CharField(max_length=4000, null=True, blank=True)
+    descrccom = models.CharField(max_length=4000, null=True, blank=True)
+    rep = models.CharField(max_length=13, null=True, blank=True)
+    reparto_nome = models.CharField(max_length=64, blank=True, default='')
+    codArticolo = models.CharField(max_length=50, db_index=True)
+    descrizione = models.CharField(max_length=4000, null=True, blank=True)
+    bancobilancia = models.CharField(max_length=2, null=True, blank=True)
+    plu = models.CharField(max_length=7, null=True, blank=True)
+    plu_int = models.IntegerField(default=0)
+    ean = models.CharField(max_length=20, null=True, blank=True)
+    ean_formatted = models.CharField(max_length=20, blank=True, default='')
+
+    def __str__(self):
+        return f"PLU {self.plu} - {self.descrizione}"
+
+
+class PluDatasetState(models.Model):
+    """
+    Stato del dataset PLU materializzato (una sola riga).
+    `version` aumenta solo quando il contenuto cambia; `refreshed_at` a ogni refresh.
+    """
+
+    class Meta:
+        verbose_name = 'Stato dataset PLU'
+        verbose_name_plural = 'Stato dataset PLU'
+
+    version = models.PositiveIntegerField(default=0)
+    checksum = models.CharField(max_length=40, blank=True, default='')
+    rows_count = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"PLU v{self.version} ({self.rows_count} righe)"
@@ -0,0 +1,175 @@
+# modules/plu/search.py
+"""
+Indice di ricerca in memoria sul dataset PLU (costruito una volta per versione,
+vedi PluDataset.search_index).
+
+Ogni riga è indicizzata per token (descrizione, codice articolo, PLU,
+fornitore), normalizzati in minuscolo e senza accenti. Un termine di ricerca
+trova i token:
+- uguali
+- che iniziano con il termine (ricerca mentre si digita)
+- che contengono il termine (come il vecchio LIKE '%term%', per i codici)
+- simili con uno o due errori di battitura (trigrammi + distanza di edit)
+Con più termini una riga deve soddisfarli tutti; i risultati sono ordinati per
+punteggio (tipo di match e campo), a parità secondo l'ordine del dataset.
+Una ricerca senza lettere né cifre (es. "-", "/") non ha termini: vale come
+sottostringa sui campi indicizzati (vedi substring_matches).
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple
+
+import re
+import unicodedata
+
+# Campi indicizzati e peso del campo nel punteggio
+SEARCH_FIELDS = (
+    ('codArticolo', 1.0),
+    ('plu', 1.0),
+    ('descrizione', 1.0),
+    ('descrccom', 0.6),
+)
+
+# Punteggio per tipo di match del termine sul token
+SCORE_EXACT = 1.0
+SCORE_PREFIX = 0.8
+SCORE_SUBSTRING = 0.5
+SCORE_FUZZY = 0.4
+
+FUZZY_MIN_LENGTH = 4
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_text(value: Any) -> str:
+    """Minuscolo, senza accenti."""
+    if value is None:
+        return ''
+    text = unicodedata.normalize('NFKD', str(value).lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(value: Any) -> List[str]:
+    return _TOKEN_RE.findall(normalize_text(value))
+
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _grams(token: str) -> Set[str]:
+    """Sottostringhe di 1, 2 e 3 caratteri del token (indice per la ricerca di sottostringhe)."""
+    return {token[i:i + n] for n in (1, 2, 3) for i in range(len(token) - n + 1)}
+
+
+def _max_typos(term: str) -> int:
+    return 1 if len(term) < 8 else 2
+
+
+def _within_distance(a: str, b: str, k: int) -> bool:
+    """Distanza di Levenshtein fra a e b <= k (DP a righe, con uscita anticipata)."""
+    if abs(len(a) - len(b)) > k:
+        return False
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+        if min(cur) > k:
+            return False
+        prev = cur
+    return prev[-1] <= k
+
+
+def substring_matches(rows: Sequence[Dict[str, Any]], query: Any) -> List[Dict[str, Any]]:
+    """Righe in cui un campo indicizzato contiene `query` (minuscolo, senza accenti), come LIKE '%query%'."""
+    needle = normalize_text(query).strip()
+    if not needle:
+        return []
+    return [
+        row for row in rows
+        if any(needle in normalize_text(row.get(field)) for field, _ in SEARCH_FIELDS)
+    ]
+
+
+class PluSearchIndex:
+    """Indice invertito token -> righe, con vocabolario ordinato (prefissi),
+    n-grammi (sottostringhe) e trigrammi (errori di battitura)."""
+
+    def __init__(self, rows: Sequence[Dict[str, Any]]):
+        # token -> {posizione riga: peso del campo migliore}
+        self.postings: Dict[str, Dict[int, float]] = {}
+        for pos, row in enumerate(rows):
+            for field, weight in SEARCH_FIELDS:
+                for token in tokenize(row.get(field)):
+                    hits = self.postings.setdefault(token, {})
+                    if hits.get(pos, 0) < weight:
+                        hits[pos] = weight
+        self.vocabulary: List[str] = sorted(self.postings)
+        self.by_gram: Dict[str, Set[str]] = {}
+        self.by_trigram: Dict[str, Set[str]] = {}
+        for token in self.vocabulary:
+            for gram in _grams(token):
+                self.by_gram.setdefault(gram, set()).add(token)
+            if len(token) >= FUZZY_MIN_LENGTH - 1 and not token.isdigit():
+                for tri in _trigrams(token):
+                    self.by_trigram.setdefault(tri, set()).add(token)
+
+    def _prefixed(self, term: str) -> Iterable[str]:
+        i = bisect_left(self.vocabulary, term)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(term):
+            yield self.vocabulary[i]
+            i += 1
+
+    def _containing(self, term: str) -> Iterable[str]:
+        """Token che contengono il termine: candidati con tutti i suoi trigrammi, poi verifica."""
+        if len(term) <= 3:
+            return self.by_gram.get(term, ())
+        sets = sorted((self.by_gram.get(term[i:i + 3], set()) for i in range(len(term) - 2)), key=len)
+        candidates = sets[0].intersection(*sets[1:])
+        return (t for t in candidates if term in t)
+
+    def _fuzzy(self, term: str) -> Iterable[str]:
+        k = _max_typos(term)
+        candidates: Set[str] = set()
+        for tri in _trigrams(term):
+            candidates |= self.by_trigram.get(tri, set())
+        return (t for t in candidates if _within_distance(term, t, k))
+
+    def expand(self, term: str) -> Dict[str, float]:
+        """Token del vocabolario che corrispondono al termine, con il punteggio del match."""
+        matches: Dict[str, float] = {}
+        for token in self._prefixed(term):
+            matches[token] = SCORE_EXACT if token == term else SCORE_PREFIX
+        for token in self._containing(term):
+            matches.setdefault(token, SCORE_SUBSTRING)
+        if len(term) >= FUZZY_MIN_LENGTH and not term.isdigit():
+            for token in self._fuzzy(term):
+                matches.setdefault(token, SCORE_FUZZY)
+        return matches
+
+    def _term_scores(self, term: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for token, match_score in self.expand(term).items():
+            for pos, weight in self.postings[token].items():
+                score = match_score * weight
+                if scores.get(pos, 0) < score:
+                    scores[pos] = score
+        return scores
+
+    def search(self, query: Any) -> List[Tuple[int, float]]:
+        """Posizioni delle righe che soddisfano tutti i termini, ordinate per punteggio decrescente."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        # Prima i termini più lunghi (più selettivi)
+        terms.sort(key=len, reverse=True)
+        total = self._term_scores(terms[0])
+        for term in terms[1:]:
+            if not total:
+                break
+            scores = self._term_scores(term)
+            total = {pos: s + scores[pos] for pos, s in total.items() if pos in scores}
+        return sorted(total.items(), key=lambda item: (-item[1], item[0]))
@@ -2,116 +2,60 @@
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
-from django.db import connections
-from django.http import HttpResponse
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from django.utils import timezone
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.styles import Font, Alignment, NamedStyle, PatternFill
+
+from modules.util.xlsx_stream import XlsxStreamWriter, xlsx_response
+
+from .dataset import PLU_FIELDS, get_plu_dataset, refresh_plu_dataset, sort_rows
 
 
 def execute_plu_query(filters=None):
     """
-    Esegue la query PLU corretta (stessa logica dell'Excel dei colleghi)
-    Con JOIN a t_Reparti per nome reparto
-    Solo lettura, nessuna modifica al DB
-    """
-    base_query = """
-    WITH codvel AS (
-        SELECT DISTINCT 
-            dbo.t_AnagArticoli.REP, 
-            dbo.t_t_Ean.CODART, 
-            dbo.t_AnagArticoli.DESCRART, 
-            dbo.t_t_Ean.EAN
-        FROM dbo.t_t_Ean 
-        INNER JOIN dbo.t_AnagArticoli ON dbo.t_t_Ean.CODART = dbo.t_AnagArticoli.CODART
-        WHERE dbo.t_t_Ean.TIPO = 5 AND dbo.t_AnagArticoli.EANPRINC = 0
-    ), 
-    codean AS (
-        SELECT DISTINCT 
-            t_t_Ean_1.CODART, 
-            t_t_Ean_1.EAN
-        FROM dbo.t_t_Ean AS t_t_Ean_1 
-        INNER JOIN dbo.t_AnagArticoli AS t_AnagArticoli_1 ON t_t_Ean_1.CODART = t_AnagArticoli_1.CODART
-        WHERE t_t_Ean_1.TIPO NOT IN (5) AND t_t_Ean_1.PRINC = 1 AND t_AnagArticoli_1.EANPRINC = 1
-    )
-    SELECT DISTINCT 
-        m.CCOM as ccom, 
-        m.DESCRCCOM as descrccom, 
-        a.REP as rep,
-        r.RepDescrizione as reparto_nome,
-        a.CODART AS codArticolo, 
-        a.DESCRART AS descrizione, 
-        SUBSTRING(a.EAN, 1, 2) AS bancobilancia, 
-        SUBSTRING(a.EAN, 3, 7) AS plu, 
-        b.EAN as ean
-    FROM codvel AS a 
-    INNER JOIN codean AS b ON a.CODART = b.CODART 
-    LEFT OUTER JOIN dbo.t_masterData AS m ON a.CODART = m.CODART
-    LEFT OUTER JOIN dbo.t_Reparti AS r ON a.REP = r.NrReparto
-    WHERE 1=1
+    Righe PLU (stessa logica dell'Excel dei colleghi, con nome reparto da t_Reparti)
+    lette dal dataset materializzato: nessuna query su Gold per richiesta.
+    Filtri supportati: reparto, banco, fornitore, search
     """
-    
-    params = []
-    
-    if filters:
-        if filters.get('reparto'):
-            base_query += " AND a.REP = %s"
-            params.append(filters['reparto'])
-        
-        if filters.get('banco'):
-            base_query += " AND SUBSTRING(a.EAN, 1, 2) = %s"
-            params.append(filters['banco'])
-        
-        if filters.get('fornitore'):
-            base_query += " AND m.CCOM = %s"
-            params.append(filters['fornitore'])
-        
-        if filters.get('search'):
-            search_term = f"%{filters['search']}%"
-            base_query += """ AND (
-                a.DESCRART LIKE %s 
-                OR a.CODART LIKE %s 
-                OR SUBSTRING(a.EAN, 3, 7) LIKE %s
-                OR m.DESCRCCOM LIKE %s
-            )"""
-            params.extend([search_term, search_term, search_term, search_term])
-    
-    base_query += " ORDER BY a.REP, SUBSTRING(a.EAN, 3, 7)"
-    
-    with connections['goldreport'].cursor() as cursor:
-        cursor.execute(base_query, params)
-        columns = [col[0] for col in cursor.description]
-        results = []
-        
-        for row in cursor.fetchall():
-            row_dict = dict(zip(columns, row))
-            row_dict['ean_formatted'] = str(row_dict.get('ean', '')).zfill(13) if row_dict.get('ean') else ''
-            
-            # Se manca reparto_nome, usa il codice
-            if not row_dict.get('reparto_nome'):
-                row_dict['reparto_nome'] = f"Reparto {row_dict.get('rep', '')}"
-            
-            try:
-                row_dict['plu_int'] = int(row_dict.get('plu', 0)) if row_dict.get('plu') else 0
-            except (ValueError, TypeError):
-                row_dict['plu_int'] = 0
-            
-            results.append(row_dict)
-        
-        return results
+    return get_plu_dataset().filter(**(filters or {}))
+
+
+def _csv_param(request, name):
+    """Valori di un parametro query separati da virgola (es. fields=plu,descrizione)."""
+    value = request.query_params.get(name) or ''
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def _invalid_fields(names):
+    return [n for n in names if n.lstrip('-') not in PLU_FIELDS]
+
+
+def _project(item, fields):
+    """Solo i campi richiesti con fields= (tutti se vuoto)."""
+    if not fields:
+        return item
+    return {f: item[f] for f in fields}
 
 
 class RepartoPlUViewSet(viewsets.ViewSet):
     """
-    ViewSet per gestione PLU articoli - usa query raw
+    ViewSet per gestione PLU articoli - legge dal dataset PLU materializzato
     """
     permission_classes = [AllowAny]
     
     def list(self, request):
         """
         GET /api/plu/
-        Lista articoli con filtri
+        Lista articoli con filtri, ordinata per reparto e PLU
+        (con search=, per rilevanza: prefissi ed errori di battitura ammessi)
+        
+        Parametri opzionali:
+        - ordering=campo1,-campo2  ordinamento (spareggio sempre reparto, PLU)
+        - fields=campo1,campo2     solo i campi indicati
+        - limit=N&offset=M         una pagina di N righe a partire da M
+        Il totale delle righe filtrate è nell'header X-Total-Count; con limit
+        l'header Link contiene gli URL della pagina successiva/precedente.
         """
         filters = {
             'reparto': request.query_params.get('reparto'),
@@ -120,22 +64,54 @@ class RepartoPlUViewSet(viewsets.ViewSet):
             'search': request.query_params.get('search'),
         }
         filters = {k: v for k, v in filters.items() if v}
+        ordering = _csv_param(request, 'ordering')
+        fields = _csv_param(request, 'fields')
+        invalid = _invalid_fields(ordering + fields)
+        if invalid:
+            return Response({'detail': f'Campi non validi: {", ".join(invalid)}'}, status=400)
+        try:
+            limit = int(request.query_params.get('limit') or 0)
+            offset = int(request.query_params.get('offset') or 0)
+        except ValueError:
+            return Response({'detail': 'limit e offset devono essere numeri interi'}, status=400)
+        if limit < 0 or offset < 0:
+            return Response({'detail': 'limit e offset devono essere >= 0'}, status=400)
         
         results = execute_plu_query(filters if filters else None)
-        return Response(results)
+        if ordering:
+            results = sort_rows(results, ordering)
+        total = len(results)
+        page = results[offset:offset + limit] if limit else results[offset:]
+        
+        response = Response([_project(item, fields) for item in page])
+        response['X-Total-Count'] = str(total)
+        if limit:
+            url = request.build_absolute_uri()
+            links = []
+            if offset + limit < total:
+                links.append(f'<{replace_query_param(url, "offset", offset + limit)}>; rel="next"')
+            if offset > 0:
+                prev_offset = max(offset - limit, 0)
+                prev_url = replace_query_param(url, 'offset', prev_offset) if prev_offset else remove_query_param(url, 'offset')
+                links.append(f'<{prev_url}>; rel="prev"')
+            if links:
+                response['Link'] = ', '.join(links)
+        return response
     
     def retrieve(self, request, pk=None):
         """
         GET /api/plu/{codArticolo}/
-        Dettaglio singolo articolo
+        Dettaglio singolo articolo (fields= come per la lista)
         """
-        results = execute_plu_query()
-        
-        for item in results:
-            if str(item.get('codArticolo')) == str(pk):
-                return Response(item)
-        
-        return Response({'detail': 'Articolo non trovato'}, status=404)
+        fields = _csv_param(request, 'fields')
+        invalid = _invalid_fields(fields)
+        if invalid:
+            return Response({'detail': f'Campi non validi: {", ".join(invalid)}'}, status=400)
+        
+        item = get_plu_dataset().get(pk)
+        if item is None:
+            return Response({'detail': 'Articolo non trovato'}, status=404)
+        return Response(_project(item, fields))
     
     @action(detail=False, methods=['get'])
     def reparti(self, request):
@@ -143,20 +119,7 @@ class RepartoPlUViewSet(viewsets.ViewSet):
         GET /api/plu/reparti/
         Lista reparti con conteggio e nome
         """
-        results = execute_plu_query()
-        
-        reparti_count = {}
-        for item in results:
-            rep = item.get('rep')
-            if rep not in reparti_count:
-                reparti_count[rep] = {
-                    'reparto': rep,
-                    'reparto_nome': item.get('reparto_nome'),
-                    'totale_articoli': 0
-                }
-            reparti_count[rep]['totale_articoli'] += 1
-        
-        return Response(sorted(reparti_count.values(), key=lambda x: str(x['reparto'] or '')))
+        return Response(get_plu_dataset().facets['reparti'])
     
     @action(detail=False, methods=['get'])
     def banchi(self, request):
@@ -164,20 +127,7 @@ class RepartoPlUViewSet(viewsets.ViewSet):
         GET /api/plu/banchi/
         Lista banchi con conteggio
         """
-        results = execute_plu_query()
-        
-        banchi_count = {}
-        for item in results:
-            banco = item.get('bancobilancia')
-            if banco and banco not in banchi_count:
-                banchi_count[banco] = {
-                    'banco': banco,
-                    'totale_articoli': 0
-                }
-            if banco:
-                banchi_count[banco]['totale_articoli'] += 1
-        
-        return Response(sorted(banchi_count.values(), key=lambda x: str(x['banco'] or '')))
+        return Response(get_plu_dataset().facets['banchi'])
     
     @action(detail=False, methods=['get'])
     def fornitori(self, request):
@@ -185,19 +135,7 @@ class RepartoPlUViewSet(viewsets.ViewSet):
         GET /api/plu/fornitori/
         Lista fornitori
         """
-        results = execute_plu_query()
-        
-        fornitori = {}
-        for item in results:
-            ccom = item.get('ccom')
-            descrccom = item.get('descrccom')
-            if ccom and descrccom and ccom not in fornitori:
-                fornitori[ccom] = {
-                    'codice': ccom,
-                    'descrizione': descrccom
-                }
-        
-        return Response(sorted(fornitori.values(), key=lambda x: x['descrizione'] or ''))
+        return Response(get_plu_dataset().facets['fornitori'])
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
@@ -205,56 +143,16 @@ class RepartoPlUViewSet(viewsets.ViewSet):
         GET /api/plu/stats/
         Statistiche generali
         """
-        results = execute_plu_query()
-        
-        reparti = set()
-        banchi = set()
-        fornitori = set()
-        per_reparto = {}
-        
-        for item in results:
-            rep = item.get('rep')
-            banco = item.get('bancobilancia')
-            ccom = item.get('ccom')
-            
-            if rep:
-                reparti.add(rep)
-                if rep not in per_reparto:
-                    per_reparto[rep] = {
-                        'reparto': rep,
-                        'reparto_nome': item.get('reparto_nome'),
-                        'totale_articoli': 0,
-                        'totale_plu': set(),
-                        'banchi': set()
-                    }
-                per_reparto[rep]['totale_articoli'] += 1
-                if item.get('plu'):
-                    per_reparto[rep]['totale_plu'].add(item.get('plu'))
-                if banco:
-                    per_reparto[rep]['banchi'].add(banco)
-            
-            if banco:
-                banchi.add(banco)
-            if ccom:
-                fornitori.add(ccom)
-        
-        stats_reparti = []
-        for rep_data in per_reparto.values():
-            stats_reparti.append({
-                'reparto': rep_data['reparto'],
-                'reparto_nome': rep_data['reparto_nome'],
-                'totale_articoli': rep_data['totale_articoli'],
-                'totale_plu': len(rep_data['totale_plu']),
-                'banchi': list(rep_data['banchi'])
-            })
-        
-        return Response({
-            'totale_articoli': len(results),
-            'totale_reparti': len(reparti),
-            'totale_banchi': len(banchi),
-            'totale_fornitori': len(fornitori),
-            'per_reparto': sorted(stats_reparti, key=lambda x: str(x['reparto'] or ''))
-        })
+        return Response(get_plu_dataset().facets['stats'])
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def refresh(self, request):
+        """
+        POST /api/plu/refresh/
+        Riesegue la query su Gold e aggiorna il dataset PLU materializzato
+        (solo utenti autenticati, come gli altri endpoint di scrittura)
+        """
+        return Response(refresh_plu_dataset())
     
     @action(detail=False, methods=['get'])
     def export_excel(self, request):
@@ -271,52 +169,41 @@ class RepartoPlUViewSet(viewsets.ViewSet):
         
         results = execute_plu_query(filters if filters else None)
         
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "PLU Articoli"
-        
-        header_fill = PatternFill(start_color="2E5090", end_color="2E5090", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=11)
+        header_style = NamedStyle(
+            name='plu_header',
+            font=Font(bold=True, color="FFFFFF", size=11),
+            fill=PatternFill(start_color="2E5090", end_color="2E5090", fill_type="solid"),
+            alignment=Alignment(horizontal='center'),
+        )
+        # Barcode - testo per font barcode
+        barcode_style = NamedStyle(name='plu_barcode', font=Font(name='Libre Barcode EAN13 Text', size=48))
         
         headers = [
             'PLU', 'Cod.Articolo', 'Descrizione', 'EAN', 'Barcode',
             'Reparto', 'Banco', 'Cod.Forn', 'Fornitore'
         ]
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-        
-        for row_num, item in enumerate(results, 2):
-            ws.cell(row=row_num, column=1, value=item.get('plu'))
-            ws.cell(row=row_num, column=2, value=item.get('codArticolo'))
-            ws.cell(row=row_num, column=3, value=item.get('descrizione'))
-            ws.cell(row=row_num, column=4, value=item.get('ean_formatted'))
-            # Barcode - testo per font barcode
-            barcode_cell = ws.cell(row=row_num, column=5, value=item.get('ean_formatted'))
-            barcode_cell.font = Font(name='Libre Barcode EAN13 Text', size=48)
-            ws.cell(row=row_num, column=6, value=item.get('reparto_nome'))
-            ws.cell(row=row_num, column=7, value=item.get('bancobilancia'))
-            ws.cell(row=row_num, column=8, value=item.get('ccom'))
-            ws.cell(row=row_num, column=9, value=item.get('descrccom'))
-        
-        # Larghezza colonne
-        column_widths = [10, 15, 45, 18, 30, 20, 8, 12, 35]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = width
-        
-        # Altezza righe per barcode
-        for row in range(2, len(results) + 2):
-            ws.row_dimensions[row].height = 35
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        row_styles = [None, None, None, None, 'plu_barcode', None, None, None, None]
+        
+        # Righe alte 35 per il barcode (default del foglio), header ad altezza normale
+        xlsx = XlsxStreamWriter(
+            "PLU Articoli",
+            widths=[10, 15, 45, 18, 30, 20, 8, 12, 35],
+            styles=[header_style, barcode_style],
+            default_row_height=35,
         )
-        filename = f'plu_articoli_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+        xlsx.append(headers, styles='plu_header', height=15)
+        for item in results:
+            xlsx.append([
+                item.get('plu'),
+                item.get('codArticolo'),
+                item.get('descrizione'),
+                item.get('ean_formatted'),
+                item.get('ean_formatted'),
+                item.get('reparto_nome'),
+                item.get('bancobilancia'),
+                item.get('ccom'),
+                item.get('descrccom'),
+            ], styles=row_styles)
         
-        wb.save(response)
-        return response
\ No newline at end of file
+        filename = f'plu_articoli_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        return xlsx_response(xlsx.save(), filename)
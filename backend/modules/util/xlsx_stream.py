@@ -0,0 +1,215 @@
+"""
+Export XLSX in streaming condiviso fra le app (PLU, asso_articoli).
+
+Usa i workbook write-only di openpyxl: ogni riga è scritta subito sul file
+temporaneo del foglio, senza costruire in memoria il grafo delle celle.
+Stili (NamedStyle), larghezze colonne, altezza righe di default e freeze
+panes sono definiti una volta nel costruttore, prima dei dati. Il file finale
+è un file temporaneo restituito con FileResponse, che lo invia a blocchi.
+Le immagini aggiunte come bytes (add_image_data) con lo stesso contenuto sono
+salvate una volta sola in xl/media e referenziate da ogni ancoraggio: è
+l'unico punto che usa un interno di openpyxl (ExcelWriter._write_images), solo
+con le versioni verificate (SHARED_MEDIA_VERSIONS); con le altre ogni immagine
+ha il suo file media e il salvataggio è Workbook.save.
+"""
+from __future__ import annotations
+
+from typing import Any, Iterable, Optional, Sequence
+
+import datetime
+import tempfile
+from copy import copy
+from io import BytesIO
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import openpyxl
+from django.http import FileResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.drawing.image import Image
+from openpyxl.styles import Font, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.writer.excel import ExcelWriter
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Versioni di openpyxl con cui _SharedMediaExcelWriter è verificato
+SHARED_MEDIA_VERSIONS = ('3.1.',)
+
+
+class _SharedImage(Image):
+    """Ancoraggio che riusa il file media di un'altra immagine con gli stessi bytes."""
+
+    def __init__(self, img, media: Image):
+        super().__init__(img)
+        self.media = media
+
+    @property
+    def path(self):
+        return self.media.path
+
+
+class _SharedMediaExcelWriter(ExcelWriter):
+    """ExcelWriter che scrive una sola volta i file media condivisi da più immagini."""
+
+    @staticmethod
+    def supported() -> bool:
+        return openpyxl.__version__.startswith(SHARED_MEDIA_VERSIONS) and hasattr(ExcelWriter, '_write_images')
+
+    def _write_images(self):
+        written = set()
+        for img in self._images:
+            if img.path not in written:
+                written.add(img.path)
+                self._archive.writestr(img.path[1:], img._data())
+
+    @classmethod
+    def save_workbook(cls, workbook: Workbook, fp) -> None:
+        """Come openpyxl.writer.excel.save_workbook, con questo writer."""
+        archive = ZipFile(fp, 'w', ZIP_DEFLATED, allowZip64=True)
+        workbook.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+        cls(workbook, archive).save()
+
+
+def _copy_named_style(style: NamedStyle) -> NamedStyle:
+    """Copia indipendente di un NamedStyle (copy() perde il number_format)."""
+    return NamedStyle(
+        name=style.name,
+        font=copy(style.font),
+        fill=copy(style.fill),
+        border=copy(style.border),
+        alignment=copy(style.alignment),
+        number_format=style.number_format,
+        protection=copy(style.protection),
+    )
+
+
+class XlsxStreamWriter:
+    """Foglio singolo scritto riga per riga (openpyxl write-only).
+
+    Args:
+        title: nome del foglio
+        widths: larghezza di ogni colonna (None = default)
+        styles: NamedStyle usati dalle celle, registrati una volta nel workbook
+        freeze: cella di freeze panes (es. 'A2')
+        default_row_height: altezza di tutte le righe senza altezza esplicita
+    """
+
+    def __init__(
+        self,
+        title: str,
+        widths: Sequence[Optional[float]] = (),
+        styles: Iterable[NamedStyle] = (),
+        freeze: Optional[str] = None,
+        default_row_height: Optional[float] = None,
+    ):
+        self.wb = Workbook(write_only=True)
+        for style in styles:
+            # Copia: il NamedStyle del chiamante non viene modificato né legato a questo workbook
+            style = _copy_named_style(style)
+            # Stile senza font: quello di default del workbook, come le celle normali
+            if style.font == Font():
+                style.font = copy(DEFAULT_FONT)
+            self.wb.add_named_style(style)
+        self.ws = self.wb.create_sheet(title)
+        self.ncols = len(widths)
+        self.row = 0
+        # bytes dell'immagine -> primo Image con quel contenuto
+        self._media = {}
+        self._shared_media = _SharedMediaExcelWriter.supported()
+        self._has_shared = False
+
+        # Tutto ciò che sta prima di sheetData va impostato prima della prima riga
+        for i, width in enumerate(widths, 1):
+            if width:
+                self.ws.column_dimensions[get_column_letter(i)].width = width
+        if freeze:
+            self.ws.freeze_panes = freeze
+        if default_row_height:
+            self.ws.sheet_format.defaultRowHeight = default_row_height
+            self.ws.sheet_format.customHeight = True
+
+    def append(
+        self,
+        values: Sequence[Any],
+        styles: Sequence[Optional[str]] | str | None = None,
+        number_formats: Sequence[Optional[str]] | None = None,
+        height: Optional[float] = None,
+    ) -> int:
+        """Scrive una riga e ne ritorna il numero (1-based).
+
+        `styles` è il nome di un NamedStyle per tutte le celle o una sequenza
+        per colonna (None = cella senza stile); `number_formats` idem per colonna.
+        """
+        self.row += 1
+        if isinstance(styles, str):
+            styles = [styles] * len(values)
+
+        if styles is None and number_formats is None:
+            cells = list(values)
+        else:
+            cells = []
+            for i, value in enumerate(values):
+                style = styles[i] if styles else None
+                number_format = number_formats[i] if number_formats else None
+                if style is None and number_format is None:
+                    cells.append(value)
+                    continue
+                cell = WriteOnlyCell(self.ws, value=value)
+                if style:
+                    cell.style = style
+                if number_format:
+                    cell.number_format = number_format
+                cells.append(cell)
+
+        if height:
+            self.ws.row_dimensions[self.row].height = height
+        self.ws.append(cells)
+        # La riga è già scritta: la dimensione non serve più
+        self.ws.row_dimensions.pop(self.row, None)
+        return self.row
+
+    def append_merged(self, value: Any, style: Optional[str] = None, height: Optional[float] = None,
+                      ncols: Optional[int] = None) -> int:
+        """Riga con un solo valore su celle unite (intestazioni di gruppo, titoli)."""
+        ncols = ncols or self.ncols
+        row = self.append([value], styles=[style], height=height)
+        if ncols > 1:
+            self.ws.merged_cells.add(CellRange(min_col=1, min_row=row, max_col=ncols, max_row=row))
+        return row
+
+    def add_image(self, image, column: int, row: Optional[int] = None) -> None:
+        """Ancora un'immagine alla cella (colonna 1-based) della riga indicata o dell'ultima scritta."""
+        self.ws.add_image(image, f"{get_column_letter(column)}{row or self.row}")
+
+    def add_image_data(self, data: bytes, column: int, width: Optional[float] = None,
+                       height: Optional[float] = None, row: Optional[int] = None) -> None:
+        """Come add_image, da bytes (PNG/JPEG/GIF): contenuti uguali condividono un solo file media."""
+        media = self._media.get(data) if self._shared_media else None
+        if media is None:
+            image = self._media[data] = Image(BytesIO(data))
+        else:
+            image = _SharedImage(BytesIO(data), media)
+            self._has_shared = True
+        if width:
+            image.width = width
+        if height:
+            image.height = height
+        self.add_image(image, column, row)
+
+    def save(self):
+        """Chiude il workbook e ritorna il file temporaneo (posizionato all'inizio)."""
+        fp = tempfile.TemporaryFile(suffix='.xlsx')
+        if self._has_shared:
+            _SharedMediaExcelWriter.save_workbook(self.wb, fp)
+        else:
+            self.wb.save(fp)
+        fp.seek(0)
+        return fp
+
+
+def xlsx_response(fp, filename: str) -> FileResponse:
+    """Risposta di download in streaming per un file XLSX (il file viene chiuso a fine invio)."""
+    return FileResponse(fp, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
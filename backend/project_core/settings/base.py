@@ -49,6 +49,8 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
     'x-auth-user',  # ← aggiungi questo
 ]
+# Header di paginazione leggibili dal frontend (es. API PLU)
+CORS_EXPOSE_HEADERS = ['x-total-count', 'link']
 # HOSTS consentiti (Solo per sviluppo/default, da sovrascrivere in prod.py)
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
 
@@ -127,6 +129,12 @@ SIMPLE_JWT = {
 
 # Logging (Nessun cambiamento)
 LOG_DIR = PROJECT_ROOT / 'logs'
+
+# Dati di runtime (output dei job, cache): fuori dal codice dei moduli, come logs,
+# esclusi da git e dai robocopy /MIR del deploy (deploy/*.ps1)
+RUNTIME_DIR = PROJECT_ROOT / 'runtime'
+IMPORTELAB_JOBS_DIR = str(RUNTIME_DIR / 'importelab_jobs')
+BARCODE_CACHE_DIR = str(RUNTIME_DIR / 'barcode_cache')
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
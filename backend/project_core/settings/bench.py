@@ -0,0 +1,34 @@
+# project_core/settings/bench.py
+# Impostazioni per il benchmark di importelab (manage.py bench_importelab):
+# DB locali SQLite al posto di SQL Server, file di lavoro in una cartella temporanea.
+
+from .base import *
+import os
+import tempfile
+
+BENCH_DIR = os.environ.get('BENCH_DIR', os.path.join(tempfile.gettempdir(), 'importelab_bench'))
+os.makedirs(BENCH_DIR, exist_ok=True)
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCH_DIR, 'default.sqlite3'),
+    },
+    # Non letto: il benchmark genera le righe Gold in memoria
+    'goldreport': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCH_DIR, 'goldreport.sqlite3'),
+    },
+}
+
+IMPORT_FILES_DIR = os.path.join(BENCH_DIR, 'import_files')
+IMPORTELAB_JOBS_DIR = os.path.join(BENCH_DIR, 'jobs')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+}
@@ -48,7 +48,7 @@ else {
 # ============================================
 Write-Host "[2/6] Deploy backend Django..." -ForegroundColor Yellow
 
-robocopy $BackendSource $DestDjango /MIR /XD venv __pycache__ .git logs staticfiles /XF *.pyc *.log /NFL /NDL /NJH /NJS /NP
+robocopy $BackendSource $DestDjango /MIR /XD venv __pycache__ .git logs runtime staticfiles /XF *.pyc *.log /NFL /NDL /NJH /NJS /NP
 
 if ($LASTEXITCODE -le 7) {
     Write-Host "   [OK] File backend copiati" -ForegroundColor Green
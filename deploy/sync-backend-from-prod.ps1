@@ -9,7 +9,7 @@ Copy-Item "C:\portale\backend" "C:\portale\$backupName" -Recurse -Force
 Write-Host "Backup: C:\portale\$backupName" -ForegroundColor Green
 
 Write-Host "`nSyncing files da PortaleIntranet..." -ForegroundColor Yellow
-robocopy "C:\inetpub\PortaleIntranet\django\modules" "C:\portale\backend\modules" /E /MIR /XD __pycache__ /XF *.pyc *.pyo /NFL /NDL /NJH /NJS
+robocopy "C:\inetpub\PortaleIntranet\django\modules" "C:\portale\backend\modules" /E /MIR /XD __pycache__ _barcode_cache _jobs /XF *.pyc *.pyo /NFL /NDL /NJH /NJS
 robocopy "C:\inetpub\PortaleIntranet\django\project_core" "C:\portale\backend\project_core" /E /MIR /XD __pycache__ /XF *.pyc *.pyo /NFL /NDL /NJH /NJS
 Copy-Item "C:\inetpub\PortaleIntranet\django\*.py" "C:\portale\backend\" -Force -ErrorAction SilentlyContinue
 Copy-Item "C:\inetpub\PortaleIntranet\django\*.txt" "C:\portale\backend\" -Force -ErrorAction SilentlyContinue
@@ -15,7 +15,7 @@ Stop-Service Djangoportaltest -ErrorAction SilentlyContinue
 
 # 3. Sync da PortaleIntranet (prod) a PortaleTest
 Write-Host "`nSyncing files da PortaleIntranet a PortaleTest..." -ForegroundColor Yellow
-robocopy "C:\inetpub\PortaleIntranet\django\modules" "C:\inetpub\PortaleTest\django\modules" /E /MIR /XD __pycache__ /XF *.pyc *.pyo /NFL /NDL /NJH /NJS
+robocopy "C:\inetpub\PortaleIntranet\django\modules" "C:\inetpub\PortaleTest\django\modules" /E /MIR /XD __pycache__ _barcode_cache _jobs /XF *.pyc *.pyo /NFL /NDL /NJH /NJS
 robocopy "C:\inetpub\PortaleIntranet\django\project_core" "C:\inetpub\PortaleTest\django\project_core" /E /MIR /XD __pycache__ /XF *.pyc *.pyo /NFL /NDL /NJH /NJS
 Copy-Item "C:\inetpub\PortaleIntranet\django\*.py" "C:\inetpub\PortaleTest\django\" -Force -ErrorAction SilentlyContinue
 Copy-Item "C:\inetpub\PortaleIntranet\django\*.txt" "C:\inetpub\PortaleTest\django\" -Force -ErrorAction SilentlyContinue